@@ -0,0 +1,12 @@
+"""
+Benchmarks
+
+A reproducible performance harness for the finance hot paths. ``data``
+generates synthetic users and their history in bulk. ``replay`` stands in for
+Plaid during sync ingest. ``suite`` times the benchmarks and compares a run
+against a baseline. Run it all with ``manage.py run_benchmarks``.
+"""
+from .data import SyntheticDataGenerator
+from .replay import ReplayPlaidService, record_sync_pages, synthetic_sync_pages
+from .suite import BENCHMARKS, BenchmarkSuite, compare_results, measure
+
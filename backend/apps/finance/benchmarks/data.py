@@ -0,0 +1,260 @@
+"""
+Synthetic Data
+
+``SyntheticDataGenerator`` fills the database with realistic-looking finance
+data for benchmarks. Each user gets:
+
+- institutions, each with a checking, a credit card and a brokerage account
+- years of transactions: payroll, rent, subscriptions on fixed days (so that
+  recurring detection finds them) and random everyday spending
+- a spending category tree with budgets and monthly totals
+- holdings in a shared pool of securities
+- weekly net worth snapshots
+
+Everything is written with ``bulk_create`` in batches. Output is deterministic
+for a given seed, apart from primary keys and timestamps.
+"""
+import logging
+import random
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import (
+    Account, Holding, Institution, MonthlySpending, NetWorthSnapshot, Security, SpendingCategory, Transaction,
+)
+
+logger = logging.getLogger(__name__)
+
+# Merchants for everyday spending: (name, Plaid primary category, low, high)
+MERCHANTS = [
+    ('Blue Bottle Coffee', 'FOOD_AND_DRINK', 4, 12),
+    ('Chipotle', 'FOOD_AND_DRINK', 9, 25),
+    ('Whole Foods', 'FOOD_AND_DRINK', 25, 180),
+    ('Trader Joes', 'FOOD_AND_DRINK', 20, 120),
+    ('Shell', 'TRANSPORTATION', 30, 75),
+    ('Uber', 'TRANSPORTATION', 8, 45),
+    ('Amazon', 'GENERAL_MERCHANDISE', 10, 250),
+    ('Target', 'GENERAL_MERCHANDISE', 15, 160),
+    ('Home Depot', 'HOME_IMPROVEMENT', 20, 300),
+    ('CVS Pharmacy', 'MEDICAL', 5, 60),
+    ('AMC Theatres', 'ENTERTAINMENT', 12, 40),
+    ('Delta Air Lines', 'TRAVEL', 150, 650),
+]
+# Fixed monthly bills: (name, category, amount, day of month)
+SUBSCRIPTIONS = [
+    ('Netflix', 'ENTERTAINMENT', Decimal('15.49'), 3),
+    ('Spotify', 'ENTERTAINMENT', Decimal('10.99'), 8),
+    ('Comcast', 'RENT_AND_UTILITIES', Decimal('89.99'), 12),
+    ('PG&E', 'RENT_AND_UTILITIES', Decimal('120.00'), 18),
+    ('Planet Fitness', 'PERSONAL_CARE', Decimal('24.99'), 21),
+]
+RENT = ('Greystar Apartments', 'RENT_AND_UTILITIES', Decimal('2450.00'), 1)
+PAYROLL = ('Acme Corp Payroll', 'INCOME', Decimal('-3850.00'))
+
+# Parent category, its Plaid categories and budget, then subcategories
+CATEGORY_TREE = [
+    ('Food', ['FOOD_AND_DRINK'], Decimal('900'), ['Groceries', 'Restaurants', 'Coffee']),
+    ('Transportation', ['TRANSPORTATION'], Decimal('300'), ['Fuel', 'Rideshare']),
+    ('Shopping', ['GENERAL_MERCHANDISE', 'HOME_IMPROVEMENT'], Decimal('500'), ['Online', 'Home']),
+    ('Bills', ['RENT_AND_UTILITIES'], Decimal('2800'), ['Rent', 'Utilities', 'Internet']),
+    ('Fun', ['ENTERTAINMENT', 'TRAVEL'], Decimal('400'), ['Streaming', 'Movies', 'Travel']),
+    ('Health', ['MEDICAL', 'PERSONAL_CARE'], Decimal('150'), ['Pharmacy', 'Gym']),
+]
+
+SECURITY_POOL = 25
+HOLDINGS_PER_ACCOUNT = 6
+BATCH_SIZE = 2000
+
+
+class SyntheticDataGenerator:
+    """Creates benchmark users and their data in bulk; see the module docstring"""
+
+    def __init__(self, users: int = 10, years: int = 2, institutions_per_user: int = 2,
+                 purchases_per_month: int = 60, seed: int = 0, prefix: str = 'bench'):
+        self.users = users
+        self.years = years
+        self.institutions_per_user = institutions_per_user
+        self.purchases_per_month = purchases_per_month
+        self.prefix = prefix
+        self.random = random.Random(seed)
+        self.today = timezone.now().date()
+        self.start = self.today - relativedelta(years=years)
+
+    def generate(self) -> Dict[str, int]:
+        """Create everything; returns row counts by model"""
+        User.objects.bulk_create([
+            User(username=f"{self.prefix}-user-{index}", email=f"{self.prefix}-user-{index}@example.com",
+                 password='!')
+            for index in range(self.users)
+        ], ignore_conflicts=True)
+        users = list(User.objects.filter(username__startswith=f"{self.prefix}-user-").order_by('id'))
+
+        counts = {'users': len(users)}
+        securities = self._securities()
+        counts['securities'] = len(securities)
+
+        institutions, accounts = [], []
+        for user in users:
+            for index in range(self.institutions_per_user):
+                institution = Institution(
+                    user=user, name=f"Bank {index}", item_id=f"{self.prefix}-item-{uuid.uuid4().hex}",
+                    access_token='benchmark', plaid_institution_id=f"ins_{index}",
+                    last_successful_update=timezone.now(),
+                )
+                institutions.append(institution)
+                for account_type, subtype, name in (('depository', 'checking', 'Checking'),
+                                                    ('credit', 'credit card', 'Credit Card'),
+                                                    ('investment', 'brokerage', 'Brokerage')):
+                    accounts.append(Account(
+                        institution=institution, plaid_account_id=f"{self.prefix}-acct-{uuid.uuid4().hex}",
+                        name=f"{name} {index}", type=account_type, subtype=subtype, mask=f"{index:04d}",
+                    ))
+        Institution.objects.bulk_create(institutions, batch_size=BATCH_SIZE)
+        Account.objects.bulk_create(accounts, batch_size=BATCH_SIZE)
+        counts['institutions'] = len(institutions)
+        counts['accounts'] = len(accounts)
+
+        counts['transactions'] = self._transactions(accounts)
+        counts['holdings'] = self._holdings([a for a in accounts if a.type == 'investment'], securities)
+        counts['categories'], counts['monthly_spending'] = self._categories(users)
+        counts['snapshots'] = self._snapshots(users)
+        self._balances(accounts)
+
+        logger.info(f"Generated benchmark data: {counts}")
+        return counts
+
+    def _securities(self) -> List[Security]:
+        Security.objects.bulk_create([
+            Security(
+                plaid_security_id=f"{self.prefix}-sec-{index}", name=f"Benchmark Fund {index}",
+                ticker_symbol=f"BF{index:02d}", type='etf' if index % 3 else 'equity',
+                close_price=Decimal(self.random.randint(20, 500)), close_price_as_of=self.today,
+            )
+            for index in range(SECURITY_POOL)
+        ], ignore_conflicts=True)
+        return list(Security.objects.filter(plaid_security_id__startswith=f"{self.prefix}-sec-"))
+
+    def _transaction(self, account, day: date, name: str, category: str, amount: Decimal) -> Transaction:
+        return Transaction(
+            account=account, plaid_transaction_id=f"{self.prefix}-txn-{uuid.uuid4().hex}",
+            amount=amount, name=name.upper(), merchant_name=name, primary_category=category,
+            category=[category], date=day, payment_channel='in store', transaction_type='place',
+        )
+
+    def _account_transactions(self, account):
+        days = (self.today - self.start).days
+        month = self.start.replace(day=1)
+        while month <= self.today:
+            if account.type == 'depository':
+                for day in (1, 15):
+                    payday = month.replace(day=day)
+                    if self.start <= payday <= self.today:
+                        yield self._transaction(account, payday, *PAYROLL)
+                due = month.replace(day=RENT[3])
+                if self.start <= due <= self.today:
+                    yield self._transaction(account, due, *RENT[:3])
+            else:
+                for name, category, amount, day in SUBSCRIPTIONS:
+                    billed = month.replace(day=day)
+                    if self.start <= billed <= self.today:
+                        yield self._transaction(account, billed, name, category, amount)
+            month += relativedelta(months=1)
+
+        if account.type == 'credit':
+            for _ in range(self.purchases_per_month * days // 30):
+                name, category, low, high = self.random.choice(MERCHANTS)
+                amount = Decimal(self.random.randint(low * 100, high * 100)) / 100
+                yield self._transaction(
+                    account, self.start + timedelta(days=self.random.randint(0, days)), name, category, amount,
+                )
+
+    def _transactions(self, accounts) -> int:
+        created = 0
+        batch = []
+        for account in accounts:
+            if account.type == 'investment':
+                continue
+            for transaction in self._account_transactions(account):
+                batch.append(transaction)
+                if len(batch) >= BATCH_SIZE:
+                    created += len(Transaction.objects.bulk_create(batch))
+                    batch = []
+        if batch:
+            created += len(Transaction.objects.bulk_create(batch))
+        return created
+
+    def _holdings(self, accounts, securities) -> int:
+        holdings = []
+        for account in accounts:
+            for security in self.random.sample(securities, min(HOLDINGS_PER_ACCOUNT, len(securities))):
+                quantity = Decimal(self.random.randint(1, 400))
+                price = security.close_price or Decimal('100')
+                holdings.append(Holding(
+                    account=account, security=security, quantity=quantity, institution_price=price,
+                    institution_price_as_of=self.today, institution_value=quantity * price,
+                    cost_basis=(quantity * price * Decimal(self.random.uniform(0.6, 1.2))).quantize(Decimal('0.01')),
+                ))
+        return len(Holding.objects.bulk_create(holdings, batch_size=BATCH_SIZE))
+
+    def _categories(self, users):
+        categories, monthly = [], []
+        months = [self.today.replace(day=1) - relativedelta(months=offset) for offset in range(12)]
+        for user in users:
+            for name, plaid_categories, budget, children in CATEGORY_TREE:
+                parent = SpendingCategory(user=user, name=name, plaid_categories=plaid_categories,
+                                          monthly_budget=budget)
+                categories.append(parent)
+                categories.extend(SpendingCategory(user=user, name=child, parent=parent) for child in children)
+                monthly.extend(
+                    MonthlySpending(
+                        user=user, category=parent, year=month.year, month=month.month,
+                        amount_spent=(budget * Decimal(self.random.uniform(0.5, 1.3))).quantize(Decimal('0.01')),
+                        transaction_count=self.random.randint(5, 60),
+                    )
+                    for month in months
+                )
+        SpendingCategory.objects.bulk_create(categories, batch_size=BATCH_SIZE)
+        MonthlySpending.objects.bulk_create(monthly, batch_size=BATCH_SIZE)
+        return len(categories), len(monthly)
+
+    def _snapshots(self, users) -> int:
+        snapshots = []
+        for user in users:
+            net_worth = Decimal(self.random.randint(10_000, 250_000))
+            day = self.start
+            while day <= self.today:
+                assets = net_worth + Decimal(self.random.randint(2_000, 20_000))
+                snapshots.append(NetWorthSnapshot(
+                    user=user, date=day, total_assets=assets, total_liabilities=assets - net_worth,
+                    net_worth=net_worth, cash_and_investments=assets, credit_cards=assets - net_worth,
+                ))
+                net_worth += Decimal(self.random.randint(-1_500, 2_500))
+                day += timedelta(days=7)
+        return len(NetWorthSnapshot.objects.bulk_create(snapshots, batch_size=BATCH_SIZE))
+
+    def _balances(self, accounts):
+        spent = dict(
+            Transaction.objects.filter(account__in=[a for a in accounts if a.type != 'investment'])
+            .values_list('account').annotate(total=Sum('amount')).order_by()
+        )
+        held = dict(
+            Holding.objects.filter(account__in=[a for a in accounts if a.type == 'investment'])
+            .values_list('account').annotate(total=Sum('institution_value')).order_by()
+        )
+        for account in accounts:
+            if account.type == 'investment':
+                account.current_balance = held.get(account.id, 0)
+            elif account.type == 'credit':
+                # A card carries roughly one month of spending
+                account.current_balance = (Decimal(spent.get(account.id) or 0) / (12 * self.years)).quantize(
+                    Decimal('0.01'))
+            else:
+                account.current_balance = Decimal(self.random.randint(2_000, 30_000))
+        Account.objects.bulk_update(accounts, ['current_balance'], batch_size=BATCH_SIZE)
@@ -0,0 +1,149 @@
+"""
+Benchmark Suite
+
+Each benchmark runs a hot path a few times against the synthetic data and
+records its query count and timings:
+
+- ``dashboard``, ``transaction_list``, ``transaction_search`` and
+  ``category_tree`` go through the API, including middleware and serializers
+- ``recurring_detection`` runs the detection service for one user
+- ``sync_ingest`` replays Plaid sync pages through ``TransactionSyncService``
+
+Results are plain dicts, written as JSON by the ``run_benchmarks`` command.
+``compare_results`` checks a run against a saved baseline. Any increase in
+queries is a regression. So is a median slower than the baseline by more than
+the tolerance; tiny absolute differences are ignored as noise.
+"""
+import logging
+import statistics
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from samaanai.instrumentation import RequestMetrics
+
+from ..models import Account, Transaction
+from ..services import RecurringTransactionDetectionService, TransactionSyncService
+from .replay import ReplayPlaidService, synthetic_sync_pages
+
+logger = logging.getLogger(__name__)
+
+ITERATIONS = 5
+TIME_TOLERANCE = 0.25
+# Median differences below this are noise, whatever the relative change
+NOISE_FLOOR_MS = 2.0
+
+API_BENCHMARKS = {
+    'dashboard': '/api/finance/dashboard/',
+    'transaction_list': '/api/finance/transactions/',
+    'transaction_search': '/api/finance/transactions/?search=coffee',
+    'category_tree': '/api/finance/spending-categories/tree/',
+}
+BENCHMARKS = (*API_BENCHMARKS, 'recurring_detection', 'sync_ingest')
+
+
+def measure(run: Callable, iterations: int = ITERATIONS, setup: Optional[Callable] = None) -> Dict:
+    """Time ``run`` ``iterations`` times after one untimed warm-up, calling ``setup`` untimed before each"""
+    if setup:
+        setup()
+    run()
+
+    timings, queries, db_times = [], [], []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        # The request middleware's query counter, without the size limit of the debug query log
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(metrics.queries)
+        db_times.append(metrics.db_time * 1000)
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'queries': max(queries),
+        'db_median_ms': round(statistics.median(db_times), 2),
+        'min_ms': round(timings[0], 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 2),
+    }
+
+
+class BenchmarkSuite:
+    """Runs the benchmarks as ``user``; see the module docstring"""
+
+    def __init__(self, user, iterations: int = ITERATIONS, replay: Optional[ReplayPlaidService] = None):
+        self.user = user
+        self.iterations = iterations
+        self.replay = replay or synthetic_sync_pages()
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    def run(self, only: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        results = {}
+        # The test client's host; tests get it from the runner, the command does not
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name in BENCHMARKS:
+                if only and name not in only:
+                    continue
+                if name in API_BENCHMARKS:
+                    results[name] = self._bench_api(API_BENCHMARKS[name])
+                else:
+                    results[name] = getattr(self, f'_bench_{name}')()
+                logger.info(f"Benchmark {name}: {results[name]}")
+        return results
+
+    def _bench_api(self, path: str) -> Dict:
+        def run():
+            response = self.client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return measure(run, self.iterations)
+
+    def _bench_recurring_detection(self) -> Dict:
+        service = RecurringTransactionDetectionService()
+        result = measure(lambda: service.detect_recurring_transactions(self.user), self.iterations)
+        result['patterns'] = len(service.detect_recurring_transactions(self.user))
+        return result
+
+    def _bench_sync_ingest(self) -> Dict:
+        institution = self.user.institutions.order_by('created_at').first()
+        if institution is None:
+            raise RuntimeError(f"User {self.user.id} has no institution to sync into")
+        self.replay.bind(list(
+            Account.objects.filter(institution=institution).exclude(type='investment')
+            .values_list('plaid_account_id', flat=True)
+        ))
+        service = TransactionSyncService()
+        service.plaid_service = self.replay
+
+        def reset():
+            Transaction.objects.filter(plaid_transaction_id__in=self.replay.transaction_ids).delete()
+            institution.sync_cursor = self.replay.cursor(0)
+            institution.save(update_fields=['sync_cursor'])
+
+        result = measure(lambda: service.sync_institution_transactions(institution), self.iterations, setup=reset)
+        result['rows'] = len(self.replay.transaction_ids)
+        reset()
+        return result
+
+
+def compare_results(current: Dict[str, Dict], baseline: Dict[str, Dict],
+                    tolerance: float = TIME_TOLERANCE) -> List[str]:
+    """Describe each benchmark that regressed against ``baseline``; empty when nothing did"""
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {result['queries']} queries, was {before['queries']}")
+        slower = result['median_ms'] - before['median_ms']
+        if slower > NOISE_FLOOR_MS and result['median_ms'] > before['median_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: median {result['median_ms']}ms, was {before['median_ms']}ms")
+    return regressions
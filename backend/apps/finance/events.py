@@ -0,0 +1,13 @@
+"""
+Finance Events
+
+In-process signals other apps can subscribe to without the finance code
+knowing about them. They are sent with ``send_robust`` from the places that
+change data in bulk, once per batch rather than once per row, so a slow or
+failing receiver never holds up or breaks ingestion; senders log the failures.
+"""
+from django.dispatch import Signal
+
+# Sent once per Plaid sync page that created transactions, after the page is saved.
+# Arguments: institution, transaction_ids (ids of the newly created rows)
+transactions_added = Signal()
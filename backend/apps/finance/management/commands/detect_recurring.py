@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from apps.finance.services import RecurringTransactionDetectionService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database sockets; spawned ones need app setup
+    django.setup()
+    connections.close_all()
+
+
+def _detect_for_user(user_id, min_occurrences, lookback_days, auto_create):
+    """Detect, create and project recurring transactions for one user; runs inside a worker."""
+    user = User.objects.get(id=user_id)
+    service = RecurringTransactionDetectionService()
+    patterns = service.create_recurring_transactions(
+        user,
+        auto_create=auto_create,
+        min_occurrences=min_occurrences,
+        lookback_days=lookback_days,
+    )
+    projected = service.refresh_upcoming_bills(user)
+    return {
+        'user_id': user_id,
+        'detected': len(patterns),
+        'created': sum(1 for p in patterns if p.get('created_id')),
+        'projected': projected,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Detect recurring transactions and refresh the upcoming-bills projection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Run detection for a specific user ID',
+        )
+        parser.add_argument(
+            '--all-users',
+            action='store_true',
+            help='Run detection for every user with linked institutions or recurring transactions',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker processes (1 runs in-process)',
+        )
+        parser.add_argument('--min-occurrences', type=int, default=3)
+        parser.add_argument('--lookback-days', type=int, default=365)
+        parser.add_argument(
+            '--no-create',
+            action='store_true',
+            help='Only flag existing records and refresh projections; do not create new recurring transactions',
+        )
+
+    def handle(self, *args, **options):
+        if options['user_id']:
+            user_ids = [options['user_id']]
+            if not User.objects.filter(id=options['user_id']).exists():
+                raise CommandError(f"User {options['user_id']} not found")
+        elif options['all_users']:
+            user_ids = list(
+                User.objects.filter(is_active=True)
+                .filter(Q(institutions__isnull=False) | Q(recurring_transactions__isnull=False))
+                .distinct().values_list('id', flat=True)
+            )
+        else:
+            raise CommandError("Please specify --user-id or --all-users")
+
+        job_args = (options['min_occurrences'], options['lookback_days'], not options['no_create'])
+        workers = max(1, min(options['workers'], len(user_ids)))
+        self.stdout.write(f"Detecting recurring transactions for {len(user_ids)} users with {workers} workers...")
+
+        results, failed = [], 0
+        if workers == 1:
+            for user_id in user_ids:
+                try:
+                    results.append(_detect_for_user(user_id, *job_args))
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Recurring detection failed for user {user_id}: {e}", exc_info=True)
+        else:
+            # Close inherited connections before forking so no socket is shared with children
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = {pool.submit(_detect_for_user, user_id, *job_args): user_id for user_id in user_ids}
+                for future in as_completed(futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        failed += 1
+                        logger.error(f"Recurring detection failed for user {futures[future]}: {e}", exc_info=True)
+
+        detected = sum(r['detected'] for r in results)
+        created = sum(r['created'] for r in results)
+        projected = sum(r['projected'] for r in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"Detected {detected} patterns, created {created} recurring transactions, "
+            f"projected {projected} upcoming bills ({failed} users failed)"
+        ))
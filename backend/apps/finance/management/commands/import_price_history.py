@@ -0,0 +1,95 @@
+from collections import defaultdict
+
+from dateutil import parser as date_parser
+from django.core.management.base import BaseCommand, CommandError
+from apps.finance.models import PriceHistory, Security
+from apps.finance.services.csv_importer import parse_money, read_csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Import daily closing prices from a CSV with symbol, date and close columns'
+
+    BATCH_SIZE = 2000
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', type=str, help='Path to the price CSV')
+        parser.add_argument(
+            '--symbol',
+            type=str,
+            help='Ticker for single-security files that have no symbol column',
+        )
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Replace prices already stored for the same security and date',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            csv_file = open(options['csv_path'], 'rb')
+        except OSError as e:
+            raise CommandError(f"Cannot open {options['csv_path']}: {e}")
+
+        with csv_file:
+            columns, rows = read_csv(csv_file)
+            if columns is None:
+                raise CommandError("CSV file is empty")
+
+            get_symbol = columns.getter('symbol', 'ticker')
+            get_date = columns.getter('date')
+            get_close = columns.getter('close', 'adj close', 'close price', 'price')
+            if columns.index_for('date') is None or columns.index_for('close', 'adj close', 'close price', 'price') is None:
+                raise CommandError("CSV needs date and close columns")
+            if columns.index_for('symbol', 'ticker') is None and not options['symbol']:
+                raise CommandError("CSV has no symbol column; pass --symbol")
+
+            # Several Security rows can share a ticker (one per Plaid institution listing)
+            securities_by_ticker = defaultdict(list)
+            for security_id, ticker in Security.objects.exclude(ticker_symbol__isnull=True).values_list('id', 'ticker_symbol'):
+                securities_by_ticker[ticker.upper()].append(security_id)
+
+            imported, skipped, unknown = 0, 0, set()
+            batch = []
+            for row_num, row in rows:
+                symbol = (get_symbol(row) or options['symbol'] or '').upper()
+                close = parse_money(get_close(row))
+                try:
+                    price_date = date_parser.parse(get_date(row)).date()
+                except (ValueError, OverflowError):
+                    skipped += 1
+                    continue
+                if close is None or close <= 0:
+                    skipped += 1
+                    continue
+                security_ids = securities_by_ticker.get(symbol)
+                if not security_ids:
+                    unknown.add(symbol)
+                    continue
+
+                for security_id in security_ids:
+                    batch.append(PriceHistory(security_id=security_id, date=price_date, close_price=close, source='csv'))
+                if len(batch) >= self.BATCH_SIZE:
+                    imported += self._write(batch, options['overwrite'])
+                    batch = []
+
+            if batch:
+                imported += self._write(batch, options['overwrite'])
+
+        if unknown:
+            self.stdout.write(self.style.WARNING(f"Skipped unknown symbols: {', '.join(sorted(unknown))}"))
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} prices ({skipped} invalid rows skipped)"))
+
+    def _write(self, batch, overwrite):
+        if overwrite:
+            PriceHistory.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['security', 'date'],
+                update_fields=['close_price', 'source'],
+            )
+        else:
+            PriceHistory.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
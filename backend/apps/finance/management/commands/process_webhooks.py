@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from apps.finance.services.webhooks import WebhookProcessor
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Process stored Plaid webhooks, coalescing events per item into a single sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=WebhookProcessor.BATCH_SIZE,
+            help='Maximum number of webhook events to claim per batch',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for new webhooks instead of exiting once the queue is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when the queue is empty (with --loop)',
+        )
+
+    def handle(self, *args, **options):
+        processor = WebhookProcessor()
+        totals = {'events': 0, 'syncs': 0, 'deferred': 0, 'failed': 0}
+
+        while True:
+            stats = processor.process_pending(options['batch_size'])
+            for key in totals:
+                totals[key] += stats[key]
+            if stats['events']:
+                logger.info(
+                    f"Processed {stats['events']} webhook events for {stats['items']} items "
+                    f"({stats['syncs']} syncs, {stats['deferred']} deferred, {stats['failed']} failed)"
+                )
+                # Items deferred to another worker are requeued; only go straight on if something got done
+                if stats['deferred'] < stats['items']:
+                    continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {totals['events']} webhook events: {totals['syncs']} syncs, "
+            f"{totals['deferred']} deferred, {totals['failed']} failed"
+        ))
@@ -0,0 +1,96 @@
+import json
+import logging
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.finance.benchmarks import (
+    BENCHMARKS, BenchmarkSuite, ReplayPlaidService, SyntheticDataGenerator, compare_results, synthetic_sync_pages,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic data, benchmark the finance hot paths and write query counts and timings as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Synthetic users to generate')
+        parser.add_argument('--years', type=int, default=2, help='Years of transaction history per user')
+        parser.add_argument('--iterations', type=int, default=5, help='Timed runs per benchmark')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='Run only these benchmarks')
+        parser.add_argument('--output', default='benchmark-results.json', help='Where to write the results')
+        parser.add_argument('--baseline', help='Earlier results to compare against; regressions fail the command')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown of a median before it counts as a regression')
+        parser.add_argument('--sync-pages', help='Recorded Plaid sync pages (JSON) to replay instead of synthetic ones')
+        parser.add_argument('--save-sync-pages', help='Write the replayed sync pages to this file')
+        parser.add_argument(
+            '--keep-data',
+            action='store_true',
+            help='Commit the synthetic data instead of rolling everything back at the end',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not read baseline {options['baseline']}: {e}")
+
+        replay = (
+            ReplayPlaidService.load(options['sync_pages']) if options['sync_pages']
+            else synthetic_sync_pages(seed=options['seed'])
+        )
+        if options['save_sync_pages']:
+            replay.save(options['save_sync_pages'])
+
+        self.stdout.write(f"Generating {options['users']} users with {options['years']} years of history...")
+        with transaction.atomic():
+            generator = SyntheticDataGenerator(users=options['users'], years=options['years'], seed=options['seed'])
+            counts = generator.generate()
+            self.stdout.write(f"Generated {counts}")
+
+            user = User.objects.filter(username__startswith=f"{generator.prefix}-user-").order_by('id').first()
+            try:
+                results = BenchmarkSuite(user, options['iterations'], replay).run(options['only'])
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+            if not options['keep_data']:
+                transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'users': options['users'],
+                'years': options['years'],
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'rows': counts,
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:22} {result['queries']:5} queries  median {result['median_ms']:9.2f}ms  "
+                f"p95 {result['p95_ms']:9.2f}ms"
+            )
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = compare_results(results, baseline, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(regression))
+                raise CommandError(f"{len(regressions)} benchmark regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
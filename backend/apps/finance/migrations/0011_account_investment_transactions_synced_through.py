@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_add_recurring_transaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='investment_transactions_synced_through',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_account_investment_transactions_synced_through'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('close_price', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('source', models.CharField(choices=[('plaid', 'Plaid close price'), ('csv', 'CSV import')], default='plaid', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('security', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='finance.security')),
+            ],
+            options={
+                'ordering': ['security', 'date'],
+                'unique_together': {('security', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('finance', '0012_pricehistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpcomingBill',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_income', models.BooleanField(default=False)),
+                ('due_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recurring_transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='projected_occurrences', to='finance.recurringtransaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upcoming_bills', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['due_date', 'name'],
+                'indexes': [models.Index(fields=['user', 'due_date'], name='finance_upc_user_id_7fdf96_idx')],
+            },
+        ),
+    ]
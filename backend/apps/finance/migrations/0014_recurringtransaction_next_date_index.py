@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0013_upcomingbill'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recurringtransaction',
+            index=models.Index(fields=['user', 'next_date'], name='finance_rec_user_id_f8f438_idx'),
+        ),
+    ]
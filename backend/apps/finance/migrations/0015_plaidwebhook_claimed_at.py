@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_recurringtransaction_next_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plaidwebhook',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0015_plaidwebhook_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plaidwebhook',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -136,6 +136,9 @@ class Account(models.Model):
     is_active = models.BooleanField(default=True)
     is_selected = models.BooleanField(default=True)  # User can hide accounts
     
+    # Investment transaction sync high-watermark (last end_date synced successfully)
+    investment_transactions_synced_through = models.DateField(null=True, blank=True)
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -385,8 +388,22 @@ class RecurringTransaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Occurrences per year; the monthly equivalent is amount * occurrences / 12
+    OCCURRENCES_PER_YEAR = {
+        'daily': 365,
+        'weekly': 52,
+        'bi_weekly': 26,
+        'monthly': 12,
+        'quarterly': 4,
+        'semi_annually': 2,
+        'yearly': 1,
+    }
+    
     class Meta:
         ordering = ['next_date', 'name']
+        indexes = [
+            models.Index(fields=['user', 'next_date']),
+        ]
     
     def __str__(self):
         direction = "+" if self.is_income else "-"
@@ -428,16 +445,60 @@ class RecurringTransaction(models.Model):
     @property
     def monthly_amount(self):
         """Calculate monthly equivalent amount"""
-        multipliers = {
-            'daily': 30,
-            'weekly': 4.33,
-            'bi_weekly': 2.17,
-            'monthly': 1,
-            'quarterly': 1/3,
-            'semi_annually': 1/6,
-            'yearly': 1/12,
-        }
-        return float(self.amount) * multipliers.get(self.frequency, 1)
+        return self.amount * self.OCCURRENCES_PER_YEAR.get(self.frequency, 12) / 12
+    
+    @classmethod
+    def annual_amount_expression(cls):
+        """
+        Database-side ``amount * occurrences per year`` for aggregates.
+        
+        Dividing the summed result by 12 gives the monthly equivalent; keeping
+        the division out of SQL keeps the sum exact.
+        """
+        occurrences = models.Case(
+            *[models.When(frequency=frequency, then=models.Value(count))
+              for frequency, count in cls.OCCURRENCES_PER_YEAR.items()],
+            default=models.Value(12),
+        )
+        return models.ExpressionWrapper(
+            models.F('amount') * occurrences,
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        )
+
+
+class UpcomingBill(models.Model):
+    """
+    Projected occurrences of active recurring transactions over the next 90 days.
+    
+    Rebuilt by the scheduled detect_recurring command, on every recurring
+    edit, and lazily by the summary endpoint when not yet rebuilt today.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upcoming_bills')
+    recurring_transaction = models.ForeignKey(
+        RecurringTransaction,
+        on_delete=models.CASCADE,
+        related_name='projected_occurrences'
+    )
+    
+    # Denormalized so summaries read a single table
+    name = models.CharField(max_length=200)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    is_income = models.BooleanField(default=False)
+    due_date = models.DateField()
+    
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['due_date', 'name']
+        indexes = [
+            models.Index(fields=['user', 'due_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} due {self.due_date} (${self.amount})"
 
 
 class NetWorthSnapshot(models.Model):
@@ -489,6 +550,8 @@ class PlaidWebhook(models.Model):
     # Processing status
     processed = models.BooleanField(default=False)
     processed_at = models.DateTimeField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # Set while a worker holds the event
+    attempts = models.PositiveSmallIntegerField(default=0)  # Claims so far; capped by the worker
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -687,3 +750,27 @@ class InvestmentTransaction(models.Model):
     
     def __str__(self):
         return f"{self.type}: {self.name} - ${self.amount}"
+
+
+class PriceHistory(models.Model):
+    """Daily closing price for a security, used to value historical positions"""
+    SOURCE_CHOICES = [
+        ('plaid', 'Plaid close price'),
+        ('csv', 'CSV import'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    security = models.ForeignKey(Security, on_delete=models.CASCADE, related_name='price_history')
+    date = models.DateField()
+    close_price = models.DecimalField(max_digits=12, decimal_places=4)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='plaid')
+    
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['security', 'date']
+        ordering = ['security', 'date']
+    
+    def __str__(self):
+        return f"{self.security} @ {self.close_price} on {self.date}"
@@ -11,13 +11,27 @@ from plaid.model.products import Products
 from plaid.model.accounts_balance_get_request import AccountsBalanceGetRequest
 from plaid.model.investments_holdings_get_request import InvestmentsHoldingsGetRequest
 from plaid.model.investments_transactions_get_request import InvestmentsTransactionsGetRequest
+from plaid.model.investments_transactions_get_request_options import InvestmentsTransactionsGetRequestOptions
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import Q
 from django.utils import timezone
 from datetime import datetime, timedelta
+from decimal import Decimal
 import logging
+import uuid
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 from plaid.exceptions import ApiException
 
+from samaanai.metrics import SYNC_ROWS, observe_plaid, observe_sync
+
+from ..events import transactions_added
+from .locks import exclusive_sync
+from .portfolio import PortfolioAnalyticsService
+from .recurring import MIN_OCCURRENCES, detect_recurring, next_occurrence, occurrences_between
+from .securities import security_master
+
 logger = logging.getLogger(__name__)
 
 
@@ -50,6 +64,7 @@ class PlaidService:
         api_client = plaid.ApiClient(configuration)
         self.client = plaid_api.PlaidApi(api_client)
     
+    @observe_plaid('link_token_create')
     def create_link_token(self, user, redirect_uri=None, include_investments=False):
         """Create a Plaid Link token for user authentication"""
         try:
@@ -114,6 +129,7 @@ class PlaidService:
             logger.error(f"Unexpected error during link_token_create for user {user.id}: {e}")
             raise
     
+    @observe_plaid('item_public_token_exchange')
     def exchange_public_token(self, public_token):
         """Exchange public token for access token"""
         try:
@@ -129,6 +145,7 @@ class PlaidService:
             logger.error(f"Error exchanging public token: {e}")
             raise
     
+    @observe_plaid('accounts_get')
     def get_accounts(self, access_token):
         """Get all accounts for an item"""
         try:
@@ -139,6 +156,7 @@ class PlaidService:
             logger.error(f"Error getting accounts: {e}")
             raise
     
+    @observe_plaid('institutions_get_by_id')
     def get_institution(self, institution_id):
         """Get institution details by ID"""
         try:
@@ -152,6 +170,7 @@ class PlaidService:
             logger.error(f"Error getting institution: {e}")
             raise
     
+    @observe_plaid('transactions_sync')
     def sync_transactions(self, access_token, cursor=None):
         """Sync transactions using the new transactions sync endpoint"""
         try:
@@ -178,6 +197,7 @@ class PlaidService:
             logger.error(f"Unexpected error syncing transactions: {e}")
             raise
     
+    @observe_plaid('transactions_get')
     def get_transactions(self, access_token, start_date, end_date, account_ids=None):
         """Get transactions for a date range (fallback method)"""
         try:
@@ -234,6 +254,7 @@ class PlaidService:
             logger.error(f"Error updating balances: {e}")
             raise
     
+    @observe_plaid('item_get')
     def get_item_status(self, access_token):
         """Get item status to check for errors"""
         try:
@@ -243,6 +264,7 @@ class PlaidService:
             logger.error(f"Error getting item status: {e}")
             raise
     
+    @observe_plaid('item_remove')
     def remove_item(self, access_token):
         """Remove an item (unlink institution)"""
         try:
@@ -252,6 +274,7 @@ class PlaidService:
             logger.error(f"Error removing item: {e}")
             raise
     
+    @observe_plaid('investments_holdings_get')
     def get_investments_holdings(self, access_token):
         """Get investment holdings for an institution"""
         try:
@@ -266,33 +289,44 @@ class PlaidService:
             logger.error(f"Error getting investment holdings: {e}")
             raise
     
-    def get_investments_transactions(self, access_token, start_date, end_date):
-        """Get investment transactions for a date range"""
+    INVESTMENT_TRANSACTIONS_PAGE_SIZE = 500  # Plaid's maximum
+    
+    @observe_plaid('investments_transactions_get')
+    def get_investments_transactions(self, access_token, start_date, end_date, account_ids=None):
+        """
+        Get investment transactions for a date range, following pagination.
+        
+        Securities are merged across pages by security_id, since each page only
+        lists the securities referenced by its own transactions.
+        """
         try:
-            request = InvestmentsTransactionsGetRequest(
-                access_token=access_token,
-                start_date=start_date,
-                end_date=end_date
-            )
-            response = self.client.investments_transactions_get(request)
-            
-            transactions = response['investment_transactions']
-            total_transactions = response['total_investment_transactions']
+            transactions = []
+            securities = {}
+            total_transactions = None
             
-            # Get all transactions if there are more
-            while len(transactions) < total_transactions:
+            while total_transactions is None or len(transactions) < total_transactions:
+                options = {'count': self.INVESTMENT_TRANSACTIONS_PAGE_SIZE, 'offset': len(transactions)}
+                if account_ids:
+                    options['account_ids'] = list(account_ids)
                 request = InvestmentsTransactionsGetRequest(
                     access_token=access_token,
                     start_date=start_date,
                     end_date=end_date,
-                    offset=len(transactions)
+                    options=InvestmentsTransactionsGetRequestOptions(**options)
                 )
                 response = self.client.investments_transactions_get(request)
-                transactions.extend(response['investment_transactions'])
+                
+                page = response['investment_transactions']
+                transactions.extend(page)
+                for security in response['securities']:
+                    securities[security['security_id']] = security
+                total_transactions = response['total_investment_transactions']
+                if not page:
+                    break  # Guard against a total that over-reports
             
             return {
                 'investment_transactions': transactions,
-                'securities': response['securities'],
+                'securities': list(securities.values()),
                 'accounts': response['accounts']
             }
         except plaid.ApiException as e:
@@ -306,8 +340,10 @@ class TransactionSyncService:
     def __init__(self):
         self.plaid_service = PlaidService()
     
+    @exclusive_sync('transactions')
+    @observe_sync('transactions')
     def sync_institution_transactions(self, institution):
-        """Sync all transactions for an institution"""
+        """Sync all transactions for an institution; joins a sync already running for it"""
         from apps.finance.models import Transaction, Account
         
         # Determine if this is the very first sync for the Plaid item
@@ -329,6 +365,9 @@ class TransactionSyncService:
                 
                 logger.info(f"Plaid sync result: added={len(result['added'])}, modified={len(result['modified'])}, removed={len(result['removed'])}, has_more={result['has_more']}")
                 
+                added_ids = []
+                modified = removed = 0
+                
                 # Process added transactions
                 for trans_data in result['added']:
                     try:
@@ -373,6 +412,7 @@ class TransactionSyncService:
                         )
                         if created:
                             transactions_synced += 1
+                            added_ids.append(transaction.id)
                             logger.info(f"Created transaction: {transaction.name} - ${transaction.amount}")
                         
                     except Account.DoesNotExist:
@@ -391,6 +431,7 @@ class TransactionSyncService:
                         trans.name = trans_data['name']
                         trans.pending = trans_data.get('pending', False)
                         trans.save()
+                        modified += 1
                         logger.info(f"Updated transaction: {trans.name}")
                     except Transaction.DoesNotExist:
                         logger.warning(f"Transaction not found for modification: {trans_data['transaction_id']}")
@@ -401,8 +442,13 @@ class TransactionSyncService:
                         plaid_transaction_id=trans_data['transaction_id']
                     ).delete()[0]
                     if deleted_count > 0:
+                        removed += deleted_count
                         logger.info(f"Removed transaction: {trans_data['transaction_id']}")
                 
+                SYNC_ROWS.labels('transactions', 'added').inc(len(added_ids))
+                SYNC_ROWS.labels('transactions', 'modified').inc(modified)
+                SYNC_ROWS.labels('transactions', 'removed').inc(removed)
+                
                 cursor = result['next_cursor']
                 has_more = result['has_more']
                 
@@ -410,6 +456,18 @@ class TransactionSyncService:
                 if hasattr(institution, 'sync_cursor'):
                     institution.sync_cursor = cursor
                     institution.save()
+                
+                # The first sync backfills history, which is not news to anyone
+                if added_ids and initial_cursor:
+                    for receiver, response in transactions_added.send_robust(
+                        sender=self.__class__, institution=institution, transaction_ids=added_ids
+                    ):
+                        if isinstance(response, Exception):
+                            logger.error(
+                                f"transactions_added receiver {receiver.__qualname__} failed for institution "
+                                f"{institution.id}: {response}",
+                                exc_info=response,
+                            )
             
             except ApiException as e:
                 # Handle Plaid pagination mutation error by restarting from last saved cursor
@@ -456,6 +514,7 @@ class TransactionSyncService:
                 )
                 
                 logger.info(f"Fallback method returned {len(transactions_data)} transactions")
+                backfilled = 0
                 
                 for trans_data in transactions_data:
                     try:
@@ -500,11 +559,13 @@ class TransactionSyncService:
                         )
                         if created:
                             transactions_synced += 1
+                            backfilled += 1
                             logger.info(f"Created transaction via fallback: {transaction.name} - ${transaction.amount}")
                     except Account.DoesNotExist:
                         logger.warning(f"Account not found for fallback transaction: {trans_data['account_id']}")
                     except Exception as e:
                         logger.error(f"Error processing fallback transaction {trans_data.get('transaction_id', 'unknown')}: {e}")
+                SYNC_ROWS.labels('transactions', 'added').inc(backfilled)
                         
             except Exception as e:
                 logger.error(f"Error in fallback transaction fetch: {e}")
@@ -524,9 +585,23 @@ class InvestmentSyncService:
     def __init__(self):
         self.plaid_service = PlaidService()
     
+    HOLDING_UPDATE_FIELDS = [
+        'quantity', 'institution_price', 'institution_price_as_of', 'institution_value',
+        'cost_basis', 'iso_currency_code', 'updated_at',
+    ]
+    
+    @exclusive_sync('holdings')
+    @observe_sync('holdings')
     def sync_institution_holdings(self, institution):
-        """Sync investment holdings for an institution"""
-        from apps.finance.models import Account, Security, Holding
+        """
+        Reconcile investment holdings for an institution with Plaid's snapshot.
+        
+        Securities go through the shared security master, holdings are upserted
+        in bulk, and holdings that no longer appear for an account Plaid
+        returned are deleted, all in one transaction.
+        The number of queries does not grow with the number of positions.
+        """
+        from apps.finance.models import Account, Holding
         
         try:
             # Only sync for investment accounts
@@ -544,65 +619,66 @@ class InvestmentSyncService:
             # Get holdings from Plaid
             holdings_data = self.plaid_service.get_investments_holdings(institution.access_token)
             
-            # First, sync securities
-            securities_by_id = {}
-            for security_data in holdings_data['securities']:
-                security, created = Security.objects.update_or_create(
-                    plaid_security_id=security_data['security_id'],
-                    defaults={
-                        'name': security_data.get('name', ''),
-                        'ticker_symbol': security_data.get('ticker_symbol'),
-                        'cusip': security_data.get('cusip'),
-                        'isin': security_data.get('isin'),
-                        'sedol': security_data.get('sedol'),
-                        'type': security_data.get('type'),
-                        'close_price': security_data.get('close_price'),
-                        'close_price_as_of': security_data.get('close_price_as_of'),
-                        'institution_id': security_data.get('institution_id'),
-                        'institution_security_id': security_data.get('institution_security_id'),
-                        'is_cash_equivalent': security_data.get('is_cash_equivalent', False),
-                    }
+            with db_transaction.atomic():
+                security_ids = security_master.upsert(holdings_data['securities'])
+                
+                plaid_account_ids = {account['account_id'] for account in holdings_data['accounts']}
+                plaid_account_ids.update(holding['account_id'] for holding in holdings_data['holdings'])
+                account_ids = dict(
+                    Account.objects.filter(institution=institution, plaid_account_id__in=plaid_account_ids)
+                    .values_list('plaid_account_id', 'id')
                 )
-                securities_by_id[security_data['security_id']] = security
-                if created:
-                    logger.info(f"Created security: {security.ticker_symbol or security.name}")
-            
-            # Sync holdings
-            holdings_synced = 0
-            for holding_data in holdings_data['holdings']:
-                try:
-                    account = Account.objects.get(
-                        plaid_account_id=holding_data['account_id']
-                    )
-                    security = securities_by_id.get(holding_data['security_id'])
-                    
-                    if not security:
+                
+                existing = {
+                    (account_id, security_id): holding_id
+                    for holding_id, account_id, security_id in Holding.objects.filter(
+                        account_id__in=account_ids.values()
+                    ).values_list('id', 'account_id', 'security_id')
+                }
+                
+                holdings = {}
+                for holding_data in holdings_data['holdings']:
+                    account_id = account_ids.get(holding_data['account_id'])
+                    security_id = security_ids.get(holding_data['security_id'])
+                    if not account_id:
+                        logger.warning(f"Account not found for holding: {holding_data['account_id']}")
+                        continue
+                    if not security_id:
                         logger.warning(f"Security not found for holding: {holding_data['security_id']}")
                         continue
                     
-                    holding, created = Holding.objects.update_or_create(
-                        account=account,
-                        security=security,
-                        defaults={
-                            'quantity': holding_data['quantity'],
-                            'institution_price': holding_data['institution_price'],
-                            'institution_price_as_of': holding_data.get('institution_price_as_of'),
-                            'institution_value': holding_data['institution_value'],
-                            'cost_basis': holding_data.get('cost_basis'),
-                            'iso_currency_code': holding_data.get('iso_currency_code', 'USD'),
-                        }
+                    holdings[(account_id, security_id)] = Holding(
+                        id=existing.get((account_id, security_id)) or uuid.uuid4(),
+                        account_id=account_id,
+                        security_id=security_id,
+                        quantity=holding_data['quantity'],
+                        institution_price=holding_data['institution_price'],
+                        institution_price_as_of=holding_data.get('institution_price_as_of'),
+                        institution_value=holding_data['institution_value'],
+                        cost_basis=holding_data.get('cost_basis'),
+                        iso_currency_code=holding_data.get('iso_currency_code') or 'USD',
                     )
-                    
-                    if created:
-                        holdings_synced += 1
-                        logger.info(f"Created holding: {security.ticker_symbol or security.name} - {holding.quantity} shares")
-                    
-                except Account.DoesNotExist:
-                    logger.warning(f"Account not found for holding: {holding_data['account_id']}")
-                except Exception as e:
-                    logger.error(f"Error processing holding: {e}")
+                
+                Holding.objects.bulk_create(
+                    holdings.values(),
+                    update_conflicts=True,
+                    unique_fields=['account', 'security'],
+                    update_fields=self.HOLDING_UPDATE_FIELDS,
+                )
+                
+                # Positions Plaid no longer reports for these accounts were sold or moved
+                stale_ids = [holding_id for key, holding_id in existing.items() if key not in holdings]
+                removed = Holding.objects.filter(id__in=stale_ids).delete()[0] if stale_ids else 0
             
-            logger.info(f"Holdings sync completed for {institution.name}. Total synced: {holdings_synced}")
+            PortfolioAnalyticsService.invalidate(institution.user_id)
+            created = len(holdings) - (len(existing) - len(stale_ids))
+            SYNC_ROWS.labels('holdings', 'added').inc(created)
+            SYNC_ROWS.labels('holdings', 'modified').inc(len(holdings) - created)
+            SYNC_ROWS.labels('holdings', 'removed').inc(removed)
+            logger.info(
+                f"Holdings sync completed for {institution.name}: {created} created, "
+                f"{len(holdings) - created} updated, {removed} removed"
+            )
             return True
             
         except Exception as e:
@@ -610,94 +686,119 @@ class InvestmentSyncService:
             logger.exception("Full exception details:")
             return False
     
+    # Days re-fetched before each account's watermark to pick up late-posting activity
+    INVESTMENT_SYNC_OVERLAP_DAYS = 7
+    # History fetched for accounts that have never been synced
+    INVESTMENT_SYNC_INITIAL_DAYS = 365
+    INVESTMENT_TRANSACTION_UPDATE_FIELDS = [
+        'account', 'security', 'amount', 'quantity', 'price', 'fees', 'type',
+        'subtype', 'date', 'name', 'iso_currency_code', 'updated_at',
+    ]
+    
+    @exclusive_sync('investment_transactions')
+    @observe_sync('investment_transactions')
     def sync_institution_investment_transactions(self, institution, start_date=None, end_date=None):
-        """Sync investment transactions for an institution"""
-        from apps.finance.models import Account, Security, InvestmentTransaction
+        """
+        Sync investment transactions for an institution.
+        
+        Without explicit dates the window starts at the oldest account
+        watermark (``investment_transactions_synced_through``) minus a short
+        overlap, so routine refreshes only fetch recent days. Rows are upserted
+        in bulk (securities via the security master) and, on success, the
+        watermarks of the accounts the window fully covered advance to ``end_date``.
+        """
+        from apps.finance.models import Account, InvestmentTransaction
         
-        if not start_date:
-            start_date = (timezone.now() - timedelta(days=365)).date()
         if not end_date:
             end_date = timezone.now().date()
         
         try:
             # Only sync for investment accounts
-            investment_accounts = Account.objects.filter(
+            investment_accounts = list(Account.objects.filter(
                 institution=institution,
                 type='investment'
-            )
+            ))
             
-            if not investment_accounts.exists():
+            if not investment_accounts:
                 logger.info(f"No investment accounts found for institution {institution.name}")
                 return True
             
-            logger.info(f"Syncing investment transactions for institution {institution.name}")
+            if not start_date:
+                start_date = min(
+                    (account.investment_transactions_synced_through - timedelta(days=self.INVESTMENT_SYNC_OVERLAP_DAYS))
+                    if account.investment_transactions_synced_through
+                    else end_date - timedelta(days=self.INVESTMENT_SYNC_INITIAL_DAYS)
+                    for account in investment_accounts
+                )
+            
+            logger.info(f"Syncing investment transactions for institution {institution.name} from {start_date} to {end_date}")
             
             # Get investment transactions from Plaid
             transactions_data = self.plaid_service.get_investments_transactions(
-                institution.access_token, start_date, end_date
+                institution.access_token, start_date, end_date,
+                account_ids=[account.plaid_account_id for account in investment_accounts if account.plaid_account_id],
             )
             
-            # Ensure securities exist
-            securities_by_id = {}
-            for security_data in transactions_data['securities']:
-                security, created = Security.objects.update_or_create(
-                    plaid_security_id=security_data['security_id'],
-                    defaults={
-                        'name': security_data.get('name', ''),
-                        'ticker_symbol': security_data.get('ticker_symbol'),
-                        'cusip': security_data.get('cusip'),
-                        'isin': security_data.get('isin'),
-                        'sedol': security_data.get('sedol'),
-                        'type': security_data.get('type'),
-                        'close_price': security_data.get('close_price'),
-                        'close_price_as_of': security_data.get('close_price_as_of'),
-                        'institution_id': security_data.get('institution_id'),
-                        'institution_security_id': security_data.get('institution_security_id'),
-                        'is_cash_equivalent': security_data.get('is_cash_equivalent', False),
-                    }
-                )
-                securities_by_id[security_data['security_id']] = security
+            account_ids = {account.plaid_account_id: account.id for account in investment_accounts}
             
-            # Sync investment transactions
-            transactions_synced = 0
-            for trans_data in transactions_data['investment_transactions']:
-                try:
-                    account = Account.objects.get(
-                        plaid_account_id=trans_data['account_id']
-                    )
+            with db_transaction.atomic():
+                security_ids = security_master.upsert(transactions_data['securities'])
+                
+                transactions = {}
+                for trans_data in transactions_data['investment_transactions']:
+                    account_id = account_ids.get(trans_data['account_id'])
+                    if not account_id:
+                        logger.warning(f"Account not found for investment transaction: {trans_data['account_id']}")
+                        continue
                     
                     # Security is optional for some transaction types
-                    security = None
-                    if trans_data.get('security_id'):
-                        security = securities_by_id.get(trans_data['security_id'])
+                    security_id = security_ids.get(trans_data.get('security_id')) if trans_data.get('security_id') else None
                     
-                    transaction, created = InvestmentTransaction.objects.update_or_create(
+                    transactions[trans_data['investment_transaction_id']] = InvestmentTransaction(
                         plaid_investment_transaction_id=trans_data['investment_transaction_id'],
-                        defaults={
-                            'account': account,
-                            'security': security,
-                            'amount': trans_data['amount'],
-                            'quantity': trans_data.get('quantity'),
-                            'price': trans_data.get('price'),
-                            'fees': trans_data.get('fees'),
-                            'type': trans_data['type'],
-                            'subtype': trans_data['subtype'],
-                            'date': trans_data['date'],
-                            'name': trans_data['name'],
-                            'iso_currency_code': trans_data.get('iso_currency_code', 'USD'),
-                        }
+                        account_id=account_id,
+                        security_id=security_id,
+                        amount=trans_data['amount'],
+                        quantity=trans_data.get('quantity'),
+                        price=trans_data.get('price'),
+                        fees=trans_data.get('fees'),
+                        type=trans_data['type'],
+                        subtype=trans_data['subtype'],
+                        date=trans_data['date'],
+                        name=trans_data['name'],
+                        iso_currency_code=trans_data.get('iso_currency_code') or 'USD',
                     )
-                    
-                    if created:
-                        transactions_synced += 1
-                        logger.info(f"Created investment transaction: {transaction.name} - ${transaction.amount}")
-                    
-                except Account.DoesNotExist:
-                    logger.warning(f"Account not found for investment transaction: {trans_data['account_id']}")
-                except Exception as e:
-                    logger.error(f"Error processing investment transaction: {e}")
+                
+                existing = set(
+                    InvestmentTransaction.objects.filter(plaid_investment_transaction_id__in=transactions.keys())
+                    .values_list('plaid_investment_transaction_id', flat=True)
+                ) if transactions else set()
+                
+                InvestmentTransaction.objects.bulk_create(
+                    transactions.values(),
+                    update_conflicts=True,
+                    unique_fields=['plaid_investment_transaction_id'],
+                    update_fields=self.INVESTMENT_TRANSACTION_UPDATE_FIELDS,
+                )
+                
+                # Only move watermarks forward, and only for accounts with no gap between
+                # their watermark and start_date; an explicit backfill must not rewind them
+                covered = Q(investment_transactions_synced_through__gte=start_date - timedelta(days=1))
+                if start_date <= end_date - timedelta(days=self.INVESTMENT_SYNC_INITIAL_DAYS):
+                    covered |= Q(investment_transactions_synced_through__isnull=True)
+                Account.objects.filter(id__in=account_ids.values()).filter(covered).filter(
+                    Q(investment_transactions_synced_through__isnull=True) |
+                    Q(investment_transactions_synced_through__lt=end_date)
+                ).update(investment_transactions_synced_through=end_date)
             
-            logger.info(f"Investment transactions sync completed for {institution.name}. Total synced: {transactions_synced}")
+            PortfolioAnalyticsService.invalidate(institution.user_id)
+            transactions_synced = len(transactions) - len(existing)
+            SYNC_ROWS.labels('investment_transactions', 'added').inc(transactions_synced)
+            SYNC_ROWS.labels('investment_transactions', 'modified').inc(len(existing))
+            logger.info(
+                f"Investment transactions sync completed for {institution.name}. "
+                f"Total synced: {transactions_synced} new, {len(existing)} updated"
+            )
             return True
             
         except Exception as e:
@@ -796,259 +897,157 @@ class AnalyticsService:
 class RecurringTransactionDetectionService:
     """Service for auto-detecting recurring transactions from transaction history"""
     
-    def detect_recurring_transactions(self, user, min_occurrences=3, lookback_days=365):
+    UPCOMING_BILLS_HORIZON_DAYS = 90
+    
+    def detect_recurring_transactions(self, user, min_occurrences=MIN_OCCURRENCES, lookback_days=365):
         """
         Analyze transaction history and detect recurring patterns.
         
         Criteria for detecting recurring transactions:
         - Same merchant/vendor name (normalized)
-        - Similar amount (within 5% tolerance)
-        - Appears 3+ times in the lookback period
+        - Similar amount (within the clustering tolerance band)
+        - Appears min_occurrences+ times in the lookback period
         - Transactions are approximately evenly spaced
         """
-        from apps.finance.models import Transaction, RecurringTransaction, SpendingCategory
-        from django.db.models import Count, Avg, StdDev
-        from collections import defaultdict
-        from datetime import timedelta
-        import re
+        from apps.finance.models import Transaction
         
         logger.info(f"Starting recurring transaction detection for user {user.id}")
         
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=lookback_days)
         
-        # Get all expense transactions in the lookback period
-        transactions = Transaction.objects.filter(
+        # Only the columns detection needs, already in date order
+        rows = Transaction.objects.filter(
             account__institution__user=user,
             date__gte=start_date,
             date__lte=end_date,
             amount__gt=0,  # Only expenses
-        ).order_by('date')
-        
-        # Group transactions by normalized merchant/amount
-        pattern_groups = defaultdict(list)
-        
-        for tx in transactions:
-            # Normalize merchant name
-            merchant = self._normalize_merchant_name(tx.merchant_name or tx.name)
-            if not merchant or merchant == 'unknown':
-                continue
-            
-            # Round amount to nearest dollar for grouping
-            rounded_amount = round(float(tx.amount))
-            if rounded_amount <= 0:
-                continue
-            
-            key = f"{merchant}|{rounded_amount}"
-            pattern_groups[key].append(tx)
-        
-        # Analyze each group for recurring patterns
-        detected_recurring = []
+        ).order_by('date').values_list('date', 'amount', 'merchant_name', 'name', 'primary_category')
         
-        for key, txs in pattern_groups.items():
-            if len(txs) < min_occurrences:
-                continue
-            
-            merchant, amount_str = key.split('|')
-            amount = float(amount_str)
-            
-            # Check if transactions are evenly spaced (monthly pattern)
-            frequency = self._detect_frequency(txs)
-            if not frequency:
-                continue
-            
-            # Calculate average amount across occurrences
-            avg_amount = sum(float(tx.amount) for tx in txs) / len(txs)
-            
-            detected_recurring.append({
-                'merchant': self._format_merchant_name(merchant),
-                'amount': round(avg_amount, 2),
-                'frequency': frequency,
-                'occurrences': len(txs),
-                'first_date': txs[0].date,
-                'last_date': txs[-1].date,
-                'transactions': txs,
-                'primary_category': txs[0].primary_category,
-            })
+        detected_recurring = detect_recurring(rows.iterator(), min_occurrences=min_occurrences)
         
         logger.info(f"Detected {len(detected_recurring)} recurring transaction patterns")
         return detected_recurring
     
-    def create_recurring_transactions(self, user, auto_create=False):
+    def create_recurring_transactions(self, user, auto_create=False, min_occurrences=MIN_OCCURRENCES, lookback_days=365):
         """
         Detect and optionally create RecurringTransaction records for the user.
         Returns list of detected patterns.
+        
+        Existing records and categories are matched in memory, so this costs
+        a fixed number of queries however many patterns are found.
         """
         from apps.finance.models import RecurringTransaction, SpendingCategory
-        from dateutil.relativedelta import relativedelta
         
-        patterns = self.detect_recurring_transactions(user)
-        created_count = 0
+        patterns = self.detect_recurring_transactions(
+            user, min_occurrences=min_occurrences, lookback_days=lookback_days
+        )
+        if not patterns:
+            return patterns
+        
+        existing_by_merchant = {}
+        for existing in RecurringTransaction.objects.filter(user=user, merchant_name__isnull=False).values(
+            'id', 'merchant_name', 'amount', 'is_auto_detected'
+        ):
+            existing_by_merchant.setdefault(existing['merchant_name'].lower(), []).append(existing)
+        categories = list(SpendingCategory.objects.filter(user=user).values_list('id', 'name')) if auto_create else []
         
+        today = timezone.now().date()
+        to_flag = []
+        to_create = []
         for pattern in patterns:
-            # Check if similar recurring transaction already exists
-            existing = RecurringTransaction.objects.filter(
-                user=user,
-                merchant_name__iexact=pattern['merchant'],
-                amount__gte=pattern['amount'] * 0.95,
-                amount__lte=pattern['amount'] * 1.05,
-            ).first()
+            # Check if similar recurring transaction already exists (same merchant, amount within 5%)
+            existing = next((
+                row for row in existing_by_merchant.get(pattern['merchant'].lower(), [])
+                if pattern['amount'] * 0.95 <= float(row['amount']) <= pattern['amount'] * 1.05
+            ), None)
             
             if existing:
-                # Update existing with is_auto_detected flag
-                if not existing.is_auto_detected:
-                    existing.is_auto_detected = True
-                    existing.save()
-                pattern['existing_id'] = str(existing.id)
+                if not existing['is_auto_detected']:
+                    to_flag.append(existing['id'])
+                pattern['existing_id'] = str(existing['id'])
                 continue
             
             if auto_create:
-                # Calculate next expected date
-                last_date = pattern['last_date']
-                frequency = pattern['frequency']
-                
-                if frequency == 'monthly':
-                    next_date = last_date + relativedelta(months=1)
-                elif frequency == 'weekly':
-                    next_date = last_date + timedelta(days=7)
-                elif frequency == 'bi_weekly':
-                    next_date = last_date + timedelta(days=14)
-                elif frequency == 'quarterly':
-                    next_date = last_date + relativedelta(months=3)
-                elif frequency == 'yearly':
-                    next_date = last_date + relativedelta(years=1)
-                else:
-                    next_date = last_date + relativedelta(months=1)
-                
-                # Adjust next_date if it's in the past
-                while next_date < timezone.now().date():
-                    if frequency == 'monthly':
-                        next_date = next_date + relativedelta(months=1)
-                    elif frequency == 'weekly':
-                        next_date = next_date + timedelta(days=7)
-                    elif frequency == 'bi_weekly':
-                        next_date = next_date + timedelta(days=14)
-                    elif frequency == 'quarterly':
-                        next_date = next_date + relativedelta(months=3)
-                    elif frequency == 'yearly':
-                        next_date = next_date + relativedelta(years=1)
-                    else:
-                        next_date = next_date + relativedelta(months=1)
-                
                 # Try to match category
-                category = None
+                category_id = None
                 if pattern['primary_category']:
-                    category = SpendingCategory.objects.filter(
-                        user=user,
-                        name__icontains=pattern['primary_category'].replace('_', ' ')
-                    ).first()
+                    needle = pattern['primary_category'].replace('_', ' ').lower()
+                    category_id = next((pk for pk, name in categories if needle in name.lower()), None)
                 
-                # Create the recurring transaction
-                recurring = RecurringTransaction.objects.create(
+                recurring = RecurringTransaction(
                     user=user,
                     name=pattern['merchant'],
-                    amount=pattern['amount'],
-                    frequency=frequency,
+                    amount=Decimal(str(pattern['amount'])),
+                    frequency=pattern['frequency'],
                     start_date=pattern['first_date'],
-                    next_date=next_date,
-                    category=category,
+                    next_date=next_occurrence(pattern['last_date'], pattern['frequency'], today),
+                    category_id=category_id,
                     merchant_name=pattern['merchant'],
                     is_active=True,
                     is_auto_detected=True,
                     notes=f"Auto-detected from {pattern['occurrences']} transactions",
                 )
+                to_create.append(recurring)
                 pattern['created_id'] = str(recurring.id)
-                created_count += 1
         
-        logger.info(f"Created {created_count} new recurring transaction records")
+        if to_flag or to_create:
+            with db_transaction.atomic():
+                if to_flag:
+                    RecurringTransaction.objects.filter(id__in=to_flag).update(is_auto_detected=True, updated_at=timezone.now())
+                if to_create:
+                    RecurringTransaction.objects.bulk_create(to_create)
+        
+        logger.info(f"Created {len(to_create)} new recurring transaction records")
         return patterns
     
-    def _normalize_merchant_name(self, name):
-        """Normalize merchant name for grouping"""
-        if not name:
-            return 'unknown'
-        
-        # Convert to lowercase
-        name = name.lower().strip()
-        
-        # Remove common suffixes and numbers
-        name = re.sub(r'\s*(#\d+|\d{4,}|store\s*\d+|loc\s*\d+).*$', '', name)
-        
-        # Remove special characters but keep spaces and basic punctuation
-        name = re.sub(r'[^\w\s\'-]', '', name)
-        
-        # Normalize whitespace
-        name = re.sub(r'\s+', ' ', name).strip()
-        
-        # Truncate to first 40 chars for grouping
-        if len(name) > 40:
-            name = name[:40]
-        
-        return name
+    @staticmethod
+    def _projection_key(user_id):
+        return f"upcoming_bills:projected_on:{user_id}"
     
-    def _format_merchant_name(self, name):
-        """Format merchant name for display"""
-        if not name:
-            return 'Unknown'
-        
-        # Title case but preserve common abbreviations
-        words = name.split()
-        formatted = []
-        for word in words:
-            if word.upper() in ['ATM', 'LLC', 'INC', 'CO', 'LTD']:
-                formatted.append(word.upper())
-            else:
-                formatted.append(word.capitalize())
+    def ensure_upcoming_bills(self, user):
+        """
+        Refresh the projection if it was not built today.
         
-        return ' '.join(formatted)
-    
-    def _detect_frequency(self, transactions):
+        The horizon moves forward every day, so a projection left alone by the
+        scheduled detect_recurring run would stop short; readers call this
+        first and pay for at most one rebuild per user per day.
         """
-        Analyze transaction dates to determine frequency.
-        Returns frequency string or None if pattern is irregular.
+        if cache.get(self._projection_key(user.id)) != timezone.now().date().isoformat():
+            self.refresh_upcoming_bills(user)
+    
+    def refresh_upcoming_bills(self, user, horizon_days=None):
         """
-        from statistics import mean, stdev
-        
-        if len(transactions) < 3:
-            return None
-        
-        # Calculate intervals between consecutive transactions
-        intervals = []
-        sorted_txs = sorted(transactions, key=lambda x: x.date)
-        
-        for i in range(1, len(sorted_txs)):
-            delta = (sorted_txs[i].date - sorted_txs[i-1].date).days
-            intervals.append(delta)
+        Rebuild the user's UpcomingBill projection for the next ``horizon_days``.
         
-        if not intervals:
-            return None
-        
-        avg_interval = mean(intervals)
+        Returns the number of projected occurrences.
+        """
+        from apps.finance.models import RecurringTransaction, UpcomingBill
         
-        # Determine frequency based on average interval
-        # Allow some variance for human billing cycles
-        if 6 <= avg_interval <= 8:
-            return 'weekly'
-        elif 13 <= avg_interval <= 16:
-            return 'bi_weekly'
-        elif 27 <= avg_interval <= 33:
-            return 'monthly'
-        elif 85 <= avg_interval <= 100:
-            return 'quarterly'
-        elif 180 <= avg_interval <= 200:
-            return 'semi_annually'
-        elif 350 <= avg_interval <= 380:
-            return 'yearly'
+        today = timezone.now().date()
+        horizon = today + timedelta(days=horizon_days or self.UPCOMING_BILLS_HORIZON_DAYS)
         
-        # If interval is less than 40 days and appears regularly, consider monthly
-        if avg_interval < 40 and len(intervals) >= 2:
-            # Check if variance is acceptable (within 25%)
-            try:
-                interval_stdev = stdev(intervals)
-                if interval_stdev / avg_interval < 0.25:
-                    return 'monthly'
-            except:
-                pass
+        bills = []
+        for recurring in RecurringTransaction.objects.filter(user=user, is_active=True, next_date__lte=horizon).values(
+            'id', 'name', 'amount', 'is_income', 'frequency', 'next_date', 'end_date'
+        ):
+            first = recurring['next_date']
+            if first < today:
+                # next_date was never advanced past a missed occurrence
+                first = next_occurrence(first, recurring['frequency'], today)
+            end = min(horizon, recurring['end_date']) if recurring['end_date'] else horizon
+            for due_date in occurrences_between(first, recurring['frequency'], end):
+                bills.append(UpcomingBill(
+                    user=user,
+                    recurring_transaction_id=recurring['id'],
+                    name=recurring['name'],
+                    amount=recurring['amount'],
+                    is_income=recurring['is_income'],
+                    due_date=due_date,
+                ))
         
-        return None
-
+        with db_transaction.atomic():
+            UpcomingBill.objects.filter(user=user).delete()
+            UpcomingBill.objects.bulk_create(bills)
+        cache.set(self._projection_key(user.id), today.isoformat(), 24 * 60 * 60)
+        return len(bills)
@@ -0,0 +1,522 @@
+"""
+Streaming CSV Import Service
+
+Imports Fidelity-style holdings and transaction exports without loading the
+whole upload into memory. The file is decoded incrementally from its chunks,
+headers are normalised once into a column-index map, rows are produced by a
+generator and transactions are written in fixed-size batches. Holdings files
+are small snapshots, so they are collected and upserted in one transaction.
+"""
+import codecs
+import csv
+import functools
+import logging
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dateutil import parser as date_parser
+from django.db import transaction
+from django.utils import timezone
+from samaanai.metrics import IMPORT_ROWS, IMPORT_SECONDS
+
+from ..models import Account, Holding, Security, Transaction
+from .portfolio import PortfolioAnalyticsService
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+
+EMPTY_MONEY_VALUES = ('--', 'N/A', '$--')
+EMPTY_QUANTITY_VALUES = ('--', 'N/A')
+
+HOLDINGS_COLUMNS = ('current value', 'cost basis', 'last price', 'current_value')
+
+
+def parse_money(value: Optional[str], default: Optional[Decimal] = None) -> Optional[Decimal]:
+    """Parse '$1,234.56' / '(12.00)' style values; returns ``default`` for blanks and placeholders."""
+    if not value or value in EMPTY_MONEY_VALUES:
+        return default
+    try:
+        clean = value.replace('$', '').replace(',', '').replace('(', '-').replace(')', '').strip()
+        return Decimal(clean) if clean else default
+    except (InvalidOperation, ValueError):
+        return default
+
+
+def parse_quantity(value: Optional[str]) -> Decimal:
+    """Parse a share quantity; blanks and placeholders count as zero."""
+    if not value or value in EMPTY_QUANTITY_VALUES:
+        return Decimal('0')
+    try:
+        clean = value.replace(',', '').strip()
+        return Decimal(clean) if clean else Decimal('0')
+    except (InvalidOperation, ValueError):
+        return Decimal('0')
+
+
+def iter_decoded_lines(uploaded_file, encoding: str = 'utf-8-sig', chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield text lines from an uploaded file, decoding chunk by chunk.
+
+    Lines keep their terminators and are split on '\\n' only, which is what
+    ``csv.reader`` expects for quoted fields spanning lines. ``utf-8-sig``
+    strips a leading BOM.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    if hasattr(uploaded_file, 'chunks'):
+        chunks = uploaded_file.chunks(chunk_size)
+    else:
+        chunks = iter(lambda: uploaded_file.read(chunk_size), b'')
+
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        if '\n' not in pending:
+            continue
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line + '\n'
+
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+class ColumnMap:
+    """Header name -> column index lookup, built once from the header row."""
+
+    def __init__(self, header: List[str]):
+        # Later duplicates win, matching what a lowercased row dict used to do
+        self.indexes = {name.lower().strip(): index for index, name in enumerate(header)}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.indexes
+
+    def has_any(self, names) -> bool:
+        return any(name in self.indexes for name in names)
+
+    def index_for(self, *names: str) -> Optional[int]:
+        """Index of the first alias present in the header."""
+        for name in names:
+            if name in self.indexes:
+                return self.indexes[name]
+        return None
+
+    def getter(self, *names: str):
+        """Return a function that pulls the aliased column's stripped value from a row."""
+        index = self.index_for(*names)
+
+        def get(row: List[str]) -> str:
+            if index is None or index >= len(row):
+                return ''
+            return (row[index] or '').strip()
+
+        return get
+
+
+def read_csv(uploaded_file) -> Tuple[Optional[ColumnMap], Iterator[Tuple[int, List[str]]]]:
+    """
+    Read the header and return ``(columns, rows)``.
+
+    ``rows`` lazily yields ``(row_number, cells)`` for non-blank data rows,
+    numbered like ``csv.DictReader`` records (header is row 1). ``columns`` is
+    None when the file has no data rows.
+    """
+    reader = csv.reader(iter_decoded_lines(uploaded_file))
+    header = next(reader, None)
+    if not header:
+        return None, iter(())
+
+    rows = ((row_num, row) for row_num, row in enumerate(reader, start=2) if any(row))
+    first = next(rows, None)
+    if first is None:
+        return None, iter(())
+    return ColumnMap(header), chain([first], rows)
+
+
+def detect_import_type(columns: ColumnMap) -> str:
+    return 'holdings' if columns.has_any(HOLDINGS_COLUMNS) else 'transactions'
+
+
+def _observe_import(kind: str):
+    """Record the duration and row counts of an importer method that returns the result dict."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            IMPORT_SECONDS.labels('csv', kind).observe(time.perf_counter() - start)
+            IMPORT_ROWS.labels('csv', 'created').inc(result[f'{kind}_created'])
+            IMPORT_ROWS.labels('csv', 'updated').inc(result[f'{kind}_updated'])
+            IMPORT_ROWS.labels('csv', 'error').inc(len(result['errors']))
+            return result
+        return wrapper
+    return decorator
+
+
+class FidelityCSVImporter:
+    """
+    Import a Fidelity holdings or transactions export into a manual institution.
+
+    Usage::
+
+        columns, rows = read_csv(csv_file)
+        FidelityCSVImporter(institution, result).import_transactions(columns, rows)
+    """
+
+    TRANSACTION_UPDATE_FIELDS = [
+        'account', 'amount', 'iso_currency_code', 'name', 'merchant_name',
+        'primary_category', 'date', 'pending', 'is_manual', 'updated_at',
+    ]
+
+    SECURITY_UPDATE_FIELDS = [
+        'name', 'ticker_symbol', 'type', 'close_price', 'close_price_as_of',
+        'is_cash_equivalent', 'updated_at',
+    ]
+    HOLDING_UPDATE_FIELDS = [
+        'quantity', 'institution_price', 'institution_price_as_of', 'institution_value',
+        'cost_basis', 'iso_currency_code', 'updated_at',
+    ]
+
+    def __init__(self, institution, result: Dict, batch_size: int = BATCH_SIZE):
+        self.institution = institution
+        self.result = result
+        self.batch_size = batch_size
+        self.accounts_cache: Dict[str, Account] = {}
+
+    def _account_number(self, row: List[str], get_account_number) -> str:
+        account_number = get_account_number(row)
+        if not account_number:
+            # Some exports put the account number in the first column without a header
+            first_val = row[0] if row else ''
+            if first_val and first_val.replace('-', '').isdigit():
+                account_number = first_val
+        return account_number
+
+    def _get_account(self, account_number: str, defaults: Dict) -> Tuple[Account, bool]:
+        account, created = Account.objects.get_or_create(
+            plaid_account_id=f"manual_{account_number}",
+            defaults={
+                'institution': self.institution,
+                'mask': account_number[-4:] if len(account_number) >= 4 else account_number,
+                'type': 'investment',
+                'subtype': 'brokerage',
+                'current_balance': 0,
+                'is_active': True,
+                'is_selected': True,
+                **defaults,
+            }
+        )
+        # Re-attach accounts orphaned from a previous manual institution
+        if not created and account.institution_id != self.institution.id:
+            account.institution = self.institution
+            account.save()
+        self.accounts_cache[account_number] = account
+        return account, created
+
+    @_observe_import('holdings')
+    def import_holdings(self, columns: ColumnMap, rows) -> Dict:
+        """
+        Import a positions export.
+
+        Rows are parsed first, then accounts, securities and holdings are each
+        upserted with one lookup query and one bulk write, inside a single
+        transaction. Holdings of the imported accounts that are missing from the
+        file are deleted. Account balances are the sum of the file's position
+        and cash values.
+        """
+        get_account_number = columns.getter('account number', 'account')
+        get_account_name = columns.getter('account name', 'account type')
+        get_symbol = columns.getter('symbol', 'ticker')
+        get_description = columns.getter('description', 'security description', 'name')
+        get_quantity = columns.getter('quantity', 'shares')
+        get_last_price = columns.getter('last price', 'price')
+        get_current_value = columns.getter('current value', 'value')
+        get_cost_basis = columns.getter('cost basis total', 'cost basis', 'cost basis per share')
+        has_account_name = columns.index_for('account name', 'account type') is not None
+
+        account_names: Dict[str, str] = {}
+        securities: Dict[str, Security] = {}
+        positions: Dict[Tuple[str, str], Dict] = {}
+        cash: Dict[str, Decimal] = {}
+        today = timezone.now().date()
+
+        for row_num, row in rows:
+            try:
+                account_number = self._account_number(row, get_account_number)
+                if not account_number:
+                    continue
+                if account_number not in account_names:
+                    account_names[account_number] = get_account_name(row) if has_account_name else 'Fidelity Account'
+
+                symbol = get_symbol(row)
+                description = get_description(row)
+
+                # Skip empty rows; cash rows only count towards the balance
+                if not symbol or symbol in ['--', 'N/A', 'Pending Activity']:
+                    continue
+                if 'CASH' in symbol.upper():
+                    cash[account_number] = cash.get(account_number, Decimal('0')) + parse_money(
+                        get_current_value(row), default=Decimal('0')
+                    )
+                    continue
+
+                quantity = parse_quantity(get_quantity(row))
+                last_price = parse_money(get_last_price(row))
+                current_value = parse_money(get_current_value(row))
+                cost_basis = parse_money(get_cost_basis(row))
+
+                if quantity == 0 and not current_value:
+                    continue  # Skip empty holdings
+
+                plaid_security_id = f"manual_{symbol}"
+                securities[plaid_security_id] = Security(
+                    plaid_security_id=plaid_security_id,
+                    name=description or symbol,
+                    ticker_symbol=symbol,
+                    type='equity',
+                    close_price=last_price,
+                    close_price_as_of=today,
+                    is_cash_equivalent='MONEY MARKET' in description.upper() if description else False,
+                )
+
+                # A repeated position replaces the earlier row
+                positions[(account_number, plaid_security_id)] = {
+                    'quantity': quantity,
+                    'institution_price': last_price or Decimal('0'),
+                    'institution_value': current_value or (quantity * (last_price or Decimal('0'))),
+                    'cost_basis': cost_basis,
+                }
+
+            except Exception as e:
+                self.result['errors'].append(f"Row {row_num}: {str(e)}")
+
+        if not account_names:
+            return self.result
+
+        with transaction.atomic():
+            accounts = self._upsert_accounts(account_names)
+            security_ids = self._upsert_securities(securities)
+
+            existing_holdings = {
+                (account_id, security_id): holding_id
+                for holding_id, account_id, security_id in Holding.objects.filter(
+                    account__in=accounts.values()
+                ).values_list('id', 'account_id', 'security_id')
+            }
+
+            holdings = []
+            balances = {account_number: cash.get(account_number, Decimal('0')) for account_number in accounts}
+            for (account_number, plaid_security_id), values in positions.items():
+                account = accounts[account_number]
+                security_id = security_ids[plaid_security_id]
+                holding = Holding(
+                    account=account,
+                    security_id=security_id,
+                    institution_price_as_of=today,
+                    iso_currency_code='USD',
+                    **values,
+                )
+                existing_id = existing_holdings.pop((account.id, security_id), None)
+                if existing_id:
+                    holding.id = existing_id
+                    self.result['holdings_updated'] += 1
+                else:
+                    self.result['holdings_created'] += 1
+                holdings.append(holding)
+                balances[account_number] += values['institution_value']
+
+            Holding.objects.bulk_create(
+                holdings,
+                update_conflicts=True,
+                unique_fields=['account', 'security'],
+                update_fields=self.HOLDING_UPDATE_FIELDS,
+            )
+            if existing_holdings:
+                # Positions that were sold since the last export
+                Holding.objects.filter(id__in=existing_holdings.values()).delete()
+                self.result['holdings_removed'] = len(existing_holdings)
+
+            now = timezone.now()
+            for account_number, account in accounts.items():
+                account.current_balance = balances[account_number]
+                account.updated_at = now
+            Account.objects.bulk_update(accounts.values(), ['current_balance', 'updated_at'])
+
+        PortfolioAnalyticsService.invalidate(self.institution.user_id)
+
+        return self.result
+
+    def _upsert_accounts(self, account_names: Dict[str, str]) -> Dict[str, Account]:
+        """Fetch or create the manual accounts for the given numbers (one query, one insert)."""
+        existing = {
+            account.plaid_account_id: account
+            for account in Account.objects.filter(
+                plaid_account_id__in=[f"manual_{number}" for number in account_names]
+            )
+        }
+
+        accounts, to_create, orphaned = {}, [], []
+        for account_number, account_name in account_names.items():
+            account = existing.get(f"manual_{account_number}")
+            if account is None:
+                account = Account(
+                    institution=self.institution,
+                    plaid_account_id=f"manual_{account_number}",
+                    name=account_name or f"Fidelity {account_number[-4:]}",
+                    official_name=account_name,
+                    mask=account_number[-4:] if len(account_number) >= 4 else account_number,
+                    type='investment',
+                    subtype='brokerage',
+                    current_balance=0,
+                    is_active=True,
+                    is_selected=True,
+                )
+                to_create.append(account)
+                self.result['accounts_created'] += 1
+            else:
+                # Re-attach accounts orphaned from a previous manual institution
+                if account.institution_id != self.institution.id:
+                    account.institution = self.institution
+                    orphaned.append(account)
+                self.result['accounts_updated'] += 1
+            accounts[account_number] = account
+
+        Account.objects.bulk_create(to_create)
+        if orphaned:
+            Account.objects.bulk_update(orphaned, ['institution'])
+        self.accounts_cache.update(accounts)
+        return accounts
+
+    def _upsert_securities(self, securities: Dict[str, Security]) -> Dict[str, uuid.UUID]:
+        """Upsert securities by plaid_security_id; returns plaid_security_id -> pk."""
+        existing = dict(
+            Security.objects.filter(plaid_security_id__in=securities.keys())
+            .values_list('plaid_security_id', 'id')
+        )
+        for plaid_security_id, security in securities.items():
+            # Reuse the stored pk so the in-memory objects match the rows after the upsert
+            if plaid_security_id in existing:
+                security.id = existing[plaid_security_id]
+
+        Security.objects.bulk_create(
+            securities.values(),
+            update_conflicts=True,
+            unique_fields=['plaid_security_id'],
+            update_fields=self.SECURITY_UPDATE_FIELDS,
+        )
+        return {plaid_security_id: security.id for plaid_security_id, security in securities.items()}
+
+    @_observe_import('transactions')
+    def import_transactions(self, columns: ColumnMap, rows) -> Dict:
+        """Import an activity export, writing transactions in batches of ``batch_size``."""
+        get_account_number = columns.getter('account number', 'account')
+        get_date = columns.getter('date', 'run date', 'trade date')
+        get_action = columns.getter('action', 'type', 'transaction type')
+        get_symbol = columns.getter('symbol', 'ticker')
+        get_description = columns.getter('description', 'security description')
+        get_amount = columns.getter('amount', 'net amount')
+
+        batch: Dict[str, Transaction] = {}
+
+        for row_num, row in rows:
+            try:
+                account_number = self._account_number(row, get_account_number)
+                if not account_number:
+                    continue
+
+                if account_number not in self.accounts_cache:
+                    _, created = self._get_account(account_number, {'name': f"Fidelity {account_number[-4:]}"})
+                    if created:
+                        self.result['accounts_created'] += 1
+                account = self.accounts_cache[account_number]
+
+                date_str = get_date(row)
+                if not date_str or date_str in ['--', 'N/A']:
+                    continue
+                try:
+                    tx_date = date_parser.parse(date_str).date()
+                except (ValueError, OverflowError):
+                    continue
+
+                action = get_action(row)
+                symbol = get_symbol(row)
+                description = get_description(row)
+                amount = parse_money(get_amount(row), default=Decimal('0'))
+
+                action_upper = action.upper() if action else ''
+                category = self.categorize_action(action_upper)
+                is_buy = 'BUY' in action_upper or 'PURCHASE' in action_upper
+
+                tx_id = f"manual_{account_number}_{tx_date}_{symbol or 'cash'}_{abs(amount)}"
+                if tx_id in batch:
+                    # Same row repeated in the file; the later one wins like an update would
+                    self.result['transactions_updated'] += 1
+                batch[tx_id] = Transaction(
+                    account=account,
+                    plaid_transaction_id=tx_id,
+                    amount=abs(amount) if is_buy or amount > 0 else -abs(amount),
+                    iso_currency_code='USD',
+                    name=description or action or 'Transaction',
+                    merchant_name='Fidelity',
+                    primary_category=category,
+                    date=tx_date,
+                    pending=False,
+                    is_manual=True,
+                )
+
+            except Exception as e:
+                self.result['errors'].append(f"Row {row_num}: {str(e)}")
+                continue
+
+            if len(batch) >= self.batch_size:
+                self._flush_transactions(batch, row_num)
+                batch = {}
+
+        if batch:
+            self._flush_transactions(batch, row_num)
+
+        return self.result
+
+    def _flush_transactions(self, batch: Dict[str, Transaction], row_num: int):
+        """Upsert one batch: one query to count existing ids, one insert-or-update."""
+        try:
+            with transaction.atomic():
+                self._write_transactions(batch)
+        except Exception as e:
+            logger.error(f"Error writing CSV transactions ending at row {row_num}: {str(e)}")
+            self.result['errors'].append(f"Rows up to {row_num}: {len(batch)} transactions not saved: {str(e)}")
+
+    def _write_transactions(self, batch: Dict[str, Transaction]):
+        existing = set(
+            Transaction.objects.filter(plaid_transaction_id__in=batch.keys())
+            .values_list('plaid_transaction_id', flat=True)
+        )
+        Transaction.objects.bulk_create(
+            batch.values(),
+            update_conflicts=True,
+            unique_fields=['plaid_transaction_id'],
+            update_fields=self.TRANSACTION_UPDATE_FIELDS,
+        )
+        self.result['transactions_created'] += len(batch) - len(existing)
+        self.result['transactions_updated'] += len(existing)
+
+    @staticmethod
+    def categorize_action(action_upper: str) -> str:
+        if 'BUY' in action_upper or 'PURCHASE' in action_upper:
+            return 'INVESTMENT_BUY'
+        if 'SELL' in action_upper or 'SOLD' in action_upper:
+            return 'INVESTMENT_SELL'
+        if 'DIVIDEND' in action_upper or 'DIV' in action_upper:
+            return 'DIVIDEND'
+        if 'INTEREST' in action_upper:
+            return 'INTEREST'
+        if 'TRANSFER' in action_upper:
+            return 'TRANSFER'
+        if 'FEE' in action_upper:
+            return 'BANK_FEES'
+        return 'OTHER'
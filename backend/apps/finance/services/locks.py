@@ -0,0 +1,156 @@
+"""
+Sync Locks
+
+Institution syncs can start from several places at once: the sync endpoints,
+the webhook worker, linking a new item and the ``sync_transactions`` command.
+Two of them paging the same Plaid cursor would double-write, so every sync
+takes a named lock first.
+
+On PostgreSQL the lock is a session-level advisory lock, which the server
+drops by itself if the process dies. Other databases (SQLite in tests) use
+``cache.add`` with a timeout, which is only as shared as the configured cache.
+
+A caller that finds the lock taken does not start a second run. It flags the
+sync as dirty, so the running sync goes round once more when it finishes and
+picks up whatever the caller came for. Then it joins the run: it waits for the
+lock to be released, and if the flag was set too late for the holder to see,
+it runs the sync itself. HTTP entry points pass ``wait=False`` and get
+``SyncInProgress`` straight away, since a web worker must not block for the
+length of someone else's sync. The flag lives in the cache.
+"""
+import functools
+import hashlib
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 30 * 60
+# Well under gunicorn's 300s worker timeout, for callers that do wait
+JOIN_TIMEOUT = 60
+POLL_INTERVAL = 0.5
+
+
+class SyncInProgress(Exception):
+    """Raised by ``exclusive_sync`` methods called with ``wait=False`` while a run holds the lock."""
+
+
+def _advisory_key(name: str) -> int:
+    """Stable signed 64-bit key for ``pg_try_advisory_lock``."""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+class SyncLock:
+    """A named, non-blocking, cross-process lock."""
+
+    def __init__(self, name: str, timeout: int = LOCK_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._token = None
+        self._use_advisory = connection.vendor == 'postgresql'
+
+    def acquire(self) -> bool:
+        if self._use_advisory:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [_advisory_key(self.name)])
+                acquired = cursor.fetchone()[0]
+        else:
+            self._token = uuid.uuid4().hex
+            acquired = cache.add(f"sync_lock:{self.name}", self._token, self.timeout)
+        return bool(acquired)
+
+    def release(self):
+        if self._use_advisory:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [_advisory_key(self.name)])
+        elif cache.get(f"sync_lock:{self.name}") == self._token:
+            # Only delete our own entry; after a timeout another holder may own the key
+            cache.delete(f"sync_lock:{self.name}")
+
+    def wait(self, timeout: float = JOIN_TIMEOUT) -> bool:
+        """Block until nobody holds the lock; returns False if ``timeout`` passes first."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.acquire():
+                self.release()
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+
+
+@contextmanager
+def sync_lock(name: str, timeout: int = LOCK_TIMEOUT):
+    """Try to take the named lock; yields whether it was acquired and releases it on exit."""
+    lock = SyncLock(name, timeout)
+    acquired = lock.acquire()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lock.release()
+
+
+def _institution_lock_name(institution_id, scope: str) -> str:
+    return f"institution:{institution_id}:{scope}"
+
+
+def _dirty_key(name: str) -> str:
+    return f"sync_dirty:{name}"
+
+
+def institution_sync_lock(institution_id, scope: str = 'transactions', timeout: int = LOCK_TIMEOUT):
+    """Lock for one kind of sync (transactions, holdings, ...) of one institution."""
+    return sync_lock(_institution_lock_name(institution_id, scope), timeout)
+
+
+def exclusive_sync(scope: str, join_timeout: float = JOIN_TIMEOUT):
+    """
+    Decorate a ``method(self, institution, ...)`` so only one run per institution and scope happens at a time.
+
+    A call that finds a run in progress flags it to run again. With
+    ``wait=False`` it then raises ``SyncInProgress``. Otherwise it waits for
+    the run to finish and returns None.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, institution, *args, wait: bool = True, **kwargs):
+            name = _institution_lock_name(institution.id, scope)
+
+            def run():
+                with sync_lock(name) as acquired:
+                    if not acquired:
+                        return False, None
+                    # Requests flagged before this run starts are covered by it
+                    cache.delete(_dirty_key(name))
+                    while True:
+                        result = method(self, institution, *args, **kwargs)
+                        if not cache.delete(_dirty_key(name)):
+                            return True, result
+                        logger.info(f"More {scope} sync requested for institution {institution.id} during the run; syncing again")
+
+            ran, result = run()
+            if ran:
+                return result
+
+            cache.set(_dirty_key(name), True, LOCK_TIMEOUT)
+            if not wait:
+                raise SyncInProgress(f"{scope} sync already running for institution {institution.id}")
+
+            logger.info(f"{scope} sync already running for institution {institution.id}; joining existing run")
+            if not SyncLock(name).wait(join_timeout):
+                logger.warning(f"Gave up waiting for the running {scope} sync of institution {institution.id}")
+                return None
+            if cache.get(_dirty_key(name)):
+                # Flagged after the holder's last check, so nobody has synced for this call yet
+                ran, result = run()
+                if ran:
+                    return result
+            return None
+        return wrapper
+    return decorator
@@ -0,0 +1,197 @@
+"""
+Portfolio Analytics Service
+
+Aggregates a user's investment holdings and activity in a handful of queries:
+allocation by security type and by account, cost basis and unrealized P&L,
+period returns, and dividend income by month. Position-level work is done with
+SQL aggregates. Period returns are time-weighted from daily values rebuilt
+from PriceHistory; without stored closes there is no opening valuation and the
+return is None. Results are cached per user until the next investment sync
+bumps the user's portfolio version.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Abs, TruncMonth
+from django.utils import timezone
+
+from ..models import Holding, InvestmentTransaction
+from .position_history import PositionHistoryEngine
+
+logger = logging.getLogger(__name__)
+
+DIVIDEND_SUBTYPES = ('dividend', 'qualified dividend', 'non-qualified dividend')
+
+
+def _round(value, places: int = 2) -> Optional[float]:
+    return None if value is None else round(float(value), places)
+
+
+def _percent(value) -> Optional[float]:
+    return None if value is None else round(value * 100, 2)
+
+
+class PortfolioAnalyticsService:
+    """Per-user and per-account portfolio analytics, cached until the next sync."""
+
+    CACHE_TIMEOUT = 24 * 60 * 60
+    DEFAULT_PERIOD_DAYS = 365
+
+    def __init__(self, user):
+        self.user = user
+
+    @staticmethod
+    def _version_key(user_id) -> str:
+        return f"portfolio_analytics:version:{user_id}"
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """Drop cached analytics for a user; called after holdings or investment syncs."""
+        cache.set(cls._version_key(user_id), uuid.uuid4().hex, None)
+
+    def _cache_key(self, period_days: int) -> str:
+        version = cache.get(self._version_key(self.user.id))
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.set(self._version_key(self.user.id), version, None)
+        return f"portfolio_analytics:{self.user.id}:{version}:{period_days}"
+
+    def holdings(self):
+        return Holding.objects.filter(account__institution__user=self.user)
+
+    def investment_transactions(self):
+        return InvestmentTransaction.objects.filter(account__institution__user=self.user)
+
+    def analyze(self, period_days: int = DEFAULT_PERIOD_DAYS, use_cache: bool = True) -> Dict:
+        """Return totals, allocations, per-account results, returns and dividends in one dict."""
+        if not use_cache:
+            return self._analyze(period_days)
+
+        key = self._cache_key(period_days)
+        result = cache.get(key)
+        if result is None:
+            result = self._analyze(period_days)
+            cache.set(key, result, self.CACHE_TIMEOUT)
+        return result
+
+    def _analyze(self, period_days: int) -> Dict:
+        end_date = timezone.now().date()
+        start_date = end_date - timedelta(days=period_days)
+        has_cost = Q(cost_basis__isnull=False) & ~Q(cost_basis=0)
+
+        # One grouped query covers allocation, totals and P&L at every level
+        rows = list(
+            self.holdings()
+            .values('account_id', 'account__name', 'account__custom_name', 'security__type')
+            .annotate(
+                value=Sum('institution_value'),
+                cost_total=Sum('cost_basis', filter=has_cost),
+                value_with_cost=Sum('institution_value', filter=has_cost),
+                positions=Count('id'),
+            )
+            .order_by()
+        )
+
+        accounts: Dict = {}
+        by_type: Dict[str, Decimal] = {}
+        for row in rows:
+            account = accounts.setdefault(row['account_id'], {
+                'account_id': str(row['account_id']),
+                'name': row['account__custom_name'] or row['account__name'],
+                'value': Decimal('0'),
+                'cost_basis': Decimal('0'),
+                'value_with_cost': Decimal('0'),
+                'positions': 0,
+            })
+            account['value'] += row['value'] or 0
+            account['cost_basis'] += row['cost_total'] or 0
+            account['value_with_cost'] += row['value_with_cost'] or 0
+            account['positions'] += row['positions']
+            security_type = row['security__type'] or 'other'
+            by_type[security_type] = by_type.get(security_type, Decimal('0')) + (row['value'] or 0)
+
+        total_value = sum((a['value'] for a in accounts.values()), Decimal('0'))
+        total_cost = sum((a['cost_basis'] for a in accounts.values()), Decimal('0'))
+        total_value_with_cost = sum((a['value_with_cost'] for a in accounts.values()), Decimal('0'))
+
+        dividends = self._dividends(start_date, end_date)
+        # Returns need stored price history to value past positions; None without it
+        twr = PositionHistoryEngine(self.user).returns(start_date, end_date) if accounts else None
+
+        account_results = []
+        for account_id, account in accounts.items():
+            account_results.append({
+                'account_id': account['account_id'],
+                'name': account['name'],
+                'total_value': _round(account['value']),
+                'allocation_percent': _round(account['value'] / total_value * 100) if total_value else None,
+                'positions': account['positions'],
+                **self._pnl(account['value_with_cost'], account['cost_basis']),
+                'period_return_percent': _percent(twr['by_account'].get(account_id)) if twr else None,
+                'dividend_income': _round(dividends['by_account'].get(account_id, 0.0)),
+            })
+        account_results.sort(key=lambda a: a['total_value'] or 0, reverse=True)
+
+        return {
+            'as_of': end_date.isoformat(),
+            'period_start': start_date.isoformat(),
+            'totals': {
+                'total_value': _round(total_value),
+                'positions': sum(a['positions'] for a in accounts.values()),
+                **self._pnl(total_value_with_cost, total_cost),
+                'period_return_percent': _percent(twr['total']) if twr else None,
+                'return_method': 'time_weighted' if twr else None,
+                'dividend_income': _round(dividends['total']),
+            },
+            'allocation': {
+                'by_security_type': [
+                    {
+                        'security_type': security_type,
+                        'value': _round(value),
+                        'percent': _round(value / total_value * 100) if total_value else None,
+                    }
+                    for security_type, value in sorted(by_type.items(), key=lambda item: item[1], reverse=True)
+                ],
+                'by_account': [
+                    {'account_id': a['account_id'], 'name': a['name'],
+                     'value': a['total_value'], 'percent': a['allocation_percent']}
+                    for a in account_results
+                ],
+            },
+            'accounts': account_results,
+            'dividends_by_month': dividends['by_month'],
+        }
+
+    @staticmethod
+    def _pnl(value_with_cost: Decimal, cost_basis: Decimal) -> Dict:
+        """Unrealized P&L over positions that report a cost basis."""
+        if not cost_basis:
+            return {'cost_basis': None, 'unrealized_gain_loss': None, 'unrealized_gain_loss_percent': None}
+        gain = value_with_cost - cost_basis
+        return {
+            'cost_basis': _round(cost_basis),
+            'unrealized_gain_loss': _round(gain),
+            'unrealized_gain_loss_percent': _round(gain / cost_basis * 100),
+        }
+
+    def _dividends(self, start_date, end_date) -> Dict:
+        """Dividend income by month and by account; Plaid reports income as negative amounts."""
+        dividends = self.investment_transactions().filter(
+            Q(type='dividend') | Q(subtype__in=DIVIDEND_SUBTYPES),
+            date__gte=start_date, date__lte=end_date,
+        )
+        by_month = [
+            {'month': row['month'].strftime('%Y-%m'), 'amount': _round(row['income'])}
+            for row in dividends.annotate(month=TruncMonth('date'))
+            .values('month').annotate(income=Sum(Abs('amount'))).order_by('month')
+        ]
+        by_account = {
+            row['account_id']: float(row['income'])
+            for row in dividends.values('account_id').annotate(income=Sum(Abs('amount'))).order_by()
+        }
+        return {'by_month': by_month, 'by_account': by_account, 'total': sum(by_account.values())}
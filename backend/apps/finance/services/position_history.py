@@ -0,0 +1,253 @@
+"""
+Position History Engine
+
+Only the current ``Holding`` snapshot is stored, so historical positions are
+rebuilt by replaying ``InvestmentTransaction`` quantity changes backwards from
+today: the quantity on day *d* is the current quantity minus every change
+booked after *d*. Positions are valued with ``PriceHistory`` closes, forward
+filled between observations. Everything runs on (position x day) numpy
+arrays, so a decade of daily history for hundreds of securities takes a few
+array passes rather than per-day queries.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from ..models import Holding, InvestmentTransaction, PriceHistory, Security
+
+logger = logging.getLogger(__name__)
+
+# Transactions that move shares in or out of a position
+QUANTITY_TYPES = ('buy', 'sell', 'transfer')
+QUANTITY_SUBTYPES = ('split', 'stock distribution', 'stock_distribution', 'spin off', 'merger')
+
+
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """Forward fill NaNs along each row; leading NaNs are back filled from the first observation."""
+    if matrix.size == 0:
+        return matrix
+    mask = np.isnan(matrix)
+    index = np.where(~mask, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = matrix[np.arange(matrix.shape[0])[:, None], index]
+
+    # Rows whose first observation comes after day 0: use that first price for earlier days
+    first_valid = np.argmax(~mask, axis=1)
+    has_any = (~mask).any(axis=1)
+    leading = np.arange(matrix.shape[1])[None, :] < first_valid[:, None]
+    first_values = matrix[np.arange(matrix.shape[0]), first_valid]
+    filled = np.where(leading & has_any[:, None], first_values[:, None], filled)
+    return filled
+
+
+def time_weighted_return(values: np.ndarray, flows: np.ndarray, income: Optional[np.ndarray] = None) -> Optional[float]:
+    """
+    Chain-linked daily time-weighted return.
+
+    ``flows`` holds cash moved into positions on each day (purchases positive,
+    sales negative); ``income`` holds cash paid out by positions (dividends).
+    Days that start from a zero value are skipped.
+    """
+    if len(values) < 2:
+        return None
+    income = np.zeros_like(values) if income is None else income
+    previous = values[:-1]
+    valid = previous > 0
+    if not valid.any():
+        return None
+    growth = (values[1:] - flows[1:] + income[1:])[valid] / previous[valid]
+    return float(np.prod(growth) - 1)
+
+
+class PositionHistoryEngine:
+    """Rebuild daily quantities and values for a user's investment positions."""
+
+    def __init__(self, user, account_ids: Optional[List] = None):
+        self.user = user
+        self.account_ids = account_ids
+
+    def _filter_accounts(self, queryset):
+        queryset = queryset.filter(account__institution__user=self.user)
+        if self.account_ids:
+            queryset = queryset.filter(account_id__in=self.account_ids)
+        return queryset
+
+    def build(self, start_date: date, end_date: Optional[date] = None) -> Dict:
+        """
+        Return daily arrays between ``start_date`` and ``end_date`` inclusive.
+
+        Keys: ``dates`` (list of date), ``positions`` (list of (account_id,
+        security_id)), ``quantities`` and ``values`` (positions x days),
+        ``flows`` and ``income`` (per-day trade cash and dividends, per account
+        via ``accounts`` / ``account_rows``).
+        """
+        today = timezone.now().date()
+        end_date = min(end_date or today, today)
+        # Replay runs from today back, so transactions after end_date still matter
+        days = (today - start_date).days + 1
+        if days <= 0:
+            raise ValueError("start_date must not be after today")
+
+        holdings = list(self._filter_accounts(Holding.objects.all()).values_list(
+            'account_id', 'security_id', 'quantity', 'institution_price'
+        ))
+        transactions = list(self._filter_accounts(InvestmentTransaction.objects.filter(
+            date__gte=start_date, date__lte=today
+        )).values_list('account_id', 'security_id', 'date', 'type', 'subtype', 'quantity', 'amount'))
+
+        positions: Dict = {}
+        for account_id, security_id, _, _ in holdings:
+            positions.setdefault((account_id, security_id), len(positions))
+        for account_id, security_id, _, txn_type, subtype, quantity, _ in transactions:
+            if security_id and self._moves_shares(txn_type, subtype, quantity):
+                positions.setdefault((account_id, security_id), len(positions))
+
+        accounts = sorted({account_id for account_id, _ in positions} | {row[0] for row in transactions}, key=str)
+        account_index = {account_id: index for index, account_id in enumerate(accounts)}
+
+        current = np.zeros(len(positions))
+        fallback_price = np.full(len(positions), np.nan)
+        for account_id, security_id, quantity, price in holdings:
+            row = positions[(account_id, security_id)]
+            current[row] = float(quantity)
+            fallback_price[row] = float(price)
+
+        deltas = np.zeros((len(positions), days))
+        flows = np.zeros((len(accounts), days))
+        income = np.zeros((len(accounts), days))
+        for account_id, security_id, txn_date, txn_type, subtype, quantity, amount in transactions:
+            day = (txn_date - start_date).days
+            if txn_type in ('buy', 'sell'):
+                flows[account_index[account_id], day] += float(amount)
+            elif txn_type == 'dividend' or subtype in ('dividend', 'qualified dividend', 'non-qualified dividend'):
+                income[account_index[account_id], day] += abs(float(amount))
+            if security_id and self._moves_shares(txn_type, subtype, quantity):
+                deltas[positions[(account_id, security_id)], day] += self._share_delta(txn_type, quantity)
+
+        # quantity[d] = current - sum(deltas after d): a reversed cumulative sum
+        after = np.cumsum(deltas[:, ::-1], axis=1)[:, ::-1] - deltas
+        quantities = np.clip(current[:, None] - after, 0, None)
+
+        security_ids = sorted({security_id for _, security_id in positions}, key=str)
+        prices = self._price_matrix(security_ids, start_date, today, days)
+        security_rows = {security_id: index for index, security_id in enumerate(security_ids)}
+        position_prices = (
+            prices[[security_rows[security_id] for _, security_id in positions]]
+            if positions else np.zeros((0, days))
+        )
+        # Securities without any stored history fall back to today's holding price
+        missing = np.isnan(position_prices).all(axis=1)
+        position_prices[missing] = fallback_price[missing, None]
+        values = np.nan_to_num(quantities * position_prices)
+
+        end_index = (end_date - start_date).days + 1
+        return {
+            'dates': [start_date + timedelta(days=offset) for offset in range(end_index)],
+            'positions': list(positions),
+            'accounts': accounts,
+            'account_rows': np.array([account_index[account_id] for account_id, _ in positions], dtype=int),
+            'quantities': quantities[:, :end_index],
+            'values': values[:, :end_index],
+            'flows': flows[:, :end_index],
+            'income': income[:, :end_index],
+        }
+
+    @staticmethod
+    def _moves_shares(txn_type, subtype, quantity) -> bool:
+        return bool(quantity) and (txn_type in QUANTITY_TYPES or subtype in QUANTITY_SUBTYPES)
+
+    @staticmethod
+    def _share_delta(txn_type, quantity) -> float:
+        quantity = float(quantity)
+        # Institutions disagree on sign conventions for trades; the type is authoritative
+        if txn_type == 'buy':
+            return abs(quantity)
+        if txn_type == 'sell':
+            return -abs(quantity)
+        return quantity
+
+    @staticmethod
+    def _price_matrix(security_ids: List, start_date: date, end_date: date, days: int) -> np.ndarray:
+        """(securities x days) closes, forward filled; includes the last close before the window."""
+        matrix = np.full((len(security_ids), days), np.nan)
+        if not security_ids:
+            return matrix
+        rows = {security_id: index for index, security_id in enumerate(security_ids)}
+
+        in_window = list(PriceHistory.objects.filter(
+            security_id__in=security_ids, date__gte=start_date, date__lte=end_date
+        ).values_list('security_id', 'date', 'close_price'))
+        # Latest close before the window, so day 0 is valued at the right price
+        last_close = PriceHistory.objects.filter(
+            security_id=OuterRef('pk'), date__lt=start_date
+        ).order_by('-date').values('close_price')[:1]
+        seeds = dict(
+            Security.objects.filter(id__in=security_ids).annotate(seed=Subquery(last_close))
+            .exclude(seed__isnull=True).values_list('id', 'seed')
+        )
+
+        for security_id, close in seeds.items():
+            matrix[rows[security_id], 0] = float(close)
+        if in_window:
+            row_index = np.array([rows[row[0]] for row in in_window])
+            day_index = np.array([(row[1] - start_date).days for row in in_window])
+            matrix[row_index, day_index] = np.array([float(row[2]) for row in in_window])
+        return forward_fill(matrix)
+
+    @staticmethod
+    def _account_series(history: Dict) -> np.ndarray:
+        """Sum position values into (accounts x days)."""
+        values = history['values']
+        account_values = np.zeros((len(history['accounts']), values.shape[1]))
+        if values.size:
+            np.add.at(account_values, history['account_rows'], values)
+        return account_values
+
+    def returns(self, start_date: date, end_date: Optional[date] = None) -> Optional[Dict]:
+        """
+        Time-weighted returns overall and per account, or None without price history.
+
+        Returns are only meaningful when positions can be valued from stored
+        closes rather than today's price, so callers can fall back otherwise.
+        """
+        priced = Q(date__lte=start_date, security__holdings__account__institution__user=self.user)
+        if self.account_ids:
+            priced &= Q(security__holdings__account_id__in=self.account_ids)
+        if not PriceHistory.objects.filter(priced).exists():
+            return None
+
+        history = self.build(start_date, end_date)
+
+        account_values = self._account_series(history)
+        overall = time_weighted_return(
+            account_values.sum(axis=0), history['flows'].sum(axis=0), history['income'].sum(axis=0)
+        )
+        return {
+            'total': overall,
+            'by_account': {
+                account_id: time_weighted_return(account_values[index], history['flows'][index], history['income'][index])
+                for index, account_id in enumerate(history['accounts'])
+            },
+        }
+
+    def portfolio_trend(self, start_date: date, end_date: Optional[date] = None) -> Dict:
+        """Daily total and per-account values, plus the period's time-weighted return."""
+        history = self.build(start_date, end_date)
+        account_values = self._account_series(history)
+
+        totals = account_values.sum(axis=0)
+        twr = time_weighted_return(totals, history['flows'].sum(axis=0), history['income'].sum(axis=0))
+
+        return {
+            'dates': [day.isoformat() for day in history['dates']],
+            'total_values': [round(float(value), 2) for value in totals],
+            'accounts': {
+                str(account_id): [round(float(value), 2) for value in account_values[index]]
+                for index, account_id in enumerate(history['accounts'])
+            },
+            'time_weighted_return_percent': None if twr is None else round(twr * 100, 2),
+        }
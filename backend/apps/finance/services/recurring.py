@@ -0,0 +1,196 @@
+"""
+Recurring Transaction Detection
+
+Finds subscriptions and bills in a user's spending in one pass over
+``(date, amount, merchant_name, name, primary_category)`` tuples:
+
+- merchants are normalised with precompiled regexes behind an LRU cache, so
+  the thousands of repeats of the same raw merchant string cost one lookup
+- each merchant's charges are clustered by amount with a relative tolerance
+  band, so a $9.99 -> $10.49 price change stays one subscription
+- each cluster's date intervals are scored with numpy against the supported
+  billing frequencies; skipped or late charges lower the score but do not
+  break the pattern
+
+It also schedules occurrences in closed form, for next-date calculation and
+the upcoming-bills projection.
+"""
+import re
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+MERCHANT_SUFFIX_RE = re.compile(r'\s*(#\d+|\d{4,}|store\s*\d+|loc\s*\d+).*$')
+MERCHANT_PUNCTUATION_RE = re.compile(r"[^\w\s'-]")
+WHITESPACE_RE = re.compile(r'\s+')
+MERCHANT_KEY_LENGTH = 40
+
+# Adjacent charges (sorted by amount) within this ratio belong to the same cluster
+AMOUNT_TOLERANCE = 0.08
+
+# (frequency, nominal period in days, shortest and longest accepted interval)
+FREQUENCIES = (
+    ('weekly', 7, 6, 8),
+    ('bi_weekly', 14, 13, 16),
+    ('monthly', 30.44, 27, 33),
+    ('quarterly', 91.31, 85, 100),
+    ('semi_annually', 182.62, 180, 200),
+    ('yearly', 365.25, 350, 380),
+)
+# Share of intervals that must match the frequency (allowing skipped periods)
+MIN_REGULARITY = 0.6
+# Scoring a frequency needs at least two intervals
+MIN_OCCURRENCES = 3
+
+# Scheduling step per frequency: fixed cycles in days, calendar cycles in months
+FREQUENCY_DAYS = {'daily': 1, 'weekly': 7, 'bi_weekly': 14}
+FREQUENCY_MONTHS = {'monthly': 1, 'quarterly': 3, 'semi_annually': 6, 'yearly': 12}
+
+
+@lru_cache(maxsize=8192)
+def normalize_merchant(name: Optional[str]) -> str:
+    """Grouping key for a merchant: lowercase, store numbers and punctuation stripped."""
+    if not name:
+        return 'unknown'
+    name = MERCHANT_SUFFIX_RE.sub('', name.lower().strip())
+    name = MERCHANT_PUNCTUATION_RE.sub('', name)
+    name = WHITESPACE_RE.sub(' ', name).strip()
+    return name[:MERCHANT_KEY_LENGTH] or 'unknown'
+
+
+@lru_cache(maxsize=4096)
+def format_merchant(name: str) -> str:
+    """Display form of a merchant key; title case, common abbreviations kept upper case."""
+    if not name:
+        return 'Unknown'
+    return ' '.join(
+        word.upper() if word.upper() in ('ATM', 'LLC', 'INC', 'CO', 'LTD') else word.capitalize()
+        for word in name.split()
+    )
+
+
+def cluster_amounts(amounts: np.ndarray, tolerance: float = AMOUNT_TOLERANCE) -> np.ndarray:
+    """Label each amount with a cluster id; a new cluster starts wherever the sorted amounts jump by more than ``tolerance``."""
+    order = np.argsort(amounts, kind='stable')
+    ordered = amounts[order]
+    breaks = ordered[1:] > ordered[:-1] * (1 + tolerance)
+    labels = np.empty(len(amounts), dtype=np.int64)
+    labels[order] = np.concatenate(([0], np.cumsum(breaks)))
+    return labels
+
+
+def detect_frequency(ordinals: np.ndarray) -> Optional[Tuple[str, float]]:
+    """
+    Score the billing frequency of date-sorted day ordinals.
+
+    Returns ``(frequency, regularity)`` or None for irregular series. Same-day
+    repeats count once; an interval close to a whole multiple of the period
+    (a skipped charge) still counts as regular.
+    """
+    intervals = np.diff(ordinals)
+    intervals = intervals[intervals > 0]
+    if len(intervals) < 2:
+        return None
+    median = float(np.median(intervals))
+
+    for frequency, period, shortest, longest in FREQUENCIES:
+        if shortest <= median <= longest:
+            periods = np.maximum(np.rint(intervals / period), 1)
+            slack = max(period - shortest, longest - period)
+            regular = np.abs(intervals - periods * period) <= slack * periods
+            regularity = float(regular.mean())
+            if regularity >= MIN_REGULARITY:
+                return frequency, regularity
+            return None
+
+    # Short, steady cycles that fall between the standard bands are treated as monthly
+    if median < 40 and float(intervals.std(ddof=1)) / float(intervals.mean()) < 0.25:
+        return 'monthly', 1.0
+    return None
+
+
+def detect_recurring(rows: Iterable[Tuple], min_occurrences: int = MIN_OCCURRENCES) -> List[Dict]:
+    """
+    Detect recurring charges from ``(date, amount, merchant_name, name, primary_category)`` rows.
+
+    Rows must be ordered by date. Each detected pattern is a dict with
+    merchant, amount (mean of the cluster), frequency, regularity,
+    occurrences, first_date, last_date and primary_category.
+    ``min_occurrences`` below ``MIN_OCCURRENCES`` is raised to it.
+    """
+    min_occurrences = max(min_occurrences, MIN_OCCURRENCES)
+    groups: Dict[str, List[int]] = defaultdict(list)
+    ordinals, amounts, categories = [], [], []
+    for txn_date, amount, merchant_name, name, category in rows:
+        merchant = normalize_merchant(merchant_name or name)
+        if merchant == 'unknown':
+            continue
+        groups[merchant].append(len(ordinals))
+        ordinals.append(txn_date.toordinal())
+        amounts.append(float(amount))
+        categories.append(category)
+
+    ordinals = np.array(ordinals, dtype=np.int64)
+    amounts = np.array(amounts, dtype=float)
+
+    patterns = []
+    for merchant, indexes in groups.items():
+        if len(indexes) < min_occurrences:
+            continue
+        indexes = np.array(indexes)
+        labels = cluster_amounts(amounts[indexes])
+        for label in np.unique(labels):
+            # Boolean selection keeps the rows' date order
+            members = indexes[labels == label]
+            if len(members) < min_occurrences:
+                continue
+            detected = detect_frequency(ordinals[members])
+            if detected is None:
+                continue
+            frequency, regularity = detected
+            patterns.append({
+                'merchant': format_merchant(merchant),
+                'amount': round(float(amounts[members].mean()), 2),
+                'frequency': frequency,
+                'regularity': round(regularity, 2),
+                'occurrences': len(members),
+                'first_date': date.fromordinal(int(ordinals[members[0]])),
+                'last_date': date.fromordinal(int(ordinals[members[-1]])),
+                'primary_category': categories[members[0]],
+            })
+    return patterns
+
+
+def next_occurrence(last_date: date, frequency: str, today: date) -> date:
+    """First occurrence after ``last_date`` that falls on or after ``today``, without stepping period by period."""
+    if frequency in FREQUENCY_DAYS:
+        step = FREQUENCY_DAYS[frequency]
+        periods = max(1, -(-(today - last_date).days // step))
+        return last_date + timedelta(days=periods * step)
+
+    step = FREQUENCY_MONTHS.get(frequency, 1)
+    months = (today.year - last_date.year) * 12 + today.month - last_date.month
+    periods = max(1, -(-months // step))
+    # Offsets are taken from last_date each time so month-end days do not drift
+    candidate = last_date + relativedelta(months=periods * step)
+    if candidate < today:
+        candidate = last_date + relativedelta(months=(periods + 1) * step)
+    return candidate
+
+
+def occurrences_between(first_date: date, frequency: str, end_date: date) -> List[date]:
+    """Scheduled dates from ``first_date`` up to and including ``end_date``."""
+    if first_date > end_date:
+        return []
+    if frequency in FREQUENCY_DAYS:
+        step = FREQUENCY_DAYS[frequency]
+        return [first_date + timedelta(days=offset) for offset in range(0, (end_date - first_date).days + 1, step)]
+
+    step = FREQUENCY_MONTHS.get(frequency, 1)
+    months = (end_date.year - first_date.year) * 12 + end_date.month - first_date.month
+    dates = (first_date + relativedelta(months=offset) for offset in range(0, months + 1, step))
+    return [day for day in dates if day <= end_date]
@@ -0,0 +1,231 @@
+"""
+Security Master
+
+``Security`` rows are shared by every user, so the same popular tickers arrive
+in every holdings and investment-transaction sync. The security master keeps
+an in-process LRU of what each row currently holds and only writes when Plaid
+reports something new:
+
+- descriptive fields (name, identifiers, type, ...) are written when they change
+- ``close_price`` is written at most once per ``close_price_as_of``, and each
+  new close is also recorded in ``PriceHistory``
+
+Cached entries carry the row's ``updated_at`` as a version. Updates are
+conditional on that version, so an entry made stale by another process is
+detected, reloaded and retried instead of overwriting newer data.
+
+``upsert`` usually runs inside a sync's ``atomic()`` block, so the rows it
+reads and writes are staged per call and only reach the shared LRU once the
+transaction commits. A rollback leaves the LRU as it was.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import PriceHistory, Security
+
+logger = logging.getLogger(__name__)
+
+METADATA_FIELDS = (
+    'name', 'ticker_symbol', 'cusip', 'isin', 'sedol', 'type',
+    'institution_id', 'institution_security_id', 'is_cash_equivalent',
+)
+PRICE_QUANTUM = Decimal('0.0001')
+
+
+def _normalize_price(value) -> Optional[Decimal]:
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(str(value)).quantize(PRICE_QUANTUM)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _normalize_date(value) -> Optional[date]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def security_fields(security_data) -> Dict:
+    """Model field values for a Plaid security payload."""
+    return {
+        'name': security_data.get('name') or '',
+        'ticker_symbol': security_data.get('ticker_symbol'),
+        'cusip': security_data.get('cusip'),
+        'isin': security_data.get('isin'),
+        'sedol': security_data.get('sedol'),
+        'type': security_data.get('type'),
+        'institution_id': security_data.get('institution_id'),
+        'institution_security_id': security_data.get('institution_security_id'),
+        'is_cash_equivalent': bool(security_data.get('is_cash_equivalent')),
+        'close_price': _normalize_price(security_data.get('close_price')),
+        'close_price_as_of': _normalize_date(security_data.get('close_price_as_of')),
+    }
+
+
+class SecurityMaster:
+    """Process-wide, write-avoiding upserts for ``Security`` rows."""
+
+    MAX_ENTRIES = 10000
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Drop every cached entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.stats = {'hits': 0, 'misses': 0, 'inserts': 0, 'updates': 0, 'conflicts': 0}
+
+    def _get(self, plaid_security_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(plaid_security_id)
+            if entry is not None:
+                self._entries.move_to_end(plaid_security_id)
+            return entry
+
+    def _put(self, row: Dict):
+        with self._lock:
+            self._entries[row['plaid_security_id']] = row
+            self._entries.move_to_end(row['plaid_security_id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict(self, plaid_security_id: str):
+        with self._lock:
+            self._entries.pop(plaid_security_id, None)
+
+    def _publish(self, staged: Dict[str, Dict]):
+        for row in staged.values():
+            self._put(row)
+
+    @staticmethod
+    def _load(plaid_security_ids: Iterable[str], staged: Dict[str, Dict]):
+        """Fetch rows into ``staged`` with one query."""
+        for row in Security.objects.filter(plaid_security_id__in=list(plaid_security_ids)).values(
+            'id', 'plaid_security_id', 'close_price', 'close_price_as_of', 'updated_at', *METADATA_FIELDS
+        ):
+            staged[row['plaid_security_id']] = row
+
+    @staticmethod
+    def _changes(entry: Dict, incoming: Dict, today: date) -> Dict:
+        """Fields that need writing for ``incoming`` given the stored ``entry``."""
+        changes = {field: incoming[field] for field in METADATA_FIELDS if entry[field] != incoming[field]}
+
+        price, as_of = incoming['close_price'], incoming['close_price_as_of'] or today
+        stored_as_of = entry['close_price_as_of']
+        if price is not None and (stored_as_of is None or as_of > stored_as_of):
+            if price != entry['close_price'] or as_of != stored_as_of:
+                changes['close_price'] = price
+                changes['close_price_as_of'] = as_of
+        return changes
+
+    def upsert(self, securities_data) -> Dict[str, object]:
+        """
+        Make sure every Plaid security exists and is current.
+
+        Returns a dict of plaid security_id -> ``Security`` primary key. Rows
+        already cached with identical data cost no queries at all.
+        """
+        incoming = {data['security_id']: security_fields(data) for data in securities_data}
+        if not incoming:
+            return {}
+        today = timezone.now().date()
+        # Rows read or written by this call; published to the LRU on commit
+        staged: Dict[str, Dict] = {}
+
+        cached = {security_id: self._get(security_id) for security_id in incoming}
+        misses = [security_id for security_id, entry in cached.items() if entry is None]
+        self.stats['hits'] += len(incoming) - len(misses)
+        self.stats['misses'] += len(misses)
+        if misses:
+            self._load(misses, staged)
+
+        new_ids = [security_id for security_id in misses if security_id not in staged]
+        if new_ids:
+            self._insert({security_id: incoming[security_id] for security_id in new_ids}, today, staged)
+
+        ids = {}
+        price_points = []
+        for security_id, fields in incoming.items():
+            entry = staged.get(security_id) or cached[security_id]
+            previous_as_of = None if entry is None or security_id in new_ids else entry['close_price_as_of']
+            if entry is None:
+                # Lost an insert race to a row that was deleted again
+                entry = self._reinsert(security_id, fields, today, staged)
+            elif security_id not in new_ids:
+                entry = self._apply_changes(security_id, entry, fields, today, staged)
+            ids[security_id] = entry['id']
+
+            if entry['close_price'] is not None and entry['close_price_as_of'] and entry['close_price_as_of'] != previous_as_of:
+                price_points.append(PriceHistory(
+                    security_id=entry['id'], date=entry['close_price_as_of'], close_price=entry['close_price'],
+                ))
+
+        if price_points:
+            # Each new close also becomes a point in the security's price history
+            PriceHistory.objects.bulk_create(price_points, ignore_conflicts=True)
+        if staged:
+            transaction.on_commit(lambda: self._publish(staged))
+        return ids
+
+    def _insert(self, securities: Dict[str, Dict], today: date, staged: Dict[str, Dict]):
+        to_create = []
+        for security_id, fields in securities.items():
+            fields = dict(fields)
+            if fields['close_price'] is not None and fields['close_price_as_of'] is None:
+                fields['close_price_as_of'] = today
+            to_create.append(Security(plaid_security_id=security_id, **fields))
+        # A concurrent sync may insert the same ticker; reload to pick up whichever row won
+        Security.objects.bulk_create(to_create, ignore_conflicts=True)
+        self._load(securities.keys(), staged)
+        self.stats['inserts'] += len(to_create)
+
+    def _reinsert(self, security_id: str, fields: Dict, today: date, staged: Dict[str, Dict]) -> Dict:
+        self._insert({security_id: fields}, today, staged)
+        return staged[security_id]
+
+    def _apply_changes(self, security_id: str, entry: Dict, fields: Dict, today: date,
+                       staged: Dict[str, Dict]) -> Dict:
+        changes = self._changes(entry, fields, today)
+        if not changes:
+            return entry
+
+        now = timezone.now()
+        updated = Security.objects.filter(id=entry['id'], updated_at=entry['updated_at']).update(
+            updated_at=now, **changes
+        )
+        if not updated:
+            # Another process wrote the row since we cached it; re-read and decide again
+            self.stats['conflicts'] += 1
+            self._evict(security_id)
+            self._load([security_id], staged)
+            entry = staged.get(security_id)
+            if entry is None:
+                # The row was deleted underneath us; recreate it
+                return self._reinsert(security_id, fields, today, staged)
+            changes = self._changes(entry, fields, today)
+            if not changes:
+                return entry
+            Security.objects.filter(id=entry['id']).update(updated_at=now, **changes)
+
+        self.stats['updates'] += 1
+        entry = {**entry, **changes, 'updated_at': now}
+        staged[security_id] = entry
+        return entry
+
+
+security_master = SecurityMaster()
@@ -0,0 +1,172 @@
+"""
+Plaid Webhook Processing
+
+The webhook endpoint only stores ``PlaidWebhook`` rows and acknowledges them.
+Workers (see the ``process_webhooks`` command) claim pending rows with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent workers never pick up the
+same event. Claimed events are grouped by Plaid item, and each item's events
+are applied together:
+
+- any number of transaction update events become a single sync
+- removed-transaction events are merged into one delete
+- item errors are recorded on the institution
+
+A per-item sync lock stops two workers from processing the same item at once.
+If the lock is taken, the item's events are released and retried on the next
+run, where they coalesce with whatever arrived in the meantime.
+
+Events are only marked processed once their sync has actually run. If it
+fails, or joins a sync that was already running, the events stay pending.
+Each claim counts as an attempt, and after ``MAX_ATTEMPTS`` an event is no
+longer claimed: it stays unprocessed with its last error, as a failed event.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from samaanai.metrics import WEBHOOK_EVENTS
+
+from ..models import Institution, PlaidWebhook, Transaction
+from .locks import sync_lock
+
+logger = logging.getLogger(__name__)
+
+SYNC_CODES = ('INITIAL_UPDATE', 'HISTORICAL_UPDATE', 'DEFAULT_UPDATE', 'SYNC_UPDATES_AVAILABLE')
+
+
+class WebhookProcessor:
+    """Claim, coalesce and apply pending Plaid webhooks."""
+
+    BATCH_SIZE = 200
+    # Claims older than this belong to a worker that died; they become claimable again
+    CLAIM_TIMEOUT = timedelta(minutes=15)
+    ITEM_LOCK_TIMEOUT = 15 * 60
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, sync_service=None):
+        self._sync_service = sync_service
+
+    @property
+    def sync_service(self):
+        # Built lazily: batches with nothing to sync never need a Plaid client
+        if self._sync_service is None:
+            from . import TransactionSyncService
+            self._sync_service = TransactionSyncService()
+        return self._sync_service
+
+    def claim(self, limit: int = BATCH_SIZE) -> List[PlaidWebhook]:
+        """Mark up to ``limit`` pending webhooks as claimed by this worker and return them."""
+        now = timezone.now()
+        with db_transaction.atomic():
+            webhooks = list(
+                PlaidWebhook.objects.select_for_update(skip_locked=True)
+                .filter(processed=False, attempts__lt=self.MAX_ATTEMPTS)
+                .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - self.CLAIM_TIMEOUT))
+                .order_by('created_at')[:limit]
+            )
+            if webhooks:
+                PlaidWebhook.objects.filter(id__in=[w.id for w in webhooks]).update(
+                    claimed_at=now, attempts=F('attempts') + 1
+                )
+        return webhooks
+
+    def process_pending(self, limit: int = BATCH_SIZE) -> Dict[str, int]:
+        """Process one claimed batch; returns counts of events, items synced and items deferred."""
+        webhooks = self.claim(limit)
+        stats = {'events': len(webhooks), 'items': 0, 'syncs': 0, 'deferred': 0, 'failed': 0}
+        by_item = defaultdict(list)
+        for webhook in webhooks:
+            by_item[webhook.item_id].append(webhook)
+
+        for item_id, events in by_item.items():
+            stats['items'] += 1
+            event_ids = [event.id for event in events]
+            with sync_lock(f"webhook_item:{item_id}", self.ITEM_LOCK_TIMEOUT) as acquired:
+                if not acquired:
+                    # Another worker is processing this item; hand the events back without using an attempt
+                    PlaidWebhook.objects.filter(id__in=event_ids).update(
+                        claimed_at=None, attempts=F('attempts') - 1
+                    )
+                    stats['deferred'] += 1
+                    WEBHOOK_EVENTS.labels('deferred').inc(len(events))
+                    continue
+                try:
+                    synced = self._apply(item_id, events)
+                except Exception as e:
+                    logger.error(f"Error processing webhooks for item {item_id}: {e}", exc_info=True)
+                    PlaidWebhook.objects.filter(id__in=event_ids).update(error=str(e))
+                    self._log_exhausted(item_id, events)
+                    stats['failed'] += 1
+                    WEBHOOK_EVENTS.labels('failed').inc(len(events))
+                    continue
+
+                if synced is None:
+                    # The sync did not run here; keep the events for the next run
+                    PlaidWebhook.objects.filter(id__in=event_ids).update(
+                        claimed_at=None, error='Transaction sync did not run'
+                    )
+                    self._log_exhausted(item_id, events)
+                    stats['deferred'] += 1
+                    WEBHOOK_EVENTS.labels('deferred').inc(len(events))
+                    continue
+
+                PlaidWebhook.objects.filter(id__in=event_ids).update(
+                    processed=True, processed_at=timezone.now(), error=None
+                )
+                stats['syncs'] += int(synced)
+                WEBHOOK_EVENTS.labels('processed').inc(len(events))
+        return stats
+
+    def _log_exhausted(self, item_id: str, events: List[PlaidWebhook]):
+        # ``attempts`` on the instances predates this claim
+        if max(event.attempts for event in events) + 1 >= self.MAX_ATTEMPTS:
+            logger.warning(f"Giving up on {len(events)} webhook events for item {item_id} after {self.MAX_ATTEMPTS} attempts")
+
+    def _apply(self, item_id: str, events: List[PlaidWebhook]) -> Optional[bool]:
+        """
+        Apply one item's events.
+
+        Returns True when a transaction sync ran, False when none was needed,
+        and None when one was needed but did not run.
+        """
+        needs_sync = False
+        removed_ids = set()
+        item_error = None
+        for event in events:
+            if event.webhook_type == 'TRANSACTIONS':
+                if event.webhook_code in SYNC_CODES:
+                    needs_sync = True
+                elif event.webhook_code == 'TRANSACTIONS_REMOVED':
+                    removed_ids.update(event.payload.get('removed_transactions') or [])
+            elif event.webhook_type == 'ITEM' and event.webhook_code == 'ERROR':
+                # Events are in arrival order, so the last error wins
+                item_error = event.payload.get('error')
+
+        if not item_id:
+            return False
+
+        if removed_ids:
+            Transaction.objects.filter(
+                account__institution__item_id=item_id,
+                plaid_transaction_id__in=removed_ids,
+            ).delete()
+
+        if item_error is not None:
+            Institution.objects.filter(item_id=item_id).update(needs_update=True, error_message=str(item_error))
+
+        if needs_sync:
+            institution = Institution.objects.filter(item_id=item_id).first()
+            if institution is None:
+                logger.warning(f"Plaid webhook received for unknown item_id {item_id}")
+                return None
+            logger.info(f"Syncing {institution.name} for {len(events)} coalesced webhook events")
+            if not self.sync_service.sync_institution_transactions(institution):
+                # Joined a sync that was already running and may have fetched before these events
+                return None
+            return True
+        return False
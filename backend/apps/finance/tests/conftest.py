@@ -0,0 +1,45 @@
+import pytest
+from django.contrib.auth.models import User
+
+from apps.finance.models import Account, Institution
+from apps.finance.services.securities import security_master
+
+
+@pytest.fixture(autouse=True)
+def clear_security_master():
+    # The master caches primary keys across calls; rows vanish between tests
+    security_master.clear()
+    yield
+    security_master.clear()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username='financeuser', email='finance@example.com', password='testpassword')
+
+
+@pytest.fixture
+def institution(user):
+    return Institution.objects.create(user=user, name='Test Bank', item_id='item-test', access_token='access-test')
+
+
+@pytest.fixture
+def account(institution):
+    return Account.objects.create(
+        institution=institution,
+        plaid_account_id='acct-checking',
+        name='Checking',
+        type='depository',
+        subtype='checking',
+    )
+
+
+@pytest.fixture
+def investment_account(institution):
+    return Account.objects.create(
+        institution=institution,
+        plaid_account_id='acct-brokerage',
+        name='Brokerage',
+        type='investment',
+        subtype='brokerage',
+    )
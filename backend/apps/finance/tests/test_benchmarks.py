@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from apps.finance.benchmarks import BENCHMARKS, SyntheticDataGenerator, compare_results, synthetic_sync_pages
+from apps.finance.models import Account, SpendingCategory, Transaction
+from apps.finance.services import RecurringTransactionDetectionService
+
+
+@pytest.mark.django_db
+def test_generator_builds_history_that_detection_recognises():
+    counts = SyntheticDataGenerator(users=2, years=1, institutions_per_user=1, purchases_per_month=10).generate()
+
+    assert counts['users'] == 2
+    assert counts['accounts'] == 6
+    assert Transaction.objects.count() == counts['transactions']
+    assert SpendingCategory.objects.filter(parent__isnull=False).count() == 2 * 15
+    assert not Account.objects.filter(type='investment', current_balance=0).exists()
+
+    user = Account.objects.filter(type='credit').first().institution.user
+    merchants = {p['merchant'] for p in RecurringTransactionDetectionService().detect_recurring_transactions(user)}
+    assert {'Netflix', 'Spotify', 'Comcast'} <= merchants
+
+
+def test_synthetic_pages_modify_and_remove_earlier_rows():
+    replay = synthetic_sync_pages(pages=3, page_size=20).bind(['acct-a', 'acct-b'])
+
+    first = replay.sync_transactions('token', replay.cursor(0))
+    last = replay.sync_transactions('token', replay.cursor(2))
+
+    assert first['has_more'] and not last['has_more']
+    assert {t['account_id'] for t in first['added']} == {'acct-a', 'acct-b'}
+    assert len(last['modified']) == 2 and len(last['removed']) == 1
+
+
+def test_compare_flags_extra_queries_and_slow_medians_but_not_noise():
+    baseline = {'dashboard': {'queries': 10, 'median_ms': 40.0}, 'category_tree': {'queries': 5, 'median_ms': 1.0}}
+    current = {'dashboard': {'queries': 11, 'median_ms': 60.0}, 'category_tree': {'queries': 5, 'median_ms': 2.5}}
+
+    assert compare_results(current, baseline) == [
+        'dashboard: 11 queries, was 10',
+        'dashboard: median 60.0ms, was 40.0ms',
+    ]
+
+
+@pytest.mark.django_db
+def test_command_writes_results_and_fails_on_regression(tmp_path):
+    output = tmp_path / 'results.json'
+    call_command('run_benchmarks', '--users', '1', '--years', '1', '--iterations', '1', '--output', str(output))
+
+    report = json.loads(output.read_text())
+    assert set(report['results']) == set(BENCHMARKS)
+    assert report['results']['sync_ingest']['rows'] == 500
+    assert all(result['queries'] > 0 for result in report['results'].values())
+    # Everything was rolled back
+    assert not Transaction.objects.exists()
+
+    report['results']['dashboard']['queries'] = 1
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(report))
+    with pytest.raises(CommandError, match='regression'):
+        call_command('run_benchmarks', '--users', '1', '--years', '1', '--iterations', '1', '--only', 'dashboard',
+                     '--output', str(tmp_path / 'again.json'), '--baseline', str(baseline))
@@ -0,0 +1,140 @@
+import io
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APIClient
+
+from apps.finance.models import Account, Holding, Security, Transaction
+from apps.finance.services.csv_importer import FidelityCSVImporter, iter_decoded_lines, parse_money, read_csv
+
+
+ACTIVITY_CSV = (
+    '﻿Run Date,Account,Action,Symbol,Description,Quantity,Price,Amount\n'
+    '01/02/2024,X1234567,"YOU BOUGHT APPLE INC",AAPL,"APPLE INC, COMMON",2,185.00,-370.00\n'
+    '01/15/2024,X1234567,DIVIDEND RECEIVED,VTI,"VANGUARD TOTAL\nSTOCK MARKET",,,12.34\n'
+    '\n'
+    '01/20/2024,X1234567,CAFÉ TRANSFER,,Cash,,,50.00\n'
+)
+
+
+class TestStreamingDecoder:
+    def test_lines_survive_tiny_chunks_and_split_multibyte_characters(self):
+        encoded = ACTIVITY_CSV.encode('utf-8')
+
+        lines = list(iter_decoded_lines(io.BytesIO(encoded), chunk_size=3))
+
+        assert ''.join(lines) == ACTIVITY_CSV.lstrip('﻿')
+        assert all(line.endswith('\n') for line in lines)
+
+    def test_rows_are_numbered_and_blank_lines_skipped(self):
+        columns, rows = read_csv(io.BytesIO(ACTIVITY_CSV.encode('utf-8')))
+        rows = list(rows)
+
+        assert 'run date' in columns
+        assert [row_num for row_num, _ in rows] == [2, 3, 5]
+        assert rows[1][1][4] == 'VANGUARD TOTAL\nSTOCK MARKET'
+
+    def test_parse_money(self):
+        assert parse_money('$1,234.50') == Decimal('1234.50')
+        assert parse_money('(12.00)') == Decimal('-12.00')
+        assert parse_money('--') is None
+        assert parse_money('', default=Decimal('0')) == Decimal('0')
+
+
+def _result():
+    return {
+        'accounts_created': 0, 'accounts_updated': 0, 'transactions_created': 0, 'transactions_updated': 0,
+        'holdings_created': 0, 'holdings_updated': 0, 'errors': [],
+    }
+
+
+@pytest.mark.django_db
+class TestFidelityCSVImporter:
+    def test_failed_batch_is_reported_and_later_batches_still_import(self, institution):
+        importer = FidelityCSVImporter(institution, _result(), batch_size=2)
+        columns, rows = read_csv(io.BytesIO(ACTIVITY_CSV.encode('utf-8')))
+        write = importer._write_transactions
+        calls = []
+
+        def fail_first_batch(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise RuntimeError('deadlock')
+            write(batch)
+
+        with mock.patch.object(importer, '_write_transactions', side_effect=fail_first_batch):
+            result = importer.import_transactions(columns, rows)
+
+        assert calls == [2, 1]
+        assert result['errors'] == ['Rows up to 3: 2 transactions not saved: deadlock']
+        assert result['transactions_created'] == 1
+        assert Transaction.objects.filter(account__plaid_account_id='manual_X1234567').count() == 1
+
+
+@pytest.mark.django_db
+class TestCSVImportView:
+    def _post(self, user, content):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        upload = SimpleUploadedFile('activity.csv', content.encode('utf-8'), content_type='text/csv')
+        return client.post('/api/finance/import/csv/', {'file': upload}, format='multipart')
+
+    def test_transactions_import_in_batches_and_reimport_updates(self, user):
+        first = self._post(user, ACTIVITY_CSV)
+        second = self._post(user, ACTIVITY_CSV)
+
+        assert first.status_code == 200, first.data
+        assert first.data['import_type'] == 'transactions'
+        assert first.data['transactions_created'] == 3
+        assert second.data['transactions_created'] == 0
+        assert second.data['transactions_updated'] == 3
+        assert Transaction.objects.filter(account__plaid_account_id='manual_X1234567').count() == 3
+
+    def test_header_only_file_is_rejected(self, user):
+        response = self._post(user, 'Run Date,Account,Amount\n')
+
+        assert response.status_code == 400
+
+    def test_holdings_import_upserts_in_bulk_and_sets_balance(self, user, django_assert_max_num_queries):
+        positions = (
+            'Account Number,Account Name,Symbol,Description,Quantity,Last Price,Current Value,Cost Basis Total\n'
+            'Z111,Brokerage,AAPL,APPLE INC,10,$190.00,"$1,900.00","$1,500.00"\n'
+            'Z111,Brokerage,VTI,VANGUARD TOTAL,5,$240.00,"$1,200.00",$1000.00\n'
+            'Z111,Brokerage,SPAXX**,HELD IN MONEY MARKET,,,$300.00,\n'
+            'Z222,IRA,AAPL,APPLE INC,1,$190.00,$190.00,$100.00\n'
+        )
+        first = self._post(user, positions)
+        with django_assert_max_num_queries(10):
+            second = self._post(user, positions.replace('$1,900.00', '$2,000.00'))
+
+        assert first.data['holdings_created'] == 4
+        assert first.data['accounts_created'] == 2
+        assert second.data['holdings_updated'] == 4
+        assert second.data['holdings_created'] == 0
+        assert Security.objects.filter(plaid_security_id__startswith='manual_').count() == 3
+        account = Account.objects.get(plaid_account_id='manual_Z111')
+        assert account.current_balance == Decimal('3500.00')
+        assert Holding.objects.filter(account=account).count() == 3
+
+    def test_holdings_reimport_removes_sold_positions_and_counts_cash(self, user):
+        header = 'Account Number,Account Name,Symbol,Description,Quantity,Last Price,Current Value,Cost Basis Total\n'
+        self._post(user, header + (
+            'Z111,Brokerage,AAPL,APPLE INC,10,$190.00,"$1,900.00","$1,500.00"\n'
+            'Z111,Brokerage,VTI,VANGUARD TOTAL,5,$240.00,"$1,200.00",$1000.00\n'
+        ))
+        response = self._post(user, header + (
+            'Z111,Brokerage,VTI,VANGUARD TOTAL,4,$240.00,$960.00,$800.00\n'
+            'Z111,Brokerage,VTI,VANGUARD TOTAL,5,$240.00,"$1,200.00",$1000.00\n'
+            'Z111,Brokerage,CASH,CASH,,,"$1,900.00",\n'
+            'Z333,Cash Management,FCASH**,HELD IN FCASH,,,$250.00,\n'
+        ))
+
+        assert response.data['holdings_updated'] == 1
+        assert response.data['holdings_created'] == 0
+        assert response.data['holdings_removed'] == 1
+        brokerage = Account.objects.get(plaid_account_id='manual_Z111')
+        assert list(Holding.objects.filter(account=brokerage).values_list('quantity', flat=True)) == [5]
+        assert brokerage.current_balance == Decimal('3100.00')
+        assert Account.objects.get(plaid_account_id='manual_Z333').current_balance == Decimal('250.00')
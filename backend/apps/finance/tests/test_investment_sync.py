@@ -0,0 +1,192 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.db import transaction
+from django.utils import timezone
+
+from apps.finance.models import Account, Holding, InvestmentTransaction, Security
+from apps.finance.services import InvestmentSyncService, PlaidService
+from apps.finance.services.securities import security_master
+
+
+def security(security_id, ticker, price, as_of=None):
+    return {
+        'security_id': security_id, 'name': ticker, 'ticker_symbol': ticker, 'type': 'equity',
+        'close_price': price, 'close_price_as_of': as_of,
+    }
+
+
+def holding(security_id, quantity, price, account_id='acct-brokerage'):
+    return {
+        'account_id': account_id, 'security_id': security_id, 'quantity': quantity,
+        'institution_price': price, 'institution_value': quantity * price,
+    }
+
+
+@pytest.fixture
+def sync_service():
+    with mock.patch('apps.finance.services.PlaidService'):
+        yield InvestmentSyncService()
+
+
+@pytest.mark.django_db
+class TestHoldingsSync:
+    def test_sync_upserts_and_removes_sold_positions(self, sync_service, institution, investment_account):
+        sync_service.plaid_service.get_investments_holdings.return_value = {
+            'accounts': [{'account_id': 'acct-brokerage'}],
+            'securities': [security('sec-aapl', 'AAPL', 190.0, date(2024, 3, 1)), security('sec-vti', 'VTI', 240.0)],
+            'holdings': [holding('sec-aapl', 10, 190.0), holding('sec-vti', 5, 240.0)],
+        }
+        assert sync_service.sync_institution_holdings(institution)
+
+        # VTI was sold; AAPL position grew
+        sync_service.plaid_service.get_investments_holdings.return_value = {
+            'accounts': [{'account_id': 'acct-brokerage'}],
+            'securities': [security('sec-aapl', 'AAPL', 200.0, date(2024, 3, 2))],
+            'holdings': [holding('sec-aapl', 12, 200.0)],
+        }
+        assert sync_service.sync_institution_holdings(institution)
+
+        holdings = list(Holding.objects.filter(account=investment_account).select_related('security'))
+        assert [(h.security.ticker_symbol, h.quantity) for h in holdings] == [('AAPL', Decimal('12'))]
+        assert Security.objects.get(plaid_security_id='sec-aapl').close_price == Decimal('200')
+        assert Security.objects.count() == 2
+
+    def test_query_count_is_independent_of_position_count(
+        self, sync_service, institution, investment_account, django_assert_max_num_queries
+    ):
+        positions = 50
+        sync_service.plaid_service.get_investments_holdings.return_value = {
+            'accounts': [{'account_id': 'acct-brokerage'}],
+            'securities': [security(f'sec-{i}', f'T{i}', 10.0) for i in range(positions)],
+            'holdings': [holding(f'sec-{i}', 1, 10.0) for i in range(positions)],
+        }
+
+        with django_assert_max_num_queries(10):
+            assert sync_service.sync_institution_holdings(institution)
+        assert Holding.objects.filter(account=investment_account).count() == positions
+
+
+def investment_txn(txn_id, security_id, day):
+    return {
+        'investment_transaction_id': txn_id, 'account_id': 'acct-brokerage', 'security_id': security_id,
+        'amount': 100.0, 'quantity': 1, 'price': 100.0, 'fees': 0, 'type': 'buy', 'subtype': 'buy',
+        'date': date(2024, 3, day), 'name': f'BUY {security_id}',
+    }
+
+
+class TestInvestmentTransactionsPaging:
+    def test_pages_use_options_offset_and_merge_securities(self):
+        pages = [
+            {'investment_transactions': [investment_txn('t1', 'sec-a', 1)], 'total_investment_transactions': 2,
+             'securities': [security('sec-a', 'A', 1.0)], 'accounts': []},
+            {'investment_transactions': [investment_txn('t2', 'sec-b', 2)], 'total_investment_transactions': 2,
+             'securities': [security('sec-b', 'B', 1.0)], 'accounts': []},
+        ]
+        service = PlaidService.__new__(PlaidService)
+        service.client = mock.Mock()
+        service.client.investments_transactions_get.side_effect = pages
+
+        result = service.get_investments_transactions('token', date(2024, 3, 1), date(2024, 3, 31))
+
+        offsets = [call.args[0].options.offset for call in service.client.investments_transactions_get.call_args_list]
+        assert offsets == [0, 1]
+        assert {s['security_id'] for s in result['securities']} == {'sec-a', 'sec-b'}
+        assert len(result['investment_transactions']) == 2
+
+
+@pytest.mark.django_db
+class TestInvestmentTransactionsSync:
+    def test_first_sync_backfills_then_refreshes_from_watermark(self, sync_service, institution, investment_account):
+        fetch = sync_service.plaid_service.get_investments_transactions
+        fetch.return_value = {
+            'investment_transactions': [investment_txn('t1', 'sec-a', 1), investment_txn('t2', None, 2)],
+            'securities': [security('sec-a', 'A', 1.0)],
+            'accounts': [],
+        }
+
+        assert sync_service.sync_institution_investment_transactions(institution, end_date=date(2024, 3, 31))
+        assert fetch.call_args.args[1] == date(2024, 3, 31) - timedelta(days=365)
+        investment_account.refresh_from_db()
+        assert investment_account.investment_transactions_synced_through == date(2024, 3, 31)
+
+        assert sync_service.sync_institution_investment_transactions(institution, end_date=date(2024, 4, 2))
+        assert fetch.call_args.args[1] == date(2024, 3, 24)
+        assert InvestmentTransaction.objects.filter(account=investment_account).count() == 2
+        assert InvestmentTransaction.objects.get(plaid_investment_transaction_id='t2').security is None
+
+    def test_narrow_window_only_advances_covered_watermarks(self, sync_service, institution, investment_account):
+        investment_account.investment_transactions_synced_through = date(2024, 3, 20)
+        investment_account.save()
+        stale = Account.objects.create(
+            institution=institution, plaid_account_id='acct-ira', name='IRA', type='investment',
+            investment_transactions_synced_through=date(2024, 1, 31),
+        )
+        never_synced = Account.objects.create(
+            institution=institution, plaid_account_id='acct-roth', name='Roth', type='investment',
+        )
+        sync_service.plaid_service.get_investments_transactions.return_value = {
+            'investment_transactions': [], 'securities': [], 'accounts': [],
+        }
+
+        assert sync_service.sync_institution_investment_transactions(
+            institution, start_date=date(2024, 3, 15), end_date=date(2024, 3, 31),
+        )
+
+        for account in (investment_account, stale, never_synced):
+            account.refresh_from_db()
+        assert investment_account.investment_transactions_synced_through == date(2024, 3, 31)
+        assert stale.investment_transactions_synced_through == date(2024, 1, 31)
+        assert never_synced.investment_transactions_synced_through is None
+
+
+# Transactional, so cache writes that wait for a commit actually happen
+@pytest.mark.django_db(transaction=True)
+class TestSecurityMaster:
+    def test_unchanged_securities_are_not_rewritten(self, django_assert_num_queries):
+        payload = [security('sec-a', 'A', 10.0, date(2024, 3, 1)), security('sec-b', 'B', 20.0, date(2024, 3, 1))]
+        ids = security_master.upsert(payload)
+
+        # Another user's sync reports the same data: served entirely from the LRU
+        with django_assert_num_queries(0):
+            assert security_master.upsert(payload) == ids
+
+    def test_close_price_written_once_per_as_of(self):
+        security_master.upsert([security('sec-a', 'A', 10.0, date(2024, 3, 1))])
+        security_master.upsert([security('sec-a', 'A', 11.0, date(2024, 3, 1))])
+        assert Security.objects.get(plaid_security_id='sec-a').close_price == Decimal('10')
+
+        security_master.upsert([security('sec-a', 'A', 12.0, date(2024, 3, 2))])
+        assert Security.objects.get(plaid_security_id='sec-a').close_price == Decimal('12')
+
+    def test_stale_cache_entry_is_reloaded_before_writing(self):
+        security_master.upsert([security('sec-a', 'A', 10.0, date(2024, 3, 1))])
+        # Another process renames the security and moves the price forward
+        Security.objects.filter(plaid_security_id='sec-a').update(
+            name='Renamed', close_price=Decimal('15'), close_price_as_of=date(2024, 3, 5), updated_at=timezone.now()
+        )
+
+        security_master.upsert([security('sec-a', 'A', 12.0, date(2024, 3, 2))])
+
+        row = Security.objects.get(plaid_security_id='sec-a')
+        assert row.name == 'A'
+        assert row.close_price == Decimal('15')
+        assert security_master.stats['conflicts'] == 1
+
+    def test_rolled_back_writes_do_not_reach_the_cache(self):
+        security_master.upsert([security('sec-a', 'A', 10.0, date(2024, 3, 1))])
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                security_master.upsert([
+                    security('sec-a', 'A', 12.0, date(2024, 3, 2)), security('sec-b', 'B', 20.0, date(2024, 3, 2)),
+                ])
+                raise RuntimeError('sync failed')
+
+        ids = security_master.upsert([
+            security('sec-a', 'A', 12.0, date(2024, 3, 2)), security('sec-b', 'B', 20.0, date(2024, 3, 2)),
+        ])
+
+        assert Security.objects.get(id=ids['sec-b']).ticker_symbol == 'B'
+        assert Security.objects.get(id=ids['sec-a']).close_price == Decimal('12')
@@ -0,0 +1,130 @@
+import os
+from unittest import mock
+
+import plaid
+import pytest
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from rest_framework.test import APIClient
+
+from apps.finance.models import PlaidWebhook, Transaction
+from apps.finance.services import PlaidService, TransactionSyncService
+from apps.finance.services.webhooks import WebhookProcessor
+from apps.notifications.models import NotificationQueue
+from samaanai.metrics_archive import archive_dead_worker
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def scrape(settings):
+    settings.METRICS_TOKEN = 'scrape-token'
+    client = APIClient()
+
+    def get():
+        return client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+    return get
+
+
+@pytest.mark.django_db
+def test_endpoint_needs_the_token(settings):
+    settings.DEBUG = False
+    settings.METRICS_TOKEN = ''
+    assert APIClient().get('/metrics').status_code == 403
+
+    settings.METRICS_TOKEN = 'scrape-token'
+    assert APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code == 403
+
+
+@pytest.mark.django_db
+def test_exposition_reports_webhooks_and_queue_depths(scrape, institution, user):
+    received = _sample('plaid_webhooks_received_total', webhook_type='TRANSACTIONS')
+    APIClient().post('/api/finance/plaid/webhook/', {
+        'webhook_type': 'TRANSACTIONS', 'webhook_code': 'DEFAULT_UPDATE', 'item_id': institution.item_id,
+    }, format='json')
+    PlaidWebhook.objects.create(
+        webhook_type='TRANSACTIONS', webhook_code='DEFAULT_UPDATE', item_id=institution.item_id,
+        payload={}, attempts=WebhookProcessor.MAX_ATTEMPTS,
+    )
+    NotificationQueue.objects.create(
+        user=user, email_type='budget_alert', subject='Budget', template_name='notifications/budget_alert.html',
+    )
+
+    response = scrape()
+
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain')
+    body = response.content.decode()
+    assert 'plaid_webhook_queue_depth 1.0' in body
+    assert 'plaid_webhook_exhausted_events 1.0' in body
+    assert 'notification_queue_depth{status="pending"} 1.0' in body
+    assert 'http_request_duration_seconds_bucket' in body
+    assert _sample('plaid_webhooks_received_total', webhook_type='TRANSACTIONS') == received + 1
+
+
+@pytest.mark.django_db
+def test_transaction_sync_counts_rows_and_outcome(institution, account):
+    institution.sync_cursor = 'cursor-1'
+    institution.save()
+    added = _sample('sync_rows_total', kind='transactions', action='added')
+    runs = _sample('sync_runs_total', kind='transactions', outcome='success')
+
+    with mock.patch('apps.finance.services.PlaidService') as plaid_service:
+        plaid_service.return_value.sync_transactions.return_value = {
+            'added': [{
+                'transaction_id': 'txn-metrics', 'account_id': account.plaid_account_id, 'amount': 12.5,
+                'name': 'Coffee', 'date': '2024-05-01', 'category': ['FOOD_AND_DRINK'],
+            }],
+            'modified': [],
+            'removed': [],
+            'next_cursor': 'cursor-2',
+            'has_more': False,
+        }
+        assert TransactionSyncService().sync_institution_transactions(institution) is True
+
+    assert Transaction.objects.filter(plaid_transaction_id='txn-metrics').exists()
+    assert _sample('sync_rows_total', kind='transactions', action='added') == added + 1
+    assert _sample('sync_runs_total', kind='transactions', outcome='success') == runs + 1
+
+
+def test_plaid_errors_are_counted_per_operation():
+    service = PlaidService.__new__(PlaidService)
+    service.client = mock.Mock()
+    service.client.accounts_get.side_effect = plaid.ApiException(status=400, reason='INVALID_ACCESS_TOKEN')
+    errors = _sample('plaid_request_errors_total', operation='accounts_get')
+    calls = _sample('plaid_request_duration_seconds_count', operation='accounts_get')
+
+    with pytest.raises(plaid.ApiException):
+        service.get_accounts('access-bad')
+
+    assert _sample('plaid_request_errors_total', operation='accounts_get') == errors + 1
+    assert _sample('plaid_request_duration_seconds_count', operation='accounts_get') == calls + 1
+
+
+@pytest.mark.django_db
+def test_unknown_http_methods_share_one_label():
+    before = _sample('http_request_duration_seconds_count', view='unresolved', method='other')
+
+    APIClient().generic('X-MADE-UP', '/no-such-path/')
+
+    assert _sample('http_request_duration_seconds_count', view='unresolved', method='other') == before + 1
+    assert REGISTRY.get_sample_value('http_request_duration_seconds_count',
+                                     {'view': 'unresolved', 'method': 'X-MADE-UP'}) is None
+
+
+def test_dead_workers_are_folded_into_the_archive(tmp_path):
+    key = mmap_key('jobs_total', 'jobs_total', ['kind'], ['sync'], 'Jobs run')
+    for pid, value in ((101, 2.0), (102, 3.0), (103, 4.0)):
+        worker = MmapedDict(str(tmp_path / f'counter_{pid}.db'))
+        worker.write_value(key, value, 0.0)
+        worker.close()
+
+    archive_dead_worker(101, str(tmp_path))
+    archive_dead_worker(102, str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == ['counter_103.db', 'counter_archive.db']
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+    assert registry.get_sample_value('jobs_total', {'kind': 'sync'}) == 9.0
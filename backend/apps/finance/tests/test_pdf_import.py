@@ -0,0 +1,190 @@
+import io
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+from apps.finance.models import Transaction
+from apps.finance.services.pdf_extractor import (
+    PDFTransactionExtractor, StatementTableParser, import_pdf_transactions,
+)
+
+
+class FakePage:
+    def __init__(self, text, tables):
+        self._text = text
+        self._tables = tables
+
+    def extract_text(self):
+        return self._text
+
+    def extract_tables(self):
+        return self._tables
+
+
+class FakePDF:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+CHECKING_TABLE = [
+    ['Date', 'Description', 'Withdrawals', 'Deposits', 'Balance'],
+    ['01/03', 'PAYROLL ACME CORP', '', '2,500.00', '3,100.00'],
+    ['01/05', 'COFFEE SHOP #12', '4.50', '', '3,095.50'],
+    ['', 'SEATTLE WA', '', '', ''],
+    ['01/09', 'RENT PAYMENT', '1,200.00', '', '1,895.50'],
+]
+
+
+class TestStatementTableParser:
+    def test_parses_debit_credit_columns_with_year_from_page(self):
+        rows = StatementTableParser().parse_page([CHECKING_TABLE], 'Statement period January 2024')
+
+        assert rows == [
+            {'date': '2024-01-03', 'description': 'PAYROLL ACME CORP', 'amount': 2500, 'category': 'OTHER'},
+            {'date': '2024-01-05', 'description': 'COFFEE SHOP #12 SEATTLE WA', 'amount': -4.5, 'category': 'OTHER'},
+            {'date': '2024-01-09', 'description': 'RENT PAYMENT', 'amount': -1200, 'category': 'OTHER'},
+        ]
+
+    def test_single_amount_column_with_parentheses(self):
+        table = [
+            ['Transaction Date', 'Details', 'Amount'],
+            ['2024-02-01', 'Refund', '$15.00'],
+            ['2024-02-02', 'Grocery', '($42.10)'],
+        ]
+        rows, confidence = StatementTableParser().parse_table(table)
+
+        assert confidence == 1.0
+        assert [r['amount'] for r in rows] == [Decimal('15.00'), Decimal('-42.10')]
+
+    def test_card_statement_purchases_are_money_out(self):
+        table = [
+            ['Trans Date', 'Description', 'Amount'],
+            ['12/28', 'AMAZON MKTPLACE', '42.10'],
+            ['01/02', 'PAYMENT THANK YOU', '-500.00'],
+            ['01/05', 'REFUND STORE', '15.00 CR'],
+        ]
+        parser = StatementTableParser()
+        text = 'Minimum Payment Due $35.00  Statement period 12/15/2023 - 01/14/2024'
+
+        rows = parser.parse_page([table], text, card=parser.is_card_statement(text),
+                                 period_end=parser.find_period_end(text))
+
+        assert [(r['date'], r['amount']) for r in rows] == [
+            ('2023-12-28', Decimal('-42.10')), ('2024-01-02', Decimal('500.00')), ('2024-01-05', Decimal('15.00')),
+        ]
+
+    def test_yearless_rows_roll_into_the_next_year_without_a_period(self):
+        table = [['Date', 'Description', 'Amount'], ['12/30', 'A', '1.00'], ['01/02', 'B', '2.00']]
+
+        rows = StatementTableParser().parse_page([table], 'December 2023')
+
+        assert [r['date'] for r in rows] == ['2023-12-30', '2024-01-02']
+
+    def test_unrecognised_table_defers_to_llm(self):
+        summary = [['Account summary', ''], ['Beginning balance', '$1,000.00']]
+        assert StatementTableParser().parse_page([summary], '2024') is None
+
+    def test_low_confidence_table_defers_to_llm(self):
+        table = [
+            ['Date', 'Description', 'Amount'],
+            ['01/03/2024', 'OK ROW', '1.00'],
+            ['garbled', 'BAD ROW', 'n/a'],
+            ['also bad', 'BAD ROW', '??'],
+        ]
+        assert StatementTableParser().parse_page([table], '') is None
+
+
+class TestPDFTransactionExtractor:
+    def test_table_pages_skip_the_llm(self, settings):
+        settings.GEMINI_API_KEY = ''
+        pdf = FakePDF([FakePage('January 2024', [CHECKING_TABLE])])
+
+        with mock.patch('apps.finance.services.pdf_extractor.pdfplumber.open', return_value=pdf), \
+                mock.patch.object(PDFTransactionExtractor, 'parse_transactions_with_llm') as llm:
+            result = PDFTransactionExtractor().extract_transactions(io.BytesIO(b'%PDF-1.4 statement'), use_cache=False)
+
+        llm.assert_not_called()
+        assert result['metadata']['extraction_method'] == 'tables'
+        assert result['metadata']['pages_sent_to_llm'] == 0
+        assert [t['amount'] for t in result['transactions']] == [2500.0, -4.5, -1200.0]
+
+    def test_only_unparsed_pages_are_sent_to_llm(self, settings):
+        settings.GEMINI_API_KEY = 'test-key'
+        pdf = FakePDF([
+            FakePage('January 2024', [CHECKING_TABLE]),
+            FakePage('01/20 Wire transfer 300.00', []),
+        ])
+        llm_rows = [{'date': '2024-01-20', 'description': 'Wire transfer', 'amount': 300.0, 'category': 'TRANSFER'}]
+
+        with mock.patch('apps.finance.services.pdf_extractor.pdfplumber.open', return_value=pdf), \
+                mock.patch.object(PDFTransactionExtractor, 'parse_transactions_with_llm', return_value=llm_rows) as llm:
+            result = PDFTransactionExtractor().extract_transactions(io.BytesIO(b'%PDF-1.4 statement'), use_cache=False)
+
+        sent_text = llm.call_args[0][0]
+        assert 'Page 2' in sent_text and 'Page 1' not in sent_text
+        assert result['metadata']['extraction_method'] == 'mixed'
+        assert len(result['transactions']) == 4
+
+    def test_credit_account_reads_a_plain_amount_column_as_card_charges(self, settings):
+        settings.GEMINI_API_KEY = ''
+        table = [['Date', 'Description', 'Amount'], ['03/04/2024', 'GROCERY OUTLET', '63.20']]
+        pdf = FakePDF([FakePage('Statement', [table])])
+
+        with mock.patch('apps.finance.services.pdf_extractor.pdfplumber.open', return_value=pdf):
+            result = PDFTransactionExtractor().extract_transactions(
+                io.BytesIO(b'%PDF-1.4 card'), use_cache=False, account_type='credit',
+            )
+
+        assert [t['amount'] for t in result['transactions']] == [-63.2]
+
+    def test_repeat_upload_is_served_from_cache(self, settings):
+        settings.GEMINI_API_KEY = ''
+        settings.PDF_EXTRACTION_CACHE_ALIAS = 'default'
+        pdf = FakePDF([FakePage('January 2024', [CHECKING_TABLE])])
+        content = b'%PDF-1.4 cached statement'
+
+        with mock.patch('apps.finance.services.pdf_extractor.pdfplumber.open', return_value=pdf) as pdf_open:
+            first = PDFTransactionExtractor().extract_transactions(io.BytesIO(content))
+            second = PDFTransactionExtractor().extract_transactions(io.BytesIO(content))
+
+        assert pdf_open.call_count == 1
+        assert first['metadata']['cache_hit'] is False
+        assert second['metadata']['cache_hit'] is True
+        assert second['metadata']['content_hash'] == first['metadata']['content_hash']
+        assert second['transactions'] == first['transactions']
+
+
+@pytest.mark.django_db
+class TestImportPDFTransactions:
+    ROWS = [
+        {'date': '2024-01-05', 'description': 'COFFEE SHOP #12 SEATTLE WA', 'amount': -4.5, 'category': 'FOOD'},
+        {'date': '2024-01-05', 'description': 'COFFEE SHOP #12 SEATTLE WA', 'amount': -4.5, 'category': 'FOOD'},
+        {'date': '2024-01-09', 'description': 'RENT PAYMENT', 'amount': -1200, 'category': 'BILLS'},
+    ]
+
+    def test_confirming_twice_is_idempotent(self, account):
+        first = import_pdf_transactions(account, self.ROWS)
+        second = import_pdf_transactions(account, self.ROWS)
+
+        assert first == {'created': 3, 'duplicates_skipped': 0, 'errors': []}
+        assert second == {'created': 0, 'duplicates_skipped': 3, 'errors': []}
+        assert Transaction.objects.filter(account=account).count() == 3
+
+    def test_rows_already_synced_from_plaid_are_skipped(self, account):
+        Transaction.objects.create(
+            account=account, plaid_transaction_id='plaid-rent', amount=Decimal('1200.00'),
+            name='Rent Payment', date=date(2024, 1, 9), payment_channel='other',
+        )
+
+        result = import_pdf_transactions(account, self.ROWS)
+
+        assert result['created'] == 2
+        assert result['duplicates_skipped'] == 1
@@ -0,0 +1,82 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.finance.models import Holding, InvestmentTransaction, Security
+from apps.finance.services.portfolio import PortfolioAnalyticsService
+
+
+def make_holding(account, ticker, security_type, value, cost_basis=None):
+    security = Security.objects.create(plaid_security_id=f'sec-{ticker}', name=ticker, ticker_symbol=ticker, type=security_type)
+    return Holding.objects.create(
+        account=account, security=security, quantity=Decimal('10'), institution_price=value / 10,
+        institution_value=value, cost_basis=cost_basis,
+    )
+
+
+def make_investment_txn(account, txn_id, days_ago, txn_type, subtype, amount):
+    return InvestmentTransaction.objects.create(
+        account=account, plaid_investment_transaction_id=txn_id, amount=amount, type=txn_type, subtype=subtype,
+        date=timezone.now().date() - timedelta(days=days_ago), name=txn_id,
+    )
+
+
+@pytest.mark.django_db
+class TestPortfolioAnalytics:
+    @pytest.fixture
+    def portfolio(self, investment_account):
+        make_holding(investment_account, 'VTI', 'etf', Decimal('6000'), Decimal('5000'))
+        make_holding(investment_account, 'AAPL', 'equity', Decimal('3000'), Decimal('2000'))
+        make_holding(investment_account, 'BND', 'etf', Decimal('1000'))
+        make_investment_txn(investment_account, 'div-1', 40, 'cash', 'dividend', Decimal('-25.00'))
+        make_investment_txn(investment_account, 'div-2', 10, 'dividend', 'dividend', Decimal('-15.00'))
+        make_investment_txn(investment_account, 'buy-1', 100, 'buy', 'buy', Decimal('1000.00'))
+        return investment_account
+
+    def test_allocation_pnl_and_dividends(self, user, portfolio, django_assert_max_num_queries):
+        with django_assert_max_num_queries(5):
+            result = PortfolioAnalyticsService(user).analyze(use_cache=False)
+
+        totals = result['totals']
+        assert totals['total_value'] == 10000.0
+        assert totals['positions'] == 3
+        assert totals['cost_basis'] == 7000.0
+        assert totals['unrealized_gain_loss'] == 2000.0
+        assert totals['dividend_income'] == 40.0
+        # No stored closes, so no opening valuation to measure a return from
+        assert totals['period_return_percent'] is None
+        assert totals['return_method'] is None
+        assert result['accounts'][0]['period_return_percent'] is None
+        assert result['allocation']['by_security_type'] == [
+            {'security_type': 'etf', 'value': 7000.0, 'percent': 70.0},
+            {'security_type': 'equity', 'value': 3000.0, 'percent': 30.0},
+        ]
+        assert result['accounts'][0]['allocation_percent'] == 100.0
+        assert sum(month['amount'] for month in result['dividends_by_month']) == 40.0
+
+    def test_results_are_cached_until_invalidated(self, user, portfolio, django_assert_num_queries):
+        service = PortfolioAnalyticsService(user)
+        first = service.analyze()
+        with django_assert_num_queries(0):
+            assert service.analyze() == first
+
+        Holding.objects.filter(security__ticker_symbol='BND').delete()
+        PortfolioAnalyticsService.invalidate(user.id)
+        assert service.analyze()['totals']['total_value'] == 9000.0
+
+    def test_holdings_list_summary_and_analytics_endpoint(self, user, portfolio):
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        summary = client.get('/api/finance/holdings/').data['summary']
+        assert summary['total_value'] == 10000.0
+        assert summary['total_gain_loss'] == 2000.0
+        assert summary['holdings_count'] == 3
+
+        response = client.get('/api/finance/holdings/analytics/', {'period_days': 90})
+        assert response.status_code == 200
+        assert response.data['totals']['dividend_income'] == 40.0
+        assert client.get('/api/finance/holdings/analytics/', {'period_days': 'x'}).status_code == 400
@@ -0,0 +1,85 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.finance.models import Holding, InvestmentTransaction, PriceHistory, Security
+from apps.finance.services.position_history import PositionHistoryEngine, forward_fill, time_weighted_return
+
+
+def test_forward_fill_carries_last_price_and_backfills_leading_gap():
+    matrix = np.array([[np.nan, 2.0, np.nan, 4.0], [np.nan, np.nan, np.nan, np.nan]])
+
+    filled = forward_fill(matrix)
+
+    assert filled[0].tolist() == [2.0, 2.0, 2.0, 4.0]
+    assert np.isnan(filled[1]).all()
+
+
+def test_time_weighted_return_ignores_contributions():
+    # 100 -> 110 (+10%), then 100 is invested and the combined 210 grows to 231 (+10%)
+    values = np.array([100.0, 110.0, 210.0, 231.0])
+    flows = np.array([0.0, 0.0, 100.0, 0.0])
+
+    assert time_weighted_return(values, flows) == pytest.approx(0.21)
+
+
+@pytest.mark.django_db
+class TestPositionHistory:
+    @pytest.fixture
+    def history(self, investment_account):
+        today = timezone.now().date()
+        security = Security.objects.create(plaid_security_id='sec-vti', name='VTI', ticker_symbol='VTI', type='etf')
+        Holding.objects.create(
+            account=investment_account, security=security, quantity=Decimal('15'),
+            institution_price=Decimal('12'), institution_value=Decimal('180'),
+        )
+        for txn_id, days_ago, txn_type, quantity, amount in [
+            ('buy-1', 8, 'buy', '10', '100'),
+            ('sell-1', 4, 'sell', '-5', '-55'),
+            ('buy-2', 2, 'buy', '10', '110'),
+        ]:
+            InvestmentTransaction.objects.create(
+                account=investment_account, security=security, plaid_investment_transaction_id=txn_id,
+                amount=Decimal(amount), quantity=Decimal(quantity), type=txn_type, subtype=txn_type,
+                date=today - timedelta(days=days_ago), name=txn_id,
+            )
+        for days_ago, close in [(12, '10'), (6, '11'), (1, '12')]:
+            PriceHistory.objects.create(security=security, date=today - timedelta(days=days_ago), close_price=Decimal(close))
+        return today
+
+    def test_quantities_are_replayed_backwards_from_current_holdings(self, user, history):
+        result = PositionHistoryEngine(user).build(history - timedelta(days=10))
+
+        quantities = result['quantities'][0]
+        assert quantities[0] == 0      # before the first buy
+        assert quantities[2] == 10     # day of the first buy
+        assert quantities[6] == 5      # after the sale
+        assert quantities[-1] == 15    # today matches the holding
+        values = result['values'][0]
+        assert values[2] == pytest.approx(100.0)   # 10 shares at the last close before the window
+        assert values[-1] == pytest.approx(180.0)
+
+    def test_portfolio_trend_endpoint(self, user, history):
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        response = client.get('/api/finance/reports/portfolio-trend/', {'days': 10})
+
+        assert response.status_code == 200
+        assert len(response.data['dates']) == 11
+        assert response.data['total_values'][-1] == 180.0
+        assert response.data['time_weighted_return_percent'] is not None
+
+    def test_import_price_history_command(self, tmp_path, history):
+        path = tmp_path / 'prices.csv'
+        path.write_text('Date,Symbol,Close\n2020-01-02,VTI,150.10\n2020-01-03,vti,151.00\n2020-01-03,ZZZZ,1\nbad,VTI,1\n')
+
+        call_command('import_price_history', str(path))
+
+        prices = PriceHistory.objects.filter(security__ticker_symbol='VTI', source='csv').order_by('date')
+        assert [p.close_price for p in prices] == [Decimal('150.10'), Decimal('151.00')]
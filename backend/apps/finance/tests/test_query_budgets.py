@@ -0,0 +1,94 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+
+from apps.finance.models import (
+    Account, Holding, Institution, InvestmentTransaction, MonthlySpending, NetWorthSnapshot, RecurringTransaction,
+    Security, SpendingCategory, Transaction,
+)
+from samaanai.instrumentation import assert_query_budget
+
+
+@pytest.fixture
+def api_client(user):
+    """Three institutions' worth of every kind of finance data"""
+    today = timezone.now().date()
+    for index in range(3):
+        institution = Institution.objects.create(user=user, name=f'Bank {index}', item_id=f'item-{index}',
+                                                 access_token='x')
+        checking = Account.objects.create(institution=institution, plaid_account_id=f'dep-{index}',
+                                          name=f'Checking {index}', type='depository', subtype='checking')
+        brokerage = Account.objects.create(institution=institution, plaid_account_id=f'inv-{index}',
+                                           name=f'Brokerage {index}', type='investment', subtype='brokerage')
+        security = Security.objects.create(plaid_security_id=f'sec-{index}', name=f'Fund {index}', type='etf')
+        Holding.objects.create(account=brokerage, security=security, quantity=Decimal('1'),
+                               institution_price=Decimal('10'), institution_value=Decimal('10'))
+        InvestmentTransaction.objects.create(account=brokerage, plaid_investment_transaction_id=f'it-{index}',
+                                             amount=Decimal('5'), type='buy', subtype='buy', date=today,
+                                             name='Buy', security=security)
+        parent = SpendingCategory.objects.create(user=user, name=f'Category {index}', monthly_budget=Decimal('100'))
+        SpendingCategory.objects.create(user=user, name=f'Subcategory {index}', parent=parent)
+        MonthlySpending.objects.create(user=user, category=parent, year=today.year, month=today.month,
+                                       amount_spent=Decimal('40'))
+        RecurringTransaction.objects.create(user=user, name=f'Bill {index}', amount=Decimal('9.99'),
+                                            frequency='monthly', start_date=today, next_date=today)
+        NetWorthSnapshot.objects.create(user=user, date=today - timedelta(days=index))
+        for day in range(3):
+            Transaction.objects.create(account=checking, plaid_transaction_id=f'txn-{index}-{day}',
+                                       amount=Decimal('12.00'), name='Cafe', date=today - timedelta(days=day),
+                                       primary_category='FOOD_AND_DRINK')
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+LIST_ENDPOINTS = [
+    'institutions/', 'accounts/', 'transactions/', 'spending-categories/', 'spending-categories/tree/',
+    'recurring-transactions/', 'recurring-transactions/summary/', 'holdings/', 'holdings/analytics/',
+    'investment-transactions/', 'dashboard/', 'reports/monthly-spending/', 'reports/net-worth-trend/',
+    'reports/portfolio-trend/',
+]
+DETAIL_ENDPOINTS = [
+    ('institutions', Institution), ('accounts', Account), ('transactions', Transaction),
+    ('spending-categories', SpendingCategory), ('recurring-transactions', RecurringTransaction),
+    ('holdings', Holding), ('investment-transactions', InvestmentTransaction),
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('path', LIST_ENDPOINTS)
+def test_list_endpoints_stay_within_query_budget(api_client, path):
+    response = api_client.get(f'/api/finance/{path}')
+
+    assert response.status_code == 200
+    assert_query_budget(response)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('path,model', DETAIL_ENDPOINTS)
+def test_detail_endpoints_stay_within_query_budget(api_client, path, model):
+    response = api_client.get(f'/api/finance/{path}/{model.objects.first().id}/')
+
+    assert response.status_code == 200
+    assert_query_budget(response)
+
+
+@pytest.mark.django_db
+def test_responses_carry_server_timing_and_feed_request_histograms(api_client):
+    def observed():
+        return REGISTRY.get_sample_value(
+            'http_request_duration_seconds_count', {'view': 'account-list', 'method': 'GET'}
+        ) or 0
+
+    before = observed()
+    for _ in range(3):
+        response = api_client.get('/api/finance/accounts/')
+
+    timing = response['Server-Timing']
+    assert timing.startswith('db;dur=') and 'ser;dur=' in timing and 'total;dur=' in timing
+    assert response.request_metrics.serializer_time > 0
+    assert observed() == before + 3
@@ -0,0 +1,179 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.finance.models import RecurringTransaction, Transaction, UpcomingBill
+from apps.finance.services import RecurringTransactionDetectionService
+from apps.finance.services.recurring import (
+    cluster_amounts, detect_frequency, detect_recurring, next_occurrence, normalize_merchant, occurrences_between,
+)
+
+
+def test_normalize_merchant_strips_store_numbers_and_punctuation():
+    assert normalize_merchant('NETFLIX.COM #1234') == 'netflixcom'
+    assert normalize_merchant('  Spotify   USA ') == 'spotify usa'
+    assert normalize_merchant(None) == 'unknown'
+
+
+def test_cluster_amounts_keeps_price_changes_together():
+    labels = cluster_amounts(np.array([9.99, 10.49, 9.99, 54.00, 10.49]))
+
+    assert labels[0] == labels[1] == labels[2] == labels[4]
+    assert labels[3] != labels[0]
+
+
+def test_detect_frequency_tolerates_a_skipped_month():
+    start = date(2024, 1, 15)
+    dates = [start + relativedelta(months=offset) for offset in (0, 1, 2, 4, 5, 6)]
+
+    assert detect_frequency(np.array([d.toordinal() for d in dates]))[0] == 'monthly'
+
+
+def test_detect_recurring_rejects_irregular_spending():
+    start = date(2024, 1, 1)
+    rows = [(start + timedelta(days=offset), Decimal('12.00'), 'Corner Cafe', 'CORNER CAFE', 'FOOD_AND_DRINK')
+            for offset in (0, 3, 17, 19, 50, 52, 90)]
+
+    assert detect_recurring(rows) == []
+
+
+def test_detect_recurring_needs_three_charges_whatever_the_minimum():
+    rows = [(date(2024, month, 5), Decimal('15.49'), 'Netflix', 'NETFLIX', 'ENTERTAINMENT') for month in (1, 2)]
+
+    assert detect_recurring(rows, min_occurrences=2) == []
+    rows.append((date(2024, 3, 5), Decimal('15.49'), 'Netflix', 'NETFLIX', 'ENTERTAINMENT'))
+    assert [p['merchant'] for p in detect_recurring(rows, min_occurrences=1)] == ['Netflix']
+
+
+def test_next_occurrence_is_closed_form_and_keeps_month_end():
+    assert next_occurrence(date(2024, 1, 31), 'monthly', date(2024, 3, 5)) == date(2024, 3, 31)
+    assert next_occurrence(date(2024, 1, 15), 'monthly', date(2024, 1, 20)) == date(2024, 2, 15)
+    assert next_occurrence(date(2024, 1, 1), 'weekly', date(2024, 1, 15)) == date(2024, 1, 15)
+    assert next_occurrence(date(2023, 6, 1), 'yearly', date(2024, 7, 1)) == date(2025, 6, 1)
+
+
+def test_occurrences_between_stops_at_end_date():
+    assert occurrences_between(date(2024, 1, 31), 'monthly', date(2024, 4, 15)) == [
+        date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31),
+    ]
+    assert len(occurrences_between(date(2024, 1, 1), 'bi_weekly', date(2024, 3, 31))) == 7
+
+
+@pytest.fixture
+def subscription(account):
+    today = timezone.now().date()
+    for offset in range(6, 0, -1):
+        Transaction.objects.create(
+            account=account,
+            plaid_transaction_id=f'txn-stream-{offset}',
+            amount=Decimal('9.99') if offset > 3 else Decimal('10.49'),
+            name='STREAMFLIX #4421',
+            merchant_name='Streamflix',
+            primary_category='ENTERTAINMENT',
+            date=today - relativedelta(months=offset),
+            payment_channel='online',
+        )
+    return account
+
+
+@pytest.mark.django_db
+def test_detection_groups_a_subscription_across_a_price_increase(subscription):
+    account = subscription
+    today = timezone.now().date()
+    patterns = RecurringTransactionDetectionService().detect_recurring_transactions(account.institution.user)
+
+    assert len(patterns) == 1
+    pattern = patterns[0]
+    assert pattern['merchant'] == 'Streamflix'
+    assert pattern['frequency'] == 'monthly'
+    assert pattern['occurrences'] == 6
+    assert pattern['amount'] == pytest.approx(10.24)
+    assert pattern['first_date'] == today - relativedelta(months=6)
+
+
+@pytest.mark.django_db
+class TestRecurringCreation:
+    def test_creates_in_bulk_and_matches_existing_on_rerun(self, subscription, django_assert_max_num_queries):
+        user = subscription.institution.user
+        service = RecurringTransactionDetectionService()
+
+        patterns = service.create_recurring_transactions(user, auto_create=True)
+
+        recurring = RecurringTransaction.objects.get(user=user)
+        assert patterns[0]['created_id'] == str(recurring.id)
+        assert recurring.is_auto_detected
+        assert recurring.next_date >= timezone.now().date()
+
+        with django_assert_max_num_queries(4):
+            rerun = service.create_recurring_transactions(user, auto_create=True)
+        assert rerun[0]['existing_id'] == str(recurring.id)
+        assert RecurringTransaction.objects.filter(user=user).count() == 1
+
+    def test_detect_recurring_command_projects_upcoming_bills(self, subscription):
+        user = subscription.institution.user
+
+        call_command('detect_recurring', '--all-users', '--workers', '1')
+
+        bills = list(UpcomingBill.objects.filter(user=user))
+        # A monthly bill projected 90 days ahead lands three times
+        assert len(bills) == 3
+        assert all(bill.name == 'Streamflix' and not bill.is_income for bill in bills)
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get('/api/finance/recurring-transactions/summary/')
+        assert response.status_code == 200
+        assert response.data['projected_90_days']['bills'] == 3
+        assert response.data['projected_90_days']['expenses'] == Decimal('30.72')
+
+
+@pytest.mark.django_db
+def test_summary_is_two_queries_and_keeps_decimal_precision(user, django_assert_num_queries):
+    today = timezone.now().date()
+    for index, (amount, frequency, is_income) in enumerate([
+        ('10.00', 'weekly', False),
+        ('120.00', 'yearly', False),
+        ('30.00', 'quarterly', False),
+        ('2500.00', 'bi_weekly', True),
+    ]):
+        RecurringTransaction.objects.create(
+            user=user, name=f'Item {index}', amount=Decimal(amount), frequency=frequency,
+            is_income=is_income, start_date=today, next_date=today + timedelta(days=3 + index * 10),
+        )
+    RecurringTransactionDetectionService().refresh_upcoming_bills(user)
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with django_assert_num_queries(2):
+        response = client.get('/api/finance/recurring-transactions/summary/')
+
+    assert response.status_code == 200
+    # 10*52/12 + 120/12 + 30*4/12 = 43.33 + 10 + 10
+    assert response.data['monthly_expenses'] == Decimal('63.33')
+    assert response.data['monthly_income'] == Decimal('5416.67')
+    assert response.data['total_active'] == 4
+    assert response.data['upcoming_count'] == 1
+    assert response.data['projected_90_days']['bills'] == UpcomingBill.objects.filter(user=user).count()
+
+
+@pytest.mark.django_db
+def test_summary_rebuilds_a_projection_not_refreshed_today(user):
+    cache.clear()
+    today = timezone.now().date()
+    RecurringTransaction.objects.create(
+        user=user, name='Gym', amount=Decimal('40.00'), frequency='monthly', start_date=today, next_date=today,
+    )
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    response = client.get('/api/finance/recurring-transactions/summary/')
+
+    assert UpcomingBill.objects.filter(user=user).count() >= 3
+    assert response.data['projected_90_days']['bills'] == UpcomingBill.objects.filter(user=user).count()
@@ -0,0 +1,110 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from apps.finance.services import TransactionSyncService
+from apps.finance.services.locks import SyncInProgress, SyncLock, exclusive_sync, institution_sync_lock
+
+
+class FakeSyncService:
+    calls = 0
+
+    @exclusive_sync('transactions', join_timeout=0)
+    def sync(self, institution):
+        self.calls += 1
+        return True
+
+
+def test_lock_is_exclusive_until_released():
+    with institution_sync_lock('inst-1') as first:
+        with institution_sync_lock('inst-1') as second:
+            assert first and not second
+        with institution_sync_lock('inst-1', scope='holdings') as other_scope:
+            assert other_scope
+    with institution_sync_lock('inst-1') as again:
+        assert again
+
+
+def test_second_caller_joins_the_running_sync():
+    service = FakeSyncService()
+    institution = mock.Mock(id='inst-2')
+
+    with institution_sync_lock('inst-2'):
+        assert service.sync(institution) is None
+    assert service.calls == 0
+
+    assert service.sync(institution) is True
+    assert service.calls == 1
+
+
+def test_request_during_a_run_makes_the_holder_sync_again():
+    cache.clear()
+    institution = mock.Mock(id='inst-4')
+
+    class Service:
+        calls = 0
+
+        @exclusive_sync('transactions', join_timeout=0)
+        def sync(self, institution):
+            self.calls += 1
+            if self.calls == 1:
+                # A webhook arrives while the first run is paging
+                with pytest.raises(SyncInProgress):
+                    self.sync(institution, wait=False)
+            return True
+
+    service = Service()
+    assert service.sync(institution) is True
+    assert service.calls == 2
+
+
+def test_joiner_syncs_itself_when_the_holder_missed_its_flag():
+    cache.clear()
+    service = FakeSyncService()
+    institution = mock.Mock(id='inst-5')
+
+    holder = SyncLock('institution:inst-5:transactions')
+    assert holder.acquire()
+
+    def holder_finishes(timeout):
+        # The holder already checked for requests before ours was flagged
+        holder.release()
+        return True
+
+    with mock.patch.object(SyncLock, 'wait', side_effect=holder_finishes):
+        assert service.sync(institution) is True
+    assert service.calls == 1
+
+
+def test_wait_returns_once_the_lock_is_free():
+    lock = SyncLock('institution:inst-3:transactions')
+    assert lock.wait(timeout=0)
+
+    with institution_sync_lock('inst-3'):
+        assert not lock.wait(timeout=0)
+
+
+@pytest.mark.django_db
+def test_transaction_sync_skips_plaid_while_another_run_holds_the_lock(institution):
+    with mock.patch('apps.finance.services.PlaidService') as plaid:
+        service = TransactionSyncService()
+        with institution_sync_lock(institution.id):
+            with mock.patch('apps.finance.services.locks.SyncLock.wait', return_value=True):
+                assert service.sync_institution_transactions(institution) is None
+    plaid.return_value.sync_transactions.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_sync_endpoint_answers_at_once_while_a_sync_runs(user, institution):
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with mock.patch('apps.finance.services.PlaidService') as plaid:
+        with institution_sync_lock(institution.id):
+            response = client.post(f'/api/finance/institutions/{institution.id}/sync_transactions/')
+
+    assert response.status_code == 202
+    assert response.data == {'status': 'sync_in_progress'}
+    plaid.return_value.sync_transactions.assert_not_called()
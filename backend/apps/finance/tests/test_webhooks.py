@@ -0,0 +1,108 @@
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from apps.finance.models import PlaidWebhook, Transaction
+from apps.finance.services.locks import sync_lock
+from apps.finance.services.webhooks import WebhookProcessor
+
+
+@pytest.fixture
+def sync_service():
+    service = mock.Mock()
+    service.sync_institution_transactions.return_value = True
+    return service
+
+
+def _webhook(item_id, webhook_type='TRANSACTIONS', webhook_code='DEFAULT_UPDATE', **payload):
+    return PlaidWebhook.objects.create(
+        webhook_type=webhook_type,
+        webhook_code=webhook_code,
+        item_id=item_id,
+        payload={'webhook_type': webhook_type, 'webhook_code': webhook_code, 'item_id': item_id, **payload},
+    )
+
+
+@pytest.mark.django_db
+class TestWebhookProcessing:
+    def test_endpoint_only_persists(self, institution):
+        with mock.patch('apps.finance.services.TransactionSyncService.sync_institution_transactions') as sync:
+            response = APIClient().post('/api/finance/plaid/webhook/', {
+                'webhook_type': 'TRANSACTIONS', 'webhook_code': 'DEFAULT_UPDATE', 'item_id': institution.item_id,
+            }, format='json')
+
+        assert response.status_code == 200
+        sync.assert_not_called()
+        assert PlaidWebhook.objects.filter(item_id=institution.item_id, processed=False).count() == 1
+
+    def test_events_for_an_item_coalesce_into_one_sync(self, institution, account, sync_service):
+        Transaction.objects.create(
+            account=account, plaid_transaction_id='txn-gone', amount='5.00', name='Gone',
+            date='2024-01-02', payment_channel='online',
+        )
+        for _ in range(3):
+            _webhook(institution.item_id)
+        _webhook(institution.item_id, webhook_code='TRANSACTIONS_REMOVED', removed_transactions=['txn-gone'])
+
+        stats = WebhookProcessor(sync_service).process_pending()
+
+        assert stats['events'] == 4
+        assert stats['syncs'] == 1
+        sync_service.sync_institution_transactions.assert_called_once()
+        assert not Transaction.objects.filter(plaid_transaction_id='txn-gone').exists()
+        assert not PlaidWebhook.objects.filter(processed=False).exists()
+
+    def test_locked_item_is_deferred_for_the_next_run(self, institution, sync_service):
+        webhook = _webhook(institution.item_id)
+        with sync_lock(f"webhook_item:{institution.item_id}"):
+            stats = WebhookProcessor(sync_service).process_pending()
+
+        assert stats['deferred'] == 1
+        sync_service.sync_institution_transactions.assert_not_called()
+        webhook.refresh_from_db()
+        assert not webhook.processed and webhook.claimed_at is None and webhook.attempts == 0
+
+    def test_events_stay_pending_until_a_sync_really_runs(self, institution, sync_service):
+        webhook = _webhook(institution.item_id)
+        # Joined a sync that was already running
+        sync_service.sync_institution_transactions.return_value = None
+        processor = WebhookProcessor(sync_service)
+
+        stats = processor.process_pending()
+
+        assert stats['syncs'] == 0 and stats['deferred'] == 1
+        webhook.refresh_from_db()
+        assert not webhook.processed and webhook.claimed_at is None and webhook.attempts == 1
+
+        sync_service.sync_institution_transactions.return_value = True
+        assert processor.process_pending()['syncs'] == 1
+        webhook.refresh_from_db()
+        assert webhook.processed and webhook.error is None
+
+    def test_event_is_left_failed_after_max_attempts(self, institution, sync_service):
+        webhook = _webhook(institution.item_id)
+        sync_service.sync_institution_transactions.side_effect = RuntimeError('Plaid is down')
+        processor = WebhookProcessor(sync_service)
+
+        for _ in range(WebhookProcessor.MAX_ATTEMPTS):
+            PlaidWebhook.objects.update(claimed_at=None)
+            assert processor.process_pending()['failed'] == 1
+        PlaidWebhook.objects.update(claimed_at=None)
+
+        assert processor.process_pending()['events'] == 0
+        webhook.refresh_from_db()
+        assert not webhook.processed
+        assert webhook.attempts == WebhookProcessor.MAX_ATTEMPTS
+        assert webhook.error == 'Plaid is down'
+
+    def test_command_drains_the_queue(self, institution):
+        _webhook(institution.item_id, webhook_type='ITEM', webhook_code='ERROR', error={'error_code': 'ITEM_LOGIN_REQUIRED'})
+
+        call_command('process_webhooks')
+
+        institution.refresh_from_db()
+        assert institution.needs_update
+        assert 'ITEM_LOGIN_REQUIRED' in institution.error_message
+        assert PlaidWebhook.objects.get().processed
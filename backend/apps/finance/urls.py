@@ -14,6 +14,7 @@ from .views import (
     DashboardView,
     MonthlySpendingView,
     NetWorthTrendView,
+    PortfolioTrendView,
     PlaidWebhookView,
     CSVImportView,
     PDFImportView,
@@ -38,6 +39,7 @@ urlpatterns = [
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('reports/monthly-spending/', MonthlySpendingView.as_view(), name='monthly-spending'),
     path('reports/net-worth-trend/', NetWorthTrendView.as_view(), name='net-worth-trend'),
+    path('reports/portfolio-trend/', PortfolioTrendView.as_view(), name='portfolio-trend'),
     path('import/csv/', CSVImportView.as_view(), name='csv-import'),
     path('import/pdf/', PDFImportView.as_view(), name='pdf-import'),
     path('import/pdf/confirm/', PDFImportConfirmView.as_view(), name='pdf-import-confirm'),
@@ -4,18 +4,21 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, F, OuterRef, Q, Subquery
 from django.utils import timezone
 from datetime import datetime, timedelta
+from decimal import Decimal
 import logging
 import secrets
 import uuid
 from django.conf import settings
 
+from samaanai.metrics import KNOWN_WEBHOOK_TYPES, WEBHOOKS_RECEIVED
+
 from .models import (
     Institution, Account, Transaction, SpendingCategory,
     MonthlySpending, NetWorthSnapshot, PlaidWebhook, Holding, InvestmentTransaction,
-    RecurringTransaction
+    RecurringTransaction, UpcomingBill
 )
 from .serializers import (
     InstitutionSerializer, AccountSerializer, TransactionSerializer,
@@ -26,6 +29,7 @@ from .serializers import (
     RecurringTransactionSerializer
 )
 from .services import PlaidService, TransactionSyncService, AnalyticsService
+from .services.locks import SyncInProgress
 
 logger = logging.getLogger(__name__)
 
@@ -153,9 +157,12 @@ class ExchangePublicTokenView(views.APIView):
                         is_active=True,
                     )
             
-            # Sync initial transactions
+            # Sync initial transactions; if a webhook already started that sync, it will cover this item too
             sync_service = TransactionSyncService()
-            sync_service.sync_institution_transactions(institution)
+            try:
+                sync_service.sync_institution_transactions(institution, wait=False)
+            except SyncInProgress as e:
+                logger.info(f"{e}; not waiting for it")
             
             # Check if there are investment accounts and sync investment data
             investment_accounts = Account.objects.filter(
@@ -170,14 +177,10 @@ class ExchangePublicTokenView(views.APIView):
                     investment_service = InvestmentSyncService()
                     
                     # Sync holdings
-                    investment_service.sync_institution_holdings(institution)
+                    investment_service.sync_institution_holdings(institution, wait=False)
                     
-                    # Sync investment transactions (last 1 year)
-                    start_date = (datetime.now() - timedelta(days=365)).date()
-                    end_date = datetime.now().date()
-                    investment_service.sync_institution_investment_transactions(
-                        institution, start_date, end_date
-                    )
+                    # Sync investment transactions since each account's watermark
+                    investment_service.sync_institution_investment_transactions(institution, wait=False)
                 except Exception as e:
                     logger.warning(f"Could not sync investment data: {e}")
                     # Don't fail the whole process if investment sync fails
@@ -218,7 +221,7 @@ class InstitutionViewSet(viewsets.ModelViewSet):
         
         try:
             sync_service = TransactionSyncService()
-            sync_service.sync_institution_transactions(institution)
+            sync_service.sync_institution_transactions(institution, wait=False)
             
             # Also sync holdings if institution has investment accounts
             from .services import InvestmentSyncService
@@ -230,18 +233,17 @@ class InstitutionViewSet(viewsets.ModelViewSet):
             if investment_accounts.exists():
                 try:
                     investment_service = InvestmentSyncService()
-                    investment_service.sync_institution_holdings(institution)
+                    investment_service.sync_institution_holdings(institution, wait=False)
                     
-                    # Sync investment transactions (last 1 year)
-                    start_date = (datetime.now() - timedelta(days=365)).date()
-                    end_date = datetime.now().date()
-                    investment_service.sync_institution_investment_transactions(
-                        institution, start_date, end_date
-                    )
+                    # Sync investment transactions since each account's watermark
+                    investment_service.sync_institution_investment_transactions(institution, wait=False)
                 except Exception as e:
                     logger.warning(f"Could not sync investment data: {e}")
             
             return Response({"status": "success"})
+        except SyncInProgress:
+            # The running sync goes round again for this request; don't hold the worker
+            return Response({"status": "sync_in_progress"}, status=status.HTTP_202_ACCEPTED)
         except Exception as e:
             logger.error(f"Error syncing transactions: {e}")
             return Response(
@@ -266,16 +268,14 @@ class InstitutionViewSet(viewsets.ModelViewSet):
                 return Response({"status": "no_investment_accounts"})
             
             investment_service = InvestmentSyncService()
-            investment_service.sync_institution_holdings(institution)
+            investment_service.sync_institution_holdings(institution, wait=False)
             
-            # Also sync investment transactions (last 1 year)
-            start_date = (datetime.now() - timedelta(days=365)).date()
-            end_date = datetime.now().date()
-            investment_service.sync_institution_investment_transactions(
-                institution, start_date, end_date
-            )
+            # Also sync investment transactions since each account's watermark
+            investment_service.sync_institution_investment_transactions(institution, wait=False)
             
             return Response({"status": "success"})
+        except SyncInProgress:
+            return Response({"status": "sync_in_progress"}, status=status.HTTP_202_ACCEPTED)
         except Exception as e:
             logger.error(f"Error syncing holdings: {e}")
             return Response(
@@ -756,44 +756,94 @@ class RecurringTransactionViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+        self._refresh_projection()
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        self._refresh_projection()
+    
+    def perform_destroy(self, instance):
+        instance.delete()
+        self._refresh_projection()
+    
+    def _refresh_projection(self):
+        """Keep the upcoming-bills projection in step with the user's edits"""
+        from .services import RecurringTransactionDetectionService
+        RecurringTransactionDetectionService().refresh_upcoming_bills(self.request.user)
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Get summary of recurring transactions"""
-        recurring = self.get_queryset().filter(is_active=True)
+        from .services import RecurringTransactionDetectionService
+        RecurringTransactionDetectionService().ensure_upcoming_bills(request.user)
         
-        # Calculate monthly totals
-        monthly_income = sum(r.monthly_amount for r in recurring if r.is_income)
-        monthly_expenses = sum(r.monthly_amount for r in recurring if not r.is_income)
+        recurring = self.get_queryset().filter(is_active=True)
+        today = timezone.now().date()
+        
+        # Each row's share of the 90-day projection, so the totals ride along in the same aggregate
+        projected = UpcomingBill.objects.filter(
+            recurring_transaction=OuterRef('pk'),
+            due_date__gte=today,
+        ).values('recurring_transaction')
+        totals = recurring.annotate(
+            annual=RecurringTransaction.annual_amount_expression(),
+            projected_total=Subquery(projected.annotate(total=Sum('amount')).values('total')),
+            projected_count=Subquery(projected.annotate(bills=Count('id')).values('bills')),
+        ).aggregate(
+            annual_income=Sum('annual', filter=Q(is_income=True)),
+            annual_expenses=Sum('annual', filter=Q(is_income=False)),
+            total_active=Count('id'),
+            projected_income=Sum('projected_total', filter=Q(is_income=True)),
+            projected_expenses=Sum('projected_total', filter=Q(is_income=False)),
+            projected_bills=Sum('projected_count'),
+        )
         
-        # Get upcoming (due in next 7 days)
-        upcoming = [r for r in recurring if r.is_due_soon]
+        # Get upcoming (due in next 7 days) via the (user, next_date) index
+        upcoming = recurring.filter(next_date__lte=today + timedelta(days=7))
         upcoming_serializer = RecurringTransactionSerializer(upcoming, many=True)
+        upcoming_data = upcoming_serializer.data
+        
+        def cents(value, divisor=1):
+            return (Decimal(str(value or 0)) / divisor).quantize(Decimal('0.01'))
+        
+        monthly_income = cents(totals['annual_income'], 12)
+        monthly_expenses = cents(totals['annual_expenses'], 12)
         
         return Response({
-            'monthly_income': round(monthly_income, 2),
-            'monthly_expenses': round(monthly_expenses, 2),
-            'net_monthly': round(monthly_income - monthly_expenses, 2),
-            'total_active': recurring.count(),
-            'upcoming_count': len(upcoming),
-            'upcoming': upcoming_serializer.data
+            'monthly_income': monthly_income,
+            'monthly_expenses': monthly_expenses,
+            'net_monthly': monthly_income - monthly_expenses,
+            'total_active': totals['total_active'],
+            'upcoming_count': len(upcoming_data),
+            'upcoming': upcoming_data,
+            'projected_90_days': {
+                'expenses': cents(totals['projected_expenses']),
+                'income': cents(totals['projected_income']),
+                'bills': totals['projected_bills'] or 0,
+            },
         })
     
     @action(detail=False, methods=['post'])
     def detect_patterns(self, request):
         """Auto-detect recurring transactions from transaction history"""
         from .services import RecurringTransactionDetectionService
+        from .services.recurring import MIN_OCCURRENCES
         
         detection_service = RecurringTransactionDetectionService()
         
         # auto_create defaults to True - creates the recurring transactions
         auto_create = request.data.get('auto_create', True)
-        min_occurrences = request.data.get('min_occurrences', 3)
+        try:
+            min_occurrences = max(int(request.data.get('min_occurrences', MIN_OCCURRENCES)), MIN_OCCURRENCES)
+        except (TypeError, ValueError):
+            return Response({'error': 'min_occurrences must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
         
         patterns = detection_service.create_recurring_transactions(
             user=request.user,
-            auto_create=auto_create
+            auto_create=auto_create,
+            min_occurrences=min_occurrences,
         )
+        detection_service.refresh_upcoming_bills(request.user)
         
         # Serialize the patterns for response (exclude transaction objects)
         serialized_patterns = []
@@ -855,12 +905,17 @@ class HoldingViewSet(viewsets.ReadOnlyModelViewSet):
         
         serializer = self.get_serializer(queryset, many=True)
         
-        # Calculate portfolio summary
-        total_value = sum(holding.institution_value for holding in queryset)
-        total_gain_loss = sum(
-            holding.unrealized_gain_loss for holding in queryset 
-            if holding.unrealized_gain_loss is not None
+        # Calculate portfolio summary in a single aggregate query
+        summary = queryset.order_by().aggregate(
+            total_value=Sum('institution_value'),
+            total_gain_loss=Sum(
+                F('institution_value') - F('cost_basis'),
+                filter=Q(cost_basis__isnull=False) & ~Q(cost_basis=0)
+            ),
+            holdings_count=Count('id'),
         )
+        total_value = summary['total_value'] or 0
+        total_gain_loss = summary['total_gain_loss']
         
         return Response({
             'holdings': serializer.data,
@@ -869,9 +924,28 @@ class HoldingViewSet(viewsets.ReadOnlyModelViewSet):
                 'total_value_display': f"${total_value:,.2f}",
                 'total_gain_loss': float(total_gain_loss) if total_gain_loss else None,
                 'total_gain_loss_display': f"${total_gain_loss:,.2f}" if total_gain_loss else "N/A",
-                'holdings_count': len(queryset)
+                'holdings_count': summary['holdings_count']
             }
         })
+    
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Portfolio analytics: allocation, cost basis and P&L, period returns and dividends.
+        
+        Query params:
+        - period_days: Return/dividend window in days (default: 365)
+        """
+        from .services.portfolio import PortfolioAnalyticsService
+        
+        try:
+            period_days = int(request.query_params.get('period_days', PortfolioAnalyticsService.DEFAULT_PERIOD_DAYS))
+        except ValueError:
+            return Response({"error": "period_days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= period_days <= 3650:
+            return Response({"error": "period_days must be between 1 and 3650"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(PortfolioAnalyticsService(request.user).analyze(period_days))
 
 
 class InvestmentTransactionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -1033,6 +1107,36 @@ class NetWorthTrendView(views.APIView):
         return Response(serializer.data)
 
 
+class PortfolioTrendView(views.APIView):
+    """Daily investment portfolio value rebuilt from transactions and price history"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    MAX_DAYS = 3650
+    
+    def get(self, request):
+        from .services.position_history import PositionHistoryEngine
+        
+        try:
+            days = int(request.query_params.get('days', 365))
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        days = max(1, min(days, self.MAX_DAYS))
+        
+        account_ids = None
+        account_id = request.query_params.get('account_id')
+        if account_id:
+            try:
+                uuid.UUID(account_id)
+            except (ValueError, TypeError):
+                return Response({"error": "Invalid account_id"}, status=status.HTTP_400_BAD_REQUEST)
+            account_ids = [account_id]
+        
+        end_date = timezone.now().date()
+        start_date = end_date - timedelta(days=days)
+        trend = PositionHistoryEngine(request.user, account_ids).portfolio_trend(start_date, end_date)
+        return Response(trend)
+
+
 class PlaidWebhookView(views.APIView):
     """Handle Plaid webhooks"""
     authentication_classes = []
@@ -1053,50 +1157,16 @@ class PlaidWebhookView(views.APIView):
             logger.warning("Rejected Plaid webhook due to invalid secret")
             return Response({"error": "Invalid webhook signature"}, status=status.HTTP_403_FORBIDDEN)
 
-        webhook_type = request.data.get('webhook_type')
-        webhook_code = request.data.get('webhook_code')
-        item_id = request.data.get('item_id')
-
-        # Save webhook for processing
-        webhook = PlaidWebhook.objects.create(
+        # Only persist here; the process_webhooks worker (the finance-process-webhooks
+        # scheduled job) syncs outside Plaid's request
+        webhook_type = request.data.get('webhook_type') or ''
+        PlaidWebhook.objects.create(
             webhook_type=webhook_type,
-            webhook_code=webhook_code,
-            item_id=item_id,
+            webhook_code=request.data.get('webhook_code') or '',
+            item_id=request.data.get('item_id') or '',
             payload=request.data,
         )
-
-        try:
-            if webhook_type == 'TRANSACTIONS':
-                if webhook_code in ['INITIAL_UPDATE', 'DEFAULT_UPDATE']:
-                    try:
-                        institution = Institution.objects.get(item_id=item_id)
-                    except Institution.DoesNotExist:
-                        logger.warning("Plaid webhook received for unknown item_id %s", item_id)
-                    else:
-                        sync_service = TransactionSyncService()
-                        sync_service.sync_institution_transactions(institution)
-                elif webhook_code == 'TRANSACTIONS_REMOVED':
-                    removed_ids = request.data.get('removed_transactions', [])
-                    if removed_ids and item_id:
-                        Transaction.objects.filter(
-                            account__institution__item_id=item_id,
-                            plaid_transaction_id__in=removed_ids
-                        ).delete()
-
-            elif webhook_type == 'ITEM' and webhook_code == 'ERROR' and item_id:
-                Institution.objects.filter(item_id=item_id).update(
-                    needs_update=True,
-                    error_message=str(request.data.get('error'))
-                )
-
-            webhook.processed = True
-            webhook.processed_at = timezone.now()
-            webhook.save(update_fields=['processed', 'processed_at'])
-
-        except Exception as e:
-            logger.error(f"Error processing webhook: {e}")
-            webhook.error = str(e)
-            webhook.save(update_fields=['error'])
+        WEBHOOKS_RECEIVED.labels(webhook_type if webhook_type in KNOWN_WEBHOOK_TYPES else 'other').inc()
 
         return Response({"status": "received"})
 
@@ -1106,10 +1176,7 @@ class CSVImportView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
-        import csv
-        import io
-        from decimal import Decimal, InvalidOperation
-        from dateutil import parser as date_parser
+        from .services.csv_importer import FidelityCSVImporter, detect_import_type, read_csv
         
         csv_file = request.FILES.get('file')
         import_type = request.data.get('type', 'auto')  # 'transactions', 'holdings', or 'auto'
@@ -1119,23 +1186,14 @@ class CSVImportView(views.APIView):
             return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            # Read CSV content
-            decoded_file = csv_file.read().decode('utf-8-sig')  # utf-8-sig handles BOM
-            reader = csv.DictReader(io.StringIO(decoded_file))
-            rows = list(reader)
+            # Rows are decoded and parsed lazily from the upload's chunks
+            columns, rows = read_csv(csv_file)
             
-            if not rows:
+            if columns is None:
                 return Response({"error": "CSV file is empty"}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Detect file type based on columns
-            columns = set(rows[0].keys()) if rows else set()
-            columns_lower = {c.lower().strip() for c in columns}
-            
-            is_holdings = any(col in columns_lower for col in ['current value', 'cost basis', 'last price', 'current_value'])
-            is_transactions = any(col in columns_lower for col in ['action', 'run date', 'settlement date', 'trade date'])
-            
             if import_type == 'auto':
-                import_type = 'holdings' if is_holdings else 'transactions'
+                import_type = detect_import_type(columns)
             
             # Get or create manual institution for this user
             institution, inst_created = Institution.objects.get_or_create(
@@ -1159,273 +1217,21 @@ class CSVImportView(views.APIView):
                 'transactions_updated': 0,
                 'holdings_created': 0,
                 'holdings_updated': 0,
+                'holdings_removed': 0,
                 'errors': []
             }
             
+            importer = FidelityCSVImporter(institution, result)
             if import_type == 'holdings':
-                result = self._import_fidelity_holdings(request.user, institution, rows, result)
+                result = importer.import_holdings(columns, rows)
             else:
-                result = self._import_fidelity_transactions(request.user, institution, rows, result)
+                result = importer.import_transactions(columns, rows)
             
             return Response(result)
             
         except Exception as e:
             logger.error(f"Error importing CSV: {e}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    def _import_fidelity_holdings(self, user, institution, rows, result):
-        """Import Fidelity holdings CSV"""
-        from decimal import Decimal, InvalidOperation
-        from .models import Account, Security, Holding
-        
-        accounts_cache = {}
-        
-        for row_num, row in enumerate(rows, start=2):
-            try:
-                # Normalize column names (Fidelity uses various naming conventions)
-                row_lower = {k.lower().strip(): v.strip() if v else '' for k, v in row.items()}
-                
-                # Extract account info
-                account_number = row_lower.get('account number', row_lower.get('account', '')).strip()
-                account_name = row_lower.get('account name', row_lower.get('account type', f'Fidelity Account')).strip()
-                
-                if not account_number:
-                    # Try to extract from first column
-                    first_val = list(row.values())[0] if row else ''
-                    if first_val and first_val.replace('-', '').isdigit():
-                        account_number = first_val
-                    else:
-                        continue  # Skip rows without account number
-                
-                # Get or create account
-                if account_number not in accounts_cache:
-                    account, acc_created = Account.objects.get_or_create(
-                        plaid_account_id=f"manual_{account_number}",
-                        defaults={
-                            'institution': institution,
-                            'name': account_name or f"Fidelity {account_number[-4:]}",
-                            'official_name': account_name,
-                            'mask': account_number[-4:] if len(account_number) >= 4 else account_number,
-                            'type': 'investment',
-                            'subtype': 'brokerage',
-                            'current_balance': 0,
-                            'is_active': True,
-                            'is_selected': True,
-                        }
-                    )
-                    # Update institution if account exists but was orphaned
-                    if not acc_created and account.institution_id != institution.id:
-                        account.institution = institution
-                        account.save()
-                    
-                    accounts_cache[account_number] = account
-                    if acc_created:
-                        result['accounts_created'] += 1
-                    else:
-                        result['accounts_updated'] += 1
-                
-                account = accounts_cache[account_number]
-                
-                # Extract holding data
-                symbol = row_lower.get('symbol', row_lower.get('ticker', '')).strip()
-                description = row_lower.get('description', row_lower.get('security description', row_lower.get('name', ''))).strip()
-                
-                # Skip cash or empty rows
-                if not symbol or symbol in ['--', 'N/A', 'Pending Activity'] or 'CASH' in symbol.upper():
-                    continue
-                
-                # Parse numeric values (Fidelity uses $ and comma formatting)
-                def parse_money(val):
-                    if not val or val in ['--', 'N/A', '$--']:
-                        return None
-                    try:
-                        clean = val.replace('$', '').replace(',', '').replace('(', '-').replace(')', '').strip()
-                        return Decimal(clean) if clean else None
-                    except (InvalidOperation, ValueError):
-                        return None
-                
-                def parse_quantity(val):
-                    if not val or val in ['--', 'N/A']:
-                        return Decimal('0')
-                    try:
-                        clean = val.replace(',', '').strip()
-                        return Decimal(clean) if clean else Decimal('0')
-                    except (InvalidOperation, ValueError):
-                        return Decimal('0')
-                
-                quantity = parse_quantity(row_lower.get('quantity', row_lower.get('shares', '0')))
-                last_price = parse_money(row_lower.get('last price', row_lower.get('price', '')))
-                current_value = parse_money(row_lower.get('current value', row_lower.get('value', '')))
-                cost_basis = parse_money(row_lower.get('cost basis total', row_lower.get('cost basis', row_lower.get('cost basis per share', ''))))
-                
-                if quantity == 0 and not current_value:
-                    continue  # Skip empty holdings
-                
-                # Get or create security
-                security, _ = Security.objects.update_or_create(
-                    plaid_security_id=f"manual_{symbol}",
-                    defaults={
-                        'name': description or symbol,
-                        'ticker_symbol': symbol,
-                        'type': 'equity',
-                        'close_price': last_price,
-                        'close_price_as_of': timezone.now().date(),
-                        'is_cash_equivalent': 'MONEY MARKET' in description.upper() if description else False,
-                    }
-                )
-                
-                # Create or update holding
-                holding, h_created = Holding.objects.update_or_create(
-                    account=account,
-                    security=security,
-                    defaults={
-                        'quantity': quantity,
-                        'institution_price': last_price or Decimal('0'),
-                        'institution_price_as_of': timezone.now().date(),
-                        'institution_value': current_value or (quantity * (last_price or Decimal('0'))),
-                        'cost_basis': cost_basis,
-                        'iso_currency_code': 'USD',
-                    }
-                )
-                
-                if h_created:
-                    result['holdings_created'] += 1
-                else:
-                    result['holdings_updated'] += 1
-                    
-            except Exception as e:
-                result['errors'].append(f"Row {row_num}: {str(e)}")
-        
-        # Update account balances
-        for account in accounts_cache.values():
-            total = Holding.objects.filter(account=account).aggregate(
-                total=Sum('institution_value')
-            )['total'] or Decimal('0')
-            account.current_balance = total
-            account.save()
-        
-        return result
-    
-    def _import_fidelity_transactions(self, user, institution, rows, result):
-        """Import Fidelity transactions CSV"""
-        from decimal import Decimal, InvalidOperation
-        from dateutil import parser as date_parser
-        from .models import Account, Transaction
-        
-        accounts_cache = {}
-        
-        for row_num, row in enumerate(rows, start=2):
-            try:
-                # Normalize column names
-                row_lower = {k.lower().strip(): v.strip() if v else '' for k, v in row.items()}
-                
-                # Extract account info
-                account_number = row_lower.get('account number', row_lower.get('account', '')).strip()
-                
-                if not account_number:
-                    # Try first column
-                    first_val = list(row.values())[0] if row else ''
-                    if first_val and first_val.replace('-', '').isdigit():
-                        account_number = first_val
-                    else:
-                        continue
-                
-                # Get or create account
-                if account_number not in accounts_cache:
-                    account, acc_created = Account.objects.get_or_create(
-                        plaid_account_id=f"manual_{account_number}",
-                        defaults={
-                            'institution': institution,
-                            'name': f"Fidelity {account_number[-4:]}",
-                            'mask': account_number[-4:] if len(account_number) >= 4 else account_number,
-                            'type': 'investment',
-                            'subtype': 'brokerage',
-                            'current_balance': 0,
-                            'is_active': True,
-                            'is_selected': True,
-                        }
-                    )
-                    if not acc_created and account.institution_id != institution.id:
-                        account.institution = institution
-                        account.save()
-                    
-                    accounts_cache[account_number] = account
-                    if acc_created:
-                        result['accounts_created'] += 1
-                
-                account = accounts_cache[account_number]
-                
-                # Extract transaction data
-                date_str = row_lower.get('date', row_lower.get('run date', row_lower.get('trade date', '')))
-                if not date_str or date_str in ['--', 'N/A']:
-                    continue
-                
-                try:
-                    tx_date = date_parser.parse(date_str).date()
-                except:
-                    continue
-                
-                action = row_lower.get('action', row_lower.get('type', row_lower.get('transaction type', ''))).strip()
-                symbol = row_lower.get('symbol', row_lower.get('ticker', '')).strip()
-                description = row_lower.get('description', row_lower.get('security description', '')).strip()
-                
-                def parse_money(val):
-                    if not val or val in ['--', 'N/A', '$--']:
-                        return Decimal('0')
-                    try:
-                        clean = val.replace('$', '').replace(',', '').replace('(', '-').replace(')', '').strip()
-                        return Decimal(clean) if clean else Decimal('0')
-                    except (InvalidOperation, ValueError):
-                        return Decimal('0')
-                
-                amount = parse_money(row_lower.get('amount', row_lower.get('net amount', '0')))
-                quantity = parse_money(row_lower.get('quantity', row_lower.get('shares', '0')))
-                price = parse_money(row_lower.get('price', '0'))
-                
-                # Determine category based on action
-                action_upper = action.upper() if action else ''
-                if 'BUY' in action_upper or 'PURCHASE' in action_upper:
-                    category = 'INVESTMENT_BUY'
-                elif 'SELL' in action_upper or 'SOLD' in action_upper:
-                    category = 'INVESTMENT_SELL'
-                elif 'DIVIDEND' in action_upper or 'DIV' in action_upper:
-                    category = 'DIVIDEND'
-                elif 'INTEREST' in action_upper:
-                    category = 'INTEREST'
-                elif 'TRANSFER' in action_upper:
-                    category = 'TRANSFER'
-                elif 'FEE' in action_upper:
-                    category = 'BANK_FEES'
-                else:
-                    category = 'OTHER'
-                
-                # Create unique transaction ID
-                tx_id = f"manual_{account_number}_{tx_date}_{symbol or 'cash'}_{abs(amount)}"
-                
-                tx, tx_created = Transaction.objects.update_or_create(
-                    plaid_transaction_id=tx_id,
-                    defaults={
-                        'account': account,
-                        'amount': abs(amount) if 'BUY' in action_upper or 'PURCHASE' in action_upper or amount > 0 else -abs(amount),
-                        'iso_currency_code': 'USD',
-                        'name': description or action or 'Transaction',
-                        'merchant_name': 'Fidelity',
-                        'primary_category': category,
-                        'date': tx_date,
-                        'pending': False,
-                        'is_manual': True,
-                    }
-                )
-                
-                if tx_created:
-                    result['transactions_created'] += 1
-                else:
-                    result['transactions_updated'] += 1
-                    
-            except Exception as e:
-                result['errors'].append(f"Row {row_num}: {str(e)}")
-        
-        return result
 
 
 class PDFImportView(views.APIView):
@@ -1484,7 +1290,7 @@ class PDFImportView(views.APIView):
         try:
             # Extract transactions from PDF
             extractor = PDFTransactionExtractor()
-            result = extractor.extract_transactions(pdf_file)
+            result = extractor.extract_transactions(pdf_file, account_type=account.type)
             
             if not result['transactions']:
                 return Response({
@@ -1539,7 +1345,11 @@ class PDFImportConfirmView(views.APIView):
         Request:
         - import_id: ID from the preview response
         - transactions: Optional modified transactions list
+        
+        Rows already present on the account are skipped and reported as duplicates_skipped.
         """
+        from .services.pdf_extractor import import_pdf_transactions
+        
         import_id = request.data.get('import_id')
         modified_transactions = request.data.get('transactions')
         
@@ -1577,40 +1387,15 @@ class PDFImportConfirmView(views.APIView):
         # Use modified transactions if provided, otherwise use original
         transactions = modified_transactions if modified_transactions else pending['transactions']
         
-        # Create transactions
-        created_count = 0
-        errors = []
-        
-        for txn in transactions:
-            try:
-                # Parse date
-                try:
-                    tx_date = datetime.strptime(txn['date'], '%Y-%m-%d').date()
-                except (ValueError, KeyError):
-                    tx_date = timezone.now().date()
-                
-                # Create transaction
-                Transaction.objects.create(
-                    account=account,
-                    plaid_transaction_id=f"pdf_import_{uuid.uuid4()}",
-                    amount=float(txn.get('amount', 0)),
-                    name=txn.get('description', 'PDF Import')[:200],
-                    merchant_name=txn.get('description', '')[:100],
-                    primary_category=txn.get('category', 'OTHER'),
-                    date=tx_date,
-                    pending=False,
-                    is_manual=True,
-                )
-                created_count += 1
-                
-            except Exception as e:
-                errors.append(str(e))
+        # Fingerprint rows, skip ones the account already has and bulk insert the rest
+        result = import_pdf_transactions(account, transactions)
         
         # Clean up pending import
         del PDFImportView._pending_imports[import_id]
         
         return Response({
             "status": "success",
-            "transactions_created": created_count,
-            "errors": errors,
+            "transactions_created": result['created'],
+            "duplicates_skipped": result['duplicates_skipped'],
+            "errors": result['errors'],
         })
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class NotificationsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.notifications'
+
+    def ready(self):
+        # Connect the receivers for finance events
+        from . import receivers  # noqa: F401
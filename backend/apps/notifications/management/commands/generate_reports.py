@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from apps.notifications.reports import ReportGenerator, report_period, report_recipients
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database sockets; spawned ones need app setup
+    django.setup()
+    connections.close_all()
+
+
+def _generate_chunk(period, period_start, period_end, user_ids):
+    """Generate one chunk of reports; runs inside a worker"""
+    return ReportGenerator(period, period_start, period_end).generate_chunk(user_ids)
+
+
+class Command(BaseCommand):
+    help = 'Generate weekly and/or monthly financial reports for opted-in users and queue the emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period',
+            choices=['weekly', 'monthly', 'both'],
+            default='weekly',
+            help='Which reports to generate',
+        )
+        parser.add_argument(
+            '--date',
+            help='Generate the reports due on this date (YYYY-MM-DD); defaults to today',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker processes (1 runs in-process)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=ReportGenerator.CHUNK_SIZE,
+            help='Number of users per chunk of grouped queries',
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+        else:
+            today = timezone.now().date()
+
+        periods = ['weekly', 'monthly'] if options['period'] == 'both' else [options['period']]
+        for period in periods:
+            period_start, period_end = report_period(period, today)
+            user_ids = list(report_recipients(period))
+            chunk_size = options['chunk_size']
+            chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+            workers = max(1, min(options['workers'], len(chunks)))
+            self.stdout.write(
+                f"Generating {period} reports for {period_start}..{period_end}: "
+                f"{len(user_ids)} users in {len(chunks)} chunks with {workers} workers..."
+            )
+
+            results, failed = [], 0
+            job_args = (period, period_start, period_end)
+            if workers == 1:
+                for chunk in chunks:
+                    try:
+                        results.append(_generate_chunk(*job_args, chunk))
+                    except Exception as e:
+                        failed += len(chunk)
+                        logger.error(f"{period} report chunk starting at user {chunk[0]} failed: {e}", exc_info=True)
+            else:
+                # Close inherited connections before forking so no socket is shared with children
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                    futures = {pool.submit(_generate_chunk, *job_args, chunk): chunk for chunk in chunks}
+                    for future in as_completed(futures):
+                        try:
+                            results.append(future.result())
+                        except Exception as e:
+                            failed += len(futures[future])
+                            logger.error(
+                                f"{period} report chunk starting at user {futures[future][0]} failed: {e}", exc_info=True
+                            )
+
+            totals = {key: sum(result[key] for result in results) for key in ('reports', 'queued')}
+            self.stdout.write(self.style.SUCCESS(
+                f"Generated {totals['reports']} {period} reports and queued {totals['queued']} emails "
+                f"({failed} users failed)"
+            ))
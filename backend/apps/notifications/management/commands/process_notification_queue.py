@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from apps.notifications.services import NotificationQueueWorker
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Send queued notifications in priority order, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=NotificationQueueWorker.BATCH_SIZE,
+            help='Maximum number of notifications to claim and send per batch',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for due notifications instead of exiting once the queue is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10.0,
+            help='Seconds to wait between polls when nothing is due (with --loop)',
+        )
+
+    def handle(self, *args, **options):
+        worker = NotificationQueueWorker()
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+
+        while True:
+            stats = worker.process_batch(options['batch_size'])
+            for key in totals:
+                totals[key] += stats[key]
+            if stats['claimed']:
+                logger.info(
+                    f"Processed {stats['claimed']} notifications: {stats['sent']} sent, "
+                    f"{stats['retried']} retrying, {stats['failed']} failed"
+                )
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} notifications ({totals['retried']} retrying, {totals['failed']} failed)"
+        ))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from apps.notifications.models import EmailNotification, NotificationDailyStat
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user daily notification rollup from the email log'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Rebuild the rollup of a specific user only',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rollup rows inserted per query',
+        )
+
+    def handle(self, *args, **options):
+        notifications = EmailNotification.objects.all()
+        stats = NotificationDailyStat.objects.all()
+        if options['user_id']:
+            notifications = notifications.filter(user_id=options['user_id'])
+            stats = stats.filter(user_id=options['user_id'])
+
+        buckets = (
+            notifications.annotate(day=TruncDate('sent_at'))
+            .values('user_id', 'day', 'email_type')
+            .annotate(sent=Count('id', filter=Q(success=True)), failed=Count('id', filter=Q(success=False)))
+            .order_by()
+        )
+
+        with transaction.atomic():
+            deleted, _ = stats.delete()
+            created = NotificationDailyStat.objects.bulk_create(
+                (
+                    NotificationDailyStat(
+                        user_id=bucket['user_id'],
+                        date=bucket['day'],
+                        email_type=bucket['email_type'],
+                        sent_count=bucket['sent'],
+                        failed_count=bucket['failed'],
+                    )
+                    for bucket in buckets.iterator()
+                ),
+                batch_size=options['batch_size'],
+            )
+
+        logger.info(f"Rebuilt notification rollup: {deleted} rows replaced with {len(created)}")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(created)} daily notification stat rows"))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from apps.notifications.services import BudgetMonitoringService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Queue budget and low balance alerts for every user whose thresholds were newly crossed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=BudgetMonitoringService.CHUNK_SIZE,
+            help='Number of users evaluated per set of queries',
+        )
+        parser.add_argument(
+            '--skip-budgets',
+            action='store_true',
+            help='Only check account balances',
+        )
+        parser.add_argument(
+            '--skip-balances',
+            action='store_true',
+            help='Only check budgets',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stats = BudgetMonitoringService().sweep(
+            budgets=not options['skip_budgets'],
+            balances=not options['skip_balances'],
+            chunk_size=options['chunk_size'],
+        )
+        elapsed = time.monotonic() - started
+        logger.info(f"Alert sweep finished in {elapsed:.1f}s: {stats}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {stats['users']} users in {elapsed:.1f}s: queued {stats['budget_alerts']} budget and "
+            f"{stats['low_balance_alerts']} low balance alerts ({stats['duplicates']} already alerted)"
+        ))
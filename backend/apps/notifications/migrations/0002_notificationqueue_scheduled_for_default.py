@@ -0,0 +1,17 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationqueue',
+            name='scheduled_for',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
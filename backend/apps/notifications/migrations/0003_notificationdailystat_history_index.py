@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0002_notificationqueue_scheduled_for_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDailyStat',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('email_type', models.CharField(choices=[('budget_alert', 'Budget Alert'), ('low_balance', 'Low Balance Alert'), ('new_transaction', 'New Transaction'), ('weekly_report', 'Weekly Report'), ('monthly_report', 'Monthly Report'), ('security_alert', 'Security Alert'), ('welcome', 'Welcome Email'), ('password_reset', 'Password Reset')], max_length=50)),
+                ('sent_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date', 'email_type'],
+                'unique_together': {('user', 'date', 'email_type')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='emailnotification',
+            index=models.Index(fields=['user', '-sent_at', '-id'], name='notificatio_user_id_5e8e84_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 import uuid
 
 
@@ -84,6 +85,8 @@ class EmailNotification(models.Model):
             models.Index(fields=['user', 'email_type']),
             models.Index(fields=['sent_at']),
             models.Index(fields=['success']),
+            # Keyset pagination of a user's history
+            models.Index(fields=['user', '-sent_at', '-id']),
         ]
     
     def __str__(self):
@@ -91,6 +94,27 @@ class EmailNotification(models.Model):
         return f"{status} {self.email_type} to {self.recipient_email} at {self.sent_at}"
 
 
+class NotificationDailyStat(models.Model):
+    """Per-user daily count of logged emails by type, kept up to date as sends are logged"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_daily_stats')
+    
+    # Bucket
+    date = models.DateField()
+    email_type = models.CharField(max_length=50, choices=EmailNotification.EMAIL_TYPES)
+    
+    # Counts
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'date', 'email_type']
+        ordering = ['-date', 'email_type']
+    
+    def __str__(self):
+        return f"{self.email_type} for {self.user.username} on {self.date}: {self.sent_count} sent, {self.failed_count} failed"
+
+
 class NotificationQueue(models.Model):
     """Queue for pending notifications"""
     
@@ -118,7 +142,7 @@ class NotificationQueue(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     # Scheduling
-    scheduled_for = models.DateTimeField(auto_now_add=True)
+    scheduled_for = models.DateTimeField(default=timezone.now)
     attempts = models.IntegerField(default=0)
     max_attempts = models.IntegerField(default=3)
     
@@ -141,5 +165,48 @@ class NotificationQueue(models.Model):
             models.Index(fields=['priority']),
         ]
     
+    # Processing order: lower ranks are sent first
+    PRIORITY_RANK = {'urgent': 0, 'high': 1, 'normal': 2, 'low': 3}
+    
+    def __str__(self):
+        return f"{self.email_type} for {self.user.username} ({self.status})"
+    
+    @classmethod
+    def priority_rank(cls):
+        """Expression ranking rows by priority; the choice values do not sort meaningfully as text"""
+        return models.Case(
+            *[models.When(priority=priority, then=models.Value(rank)) for priority, rank in cls.PRIORITY_RANK.items()],
+            default=models.Value(len(cls.PRIORITY_RANK)),
+            output_field=models.IntegerField(),
+        )
+
+
+class FinancialReport(models.Model):
+    """Precomputed weekly or monthly report, shown in the app and sent by email"""
+    
+    PERIOD_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='financial_reports')
+    
+    # Period
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    
+    # Totals, top categories and balances as served to the UI and the email template
+    data = models.JSONField(default=dict)
+    
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'period', 'period_start']
+        ordering = ['-period_start', 'period']
+    
     def __str__(self):
-        return f"{self.email_type} for {self.user.username} ({self.status})" 
\ No newline at end of file
+        return f"{self.period} report for {self.user.username} from {self.period_start}"
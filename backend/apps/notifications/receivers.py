@@ -0,0 +1,10 @@
+from django.dispatch import receiver
+
+from apps.finance.events import transactions_added
+from .services import TransactionDigestService
+
+
+@receiver(transactions_added, dispatch_uid='notifications.transaction_digest')
+def add_to_transaction_digest(sender, institution, transaction_ids, **kwargs):
+    """Fold a synced page of new transactions into the owner's pending digest"""
+    TransactionDigestService().add_transactions(institution.user_id, transaction_ids)
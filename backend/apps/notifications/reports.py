@@ -0,0 +1,206 @@
+"""
+Financial Report Generation
+
+Builds the weekly and monthly reports for every opted-in user and queues the
+emails. Users are handled in chunks (see the ``generate_reports`` command,
+which runs chunks in parallel worker processes). Each chunk costs a fixed
+number of grouped queries, whatever its size:
+
+- spending, income and transaction counts per user
+- spending per user and category, trimmed to the top categories in memory
+- balances of each user's active accounts
+- which users already have a report for the period
+- one upsert for the reports and one insert for the emails
+
+Reports are stored as ``FinancialReport`` rows so the app can show them
+without recomputing. Rerunning a period refreshes the stored data but does
+not queue a second email.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import FinancialReport, NotificationQueue
+
+logger = logging.getLogger(__name__)
+
+TOP_CATEGORIES = 5
+# Preference flag that opts a user in to each period's email
+PERIOD_PREFERENCES = {'weekly': 'weekly_reports', 'monthly': 'monthly_reports'}
+
+CENTS = Decimal('0.01')
+
+
+def _money(value) -> Decimal:
+    # Sums come back unquantized from some backends
+    return Decimal(value or 0).quantize(CENTS)
+
+
+def report_period(period: str, today: date) -> Tuple[date, date]:
+    """The last complete week (Monday to Sunday) or calendar month before ``today``"""
+    if period == 'weekly':
+        end = today - timedelta(days=today.weekday() + 1)
+        return end - timedelta(days=6), end
+    end = today.replace(day=1) - timedelta(days=1)
+    return end.replace(day=1), end
+
+
+def report_recipients(period: str):
+    """Ids of active users with an email and linked accounts who did not opt out of ``period`` reports"""
+    preference = PERIOD_PREFERENCES[period]
+    return (
+        User.objects.filter(is_active=True, institutions__isnull=False)
+        .exclude(email='')
+        .filter(
+            # No preferences row means the defaults, which include both reports
+            Q(notification_preferences__isnull=True) |
+            Q(**{'notification_preferences__email_notifications': True, f'notification_preferences__{preference}': True})
+        )
+        .distinct()
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+
+class ReportGenerator:
+    """Computes, stores and queues the reports of one period for chunks of users"""
+
+    CHUNK_SIZE = 500
+
+    def __init__(self, period: str, period_start: date, period_end: date):
+        self.period = period
+        self.period_start = period_start
+        self.period_end = period_end
+
+    def generate(self, user_ids: Iterable[int], chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+        """Generate reports for ``user_ids`` chunk by chunk; returns counts"""
+        stats = {'reports': 0, 'queued': 0}
+        chunk = []
+        for user_id in user_ids:
+            chunk.append(user_id)
+            if len(chunk) >= chunk_size:
+                self._add(stats, self.generate_chunk(chunk))
+                chunk = []
+        if chunk:
+            self._add(stats, self.generate_chunk(chunk))
+        return stats
+
+    @staticmethod
+    def _add(stats: Dict[str, int], chunk_stats: Dict[str, int]):
+        for key in stats:
+            stats[key] += chunk_stats[key]
+
+    def generate_chunk(self, user_ids: List[int]) -> Dict[str, int]:
+        """Build, store and queue the reports of one chunk of users"""
+        payloads = self.build(user_ids)
+        now = timezone.now()
+
+        # The report and its email are stored together or not at all
+        with transaction.atomic():
+            already_reported = set(
+                FinancialReport.objects.filter(
+                    user_id__in=user_ids, period=self.period, period_start=self.period_start
+                ).values_list('user_id', flat=True)
+            )
+            FinancialReport.objects.bulk_create(
+                [
+                    FinancialReport(
+                        user_id=user_id,
+                        period=self.period,
+                        period_start=self.period_start,
+                        period_end=self.period_end,
+                        data=payload,
+                        updated_at=now,
+                    )
+                    for user_id, payload in payloads.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['user', 'period', 'period_start'],
+                update_fields=['period_end', 'data', 'updated_at'],
+            )
+
+            queued = NotificationQueue.objects.bulk_create([
+                NotificationQueue(
+                    user_id=user_id,
+                    email_type=f"{self.period}_report",
+                    priority='low',
+                    subject=f"{self.period.capitalize()} Financial Report - {self.period_start:%b %d, %Y}",
+                    template_name='notifications/financial_report.html',
+                    context_data=payload,
+                )
+                for user_id, payload in payloads.items()
+                if user_id not in already_reported
+            ])
+        return {'reports': len(payloads), 'queued': len(queued)}
+
+    def build(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """JSON-ready report payloads by user id, from three grouped queries"""
+        from apps.finance.models import Account, Transaction
+
+        transactions = Transaction.objects.filter(
+            account__institution__user_id__in=user_ids,
+            date__gte=self.period_start,
+            date__lte=self.period_end,
+            exclude_from_reports=False,
+        )
+        # Plaid amounts are positive for money out and negative for money in
+        spending = Q(amount__gt=0) & ~Q(account__type='transfer')
+
+        totals = {
+            row['account__institution__user_id']: row
+            for row in transactions.values('account__institution__user_id').annotate(
+                spent=Sum('amount', filter=spending),
+                received=Sum('amount', filter=Q(amount__lt=0)),
+                transactions=Count('id'),
+            ).order_by()
+        }
+
+        categories = defaultdict(list)
+        category_rows = (
+            transactions.filter(spending)
+            .values('account__institution__user_id', 'primary_category')
+            .annotate(total=Sum('amount'), transactions=Count('id'))
+            .order_by('account__institution__user_id', '-total')
+        )
+        for row in category_rows:
+            user_categories = categories[row['account__institution__user_id']]
+            if len(user_categories) < TOP_CATEGORIES:
+                user_categories.append({
+                    'category': row['primary_category'] or 'Uncategorized',
+                    'total': _money(row['total']),
+                    'count': row['transactions'],
+                })
+
+        balances = defaultdict(list)
+        accounts = Account.objects.filter(
+            institution__user_id__in=user_ids, is_active=True, is_selected=True
+        ).values_list('institution__user_id', 'name', 'custom_name', 'type', 'current_balance').order_by('name')
+        for user_id, name, custom_name, account_type, balance in accounts:
+            balances[user_id].append({'name': custom_name or name, 'type': account_type, 'balance': _money(balance)})
+
+        payloads = {}
+        for user_id in user_ids:
+            row = totals.get(user_id, {})
+            total_spending = _money(row.get('spent'))
+            total_income = abs(_money(row.get('received')))
+            payloads[user_id] = json.loads(json.dumps({
+                'period': self.period,
+                'period_start': self.period_start,
+                'period_end': self.period_end,
+                'total_spending': total_spending,
+                'total_income': total_income,
+                'net_change': total_income - total_spending,
+                'transaction_count': row.get('transactions', 0),
+                'top_categories': categories.get(user_id, []),
+                'account_balances': balances.get(user_id, []),
+            }, cls=DjangoJSONEncoder))
+        return payloads
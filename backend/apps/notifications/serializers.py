@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import NotificationPreference, EmailNotification, NotificationQueue
+from .models import NotificationPreference, EmailNotification, NotificationQueue, FinancialReport
 
 
 class NotificationPreferenceSerializer(serializers.ModelSerializer):
@@ -84,6 +84,15 @@ class NotificationQueueSerializer(serializers.ModelSerializer):
         ]
 
 
+class FinancialReportSerializer(serializers.ModelSerializer):
+    """Serializer for stored weekly and monthly reports"""
+    
+    class Meta:
+        model = FinancialReport
+        fields = ['id', 'period', 'period_start', 'period_end', 'data', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
 class NotificationStatsSerializer(serializers.Serializer):
     """Serializer for notification statistics"""
     total_sent = serializers.IntegerField()
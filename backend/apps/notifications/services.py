@@ -1,44 +1,132 @@
+import json
 import logging
+import time
+from collections import defaultdict
 from decimal import Decimal
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterable, Optional, List, Tuple
 
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import get_template
 from django.utils import timezone
-from django.db.models import Count, Q
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from samaanai.metrics import EMAIL_BATCH_SECONDS, EMAILS
 
-from .models import NotificationPreference, EmailNotification, NotificationQueue
+from .models import NotificationPreference, EmailNotification, NotificationDailyStat, NotificationQueue
 
 logger = logging.getLogger(__name__)
 
 
+def json_safe_context(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Context reduced to what can be stored in a JSONField.
+    
+    Model instances (the recipient ``user`` in particular) are dropped; the
+    worker adds the user back when rendering. Decimals and dates become strings.
+    """
+    plain = {key: value for key, value in context.items() if not isinstance(value, models.Model)}
+    return json.loads(json.dumps(plain, cls=DjangoJSONEncoder))
+
+
+class PreferenceStore:
+    """
+    Notification preferences by user, memoised for the lifetime of the store.
+    
+    Create one store per request or job. Lookups go to the memo first, then
+    to the cache framework, then to the database. A preferences row is only
+    created (``get_or_create``) when ``get`` finds none. ``prefetch`` loads
+    many users at once without writing anything.
+    """
+    
+    CACHE_TIMEOUT = 60 * 60
+    DEFAULTS = {
+        'email_notifications': True,
+        'budget_alerts': True,
+        'low_balance_alerts': True,
+        'new_transaction_alerts': False,
+        'weekly_reports': True,
+        'monthly_reports': True,
+        'security_alerts': True,
+        'marketing_emails': False,
+        'budget_threshold': 90,
+        'low_balance_threshold': Decimal('100.00'),
+    }
+    
+    def __init__(self):
+        self._memo: Dict[int, NotificationPreference] = {}
+    
+    @staticmethod
+    def _cache_key(user_id) -> str:
+        return f"notification_preferences:{user_id}"
+    
+    @classmethod
+    def invalidate(cls, user_id):
+        """Drop the cached preferences of a user; call after they change"""
+        cache.delete(cls._cache_key(user_id))
+    
+    def get(self, user: User) -> NotificationPreference:
+        """Preferences of ``user``, created with the defaults if they have none yet"""
+        preferences = self._memo.get(user.id)
+        if preferences is None:
+            preferences = cache.get(self._cache_key(user.id))
+        if preferences is None:
+            preferences, created = NotificationPreference.objects.get_or_create(user=user, defaults=self.DEFAULTS)
+            cache.set(self._cache_key(user.id), preferences, self.CACHE_TIMEOUT)
+        self._memo[user.id] = preferences
+        return preferences
+    
+    def prefetch(self, user_ids: Iterable[int]) -> Dict[int, NotificationPreference]:
+        """
+        Preferences for many users in at most one cache and one database round trip.
+        
+        Users without a row get unsaved defaults, which are neither stored nor cached.
+        """
+        user_ids = list(user_ids)
+        found = {user_id: self._memo[user_id] for user_id in user_ids if user_id in self._memo}
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if missing:
+            cached = cache.get_many([self._cache_key(user_id) for user_id in missing])
+            for user_id in missing:
+                preferences = cached.get(self._cache_key(user_id))
+                if preferences is not None:
+                    found[user_id] = preferences
+            missing = [user_id for user_id in missing if user_id not in found]
+        if missing:
+            loaded = {
+                preferences.user_id: preferences
+                for preferences in NotificationPreference.objects.filter(user_id__in=missing)
+            }
+            cache.set_many(
+                {self._cache_key(user_id): preferences for user_id, preferences in loaded.items()},
+                self.CACHE_TIMEOUT,
+            )
+            for user_id in missing:
+                found[user_id] = loaded.get(user_id) or NotificationPreference(user_id=user_id, **self.DEFAULTS)
+        self._memo.update(found)
+        return found
+
+
 class NotificationService:
     """Service for managing email notifications"""
     
-    def __init__(self):
+    BATCH_SIZE = 500
+    
+    # Compiled templates by name, shared by every instance in the process
+    _template_cache: Dict[str, Any] = {}
+    
+    def __init__(self, preferences: Optional[PreferenceStore] = None):
         self.default_from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@yourapp.com')
+        self.preferences = preferences or PreferenceStore()
     
     def get_user_preferences(self, user: User) -> NotificationPreference:
         """Get or create user notification preferences"""
-        preferences, created = NotificationPreference.objects.get_or_create(
-            user=user,
-            defaults={
-                'email_notifications': True,
-                'budget_alerts': True,
-                'low_balance_alerts': True,
-                'new_transaction_alerts': False,
-                'weekly_reports': True,
-                'monthly_reports': True,
-                'security_alerts': True,
-                'marketing_emails': False,
-                'budget_threshold': 90,
-                'low_balance_threshold': Decimal('100.00')
-            }
-        )
-        return preferences
+        return self.preferences.get(user)
     
     def should_send_notification(self, user: User, notification_type: str) -> bool:
         """Check if notification should be sent based on user preferences"""
@@ -82,49 +170,128 @@ class NotificationService:
             logger.error(f"No email address for user {user.username}")
             return False
         
+        [error] = self.send_batch([{
+            'user': user,
+            'email_type': email_type,
+            'subject': subject,
+            'template_name': template_name,
+            'context': context,
+            'recipient_email': recipient,
+        }])
+        return error is None
+    
+    @classmethod
+    def get_template(cls, template_name: str):
+        """Compiled template, loaded once per process"""
+        template = cls._template_cache.get(template_name)
+        if template is None:
+            template = cls._template_cache[template_name] = get_template(template_name)
+        return template
+    
+    def send_batch(self, messages: List[Dict[str, Any]], log: bool = True) -> List[Optional[str]]:
+        """
+        Send several emails over one mail connection.
+        
+        Each message is a dict with user, email_type, subject, template_name,
+        context and optionally recipient_email. Preferences are not checked
+        here. Returns one entry per message: None if it was sent, otherwise
+        the error. Log rows are written in one insert with JSON-safe contexts.
+        """
+        if not messages:
+            return []
+        
+        start = time.perf_counter()
+        errors = []
+        connection = get_connection()
         try:
-            # Render email content
-            html_content = render_to_string(template_name, context)
-            
-            # Send email
-            send_mail(
-                subject=subject,
-                message='',  # Plain text version (optional)
-                html_message=html_content,
-                from_email=self.default_from_email,
-                recipient_list=[recipient],
-                fail_silently=False,
-            )
-            
-            # Log successful send
-            EmailNotification.objects.create(
-                user=user,
-                email_type=email_type,
-                recipient_email=recipient,
-                subject=subject,
-                success=True,
-                template_name=template_name,
-                context_data=context
-            )
-            
-            logger.info(f"Successfully sent {email_type} email to {recipient}")
-            return True
-            
+            connection.open()
+            open_error = None
         except Exception as e:
-            # Log failed send
-            EmailNotification.objects.create(
-                user=user,
-                email_type=email_type,
-                recipient_email=recipient,
-                subject=subject,
-                success=False,
-                error_message=str(e),
-                template_name=template_name,
-                context_data=context
+            open_error = e
+        
+        try:
+            for message in messages:
+                recipient = message.get('recipient_email') or message['user'].email
+                try:
+                    if open_error:
+                        raise open_error
+                    if not recipient:
+                        raise ValueError(f"No email address for user {message['user'].username}")
+                    html_content = self.get_template(message['template_name']).render(message['context'])
+                    email = EmailMultiAlternatives(
+                        subject=message['subject'],
+                        body='',  # Plain text version (optional)
+                        from_email=self.default_from_email,
+                        to=[recipient],
+                        connection=connection,
+                    )
+                    email.attach_alternative(html_content, 'text/html')
+                    email.send()
+                    errors.append(None)
+                except Exception as e:
+                    logger.error(f"Failed to send {message['email_type']} email to {recipient}: {str(e)}")
+                    errors.append(str(e))
+        finally:
+            if open_error is None:
+                connection.close()
+        
+        if log:
+            try:
+                with transaction.atomic():
+                    EmailNotification.objects.bulk_create([
+                        EmailNotification(
+                            user=message['user'],
+                            email_type=message['email_type'],
+                            recipient_email=message.get('recipient_email') or message['user'].email or '',
+                            subject=message['subject'],
+                            success=error is None,
+                            error_message=error,
+                            template_name=message['template_name'],
+                            context_data=json_safe_context(message['context']),
+                        )
+                        for message, error in zip(messages, errors)
+                    ])
+                    self.record_daily_stats(messages, errors)
+            except Exception as e:
+                # The emails are already out; raising here would leave their queue rows to be sent again
+                logger.error(f"Failed to log a batch of {len(messages)} emails: {str(e)}")
+        
+        EMAIL_BATCH_SECONDS.observe(time.perf_counter() - start)
+        for message, error in zip(messages, errors):
+            EMAILS.labels(message['email_type'], 'sent' if error is None else 'failed').inc()
+
+        sent = errors.count(None)
+        logger.info(f"Sent {sent} of {len(messages)} emails")
+        return errors
+    
+    def record_daily_stats(self, messages: List[Dict[str, Any]], errors: List[Optional[str]]):
+        """Add a logged batch to the per-user daily rollup in three queries"""
+        today = timezone.now().date()
+        counts = defaultdict(lambda: [0, 0])
+        for message, error in zip(messages, errors):
+            counts[(message['user'].id, message['email_type'])][error is not None] += 1
+        
+        # Concurrent workers touch overlapping buckets, so always take them in key order
+        keys = sorted(counts)
+        with transaction.atomic():
+            # Make sure every bucket exists, then increment in SQL so concurrent workers do not lose counts
+            NotificationDailyStat.objects.bulk_create(
+                [NotificationDailyStat(user_id=user_id, date=today, email_type=email_type) for user_id, email_type in keys],
+                ignore_conflicts=True,
             )
-            
-            logger.error(f"Failed to send {email_type} email to {recipient}: {str(e)}")
-            return False
+            buckets = [
+                bucket for bucket in NotificationDailyStat.objects.select_for_update().filter(
+                    user_id__in={user_id for user_id, _ in keys},
+                    email_type__in={email_type for _, email_type in keys},
+                    date=today,
+                ).order_by('user_id', 'email_type')
+                if (bucket.user_id, bucket.email_type) in counts
+            ]
+            for bucket in buckets:
+                sent, failed = counts[(bucket.user_id, bucket.email_type)]
+                bucket.sent_count = F('sent_count') + sent
+                bucket.failed_count = F('failed_count') + failed
+            NotificationDailyStat.objects.bulk_update(buckets, ['sent_count', 'failed_count'])
     
     def queue_notification(
         self,
@@ -148,6 +315,37 @@ class NotificationService:
             scheduled_for=scheduled_for or timezone.now()
         )
     
+    def enqueue_email(
+        self,
+        user: User,
+        email_type: str,
+        subject: str,
+        template_name: str,
+        context: Dict[str, Any],
+        priority: str = 'normal',
+        scheduled_for: Optional[datetime] = None
+    ) -> bool:
+        """Queue an email for the queue worker (the notifications-process-queue scheduled job) if the user wants this type; returns whether it was queued"""
+        
+        if not self.should_send_notification(user, email_type):
+            logger.info(f"Skipping {email_type} notification for {user.username} - disabled in preferences")
+            return False
+        
+        if not user.email:
+            logger.error(f"No email address for user {user.username}")
+            return False
+        
+        self.queue_notification(
+            user=user,
+            email_type=email_type,
+            subject=subject,
+            template_name=template_name,
+            context=json_safe_context(context),
+            priority=priority,
+            scheduled_for=scheduled_for,
+        )
+        return True
+    
     def send_budget_alert(
         self,
         user: User,
@@ -156,7 +354,7 @@ class NotificationService:
         budget_amount: Decimal,
         percentage: float
     ) -> bool:
-        """Send budget alert notification"""
+        """Queue a budget alert notification"""
         
         preferences = self.get_user_preferences(user)
         
@@ -175,7 +373,7 @@ class NotificationService:
         
         subject = f"Budget Alert: {category_name} ({percentage:.1f}%)"
         
-        return self.send_email(
+        return self.enqueue_email(
             user=user,
             email_type='budget_alert',
             subject=subject,
@@ -191,7 +389,7 @@ class NotificationService:
         current_balance: Decimal,
         threshold: Decimal
     ) -> bool:
-        """Send low balance alert notification"""
+        """Queue a low balance alert notification"""
         
         context = {
             'user': user,
@@ -203,7 +401,7 @@ class NotificationService:
         
         subject = f"Low Balance Alert: {account_name}"
         
-        return self.send_email(
+        return self.enqueue_email(
             user=user,
             email_type='low_balance',
             subject=subject,
@@ -212,30 +410,63 @@ class NotificationService:
             priority='high'
         )
     
-    def send_weekly_report(self, user: User, report_data: Dict[str, Any]) -> bool:
-        """Send weekly financial report"""
-        
+    def _report_message(self, user: User, report_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Email for a weekly or monthly report payload (see apps.notifications.reports)"""
+        period = report_data.get('period', 'weekly')
         context = {
             'user': user,
-            'week_start': report_data.get('week_start'),
-            'week_end': report_data.get('week_end'),
+            'period': period,
+            'period_start': report_data.get('period_start'),
+            'period_end': report_data.get('period_end'),
             'total_spending': report_data.get('total_spending', 0),
             'total_income': report_data.get('total_income', 0),
             'net_change': report_data.get('net_change', 0),
+            'transaction_count': report_data.get('transaction_count', 0),
             'top_categories': report_data.get('top_categories', []),
             'account_balances': report_data.get('account_balances', [])
         }
         
-        subject = f"Weekly Financial Report - {report_data.get('week_start', 'This Week')}"
+        return {
+            'user': user,
+            'email_type': f"{period}_report",
+            'subject': f"{period.capitalize()} Financial Report - {report_data.get('period_start', 'This Period')}",
+            'template_name': 'notifications/financial_report.html',
+            'context': context,
+        }
+    
+    def send_weekly_report(self, user: User, report_data: Dict[str, Any]) -> bool:
+        """Send weekly financial report"""
         
-        return self.send_email(
-            user=user,
-            email_type='weekly_report',
-            subject=subject,
-            template_name='notifications/weekly_report.html',
-            context=context,
-            priority='low'
-        )
+        message = self._report_message(user, report_data)
+        return self.send_email(priority='low', **message)
+    
+    def send_weekly_reports(self, reports: Iterable[Tuple[User, Dict[str, Any]]]) -> int:
+        """
+        Send weekly reports to many users, one mail connection per batch.
+        
+        ``reports`` yields (user, report_data) pairs; users who opted out are
+        skipped. Returns the number of reports sent.
+        """
+        sent = 0
+        batch = []
+        for user, report_data in reports:
+            batch.append((user, report_data))
+            if len(batch) >= self.BATCH_SIZE:
+                sent += self._send_weekly_batch(batch)
+                batch = []
+        if batch:
+            sent += self._send_weekly_batch(batch)
+        return sent
+    
+    def _send_weekly_batch(self, batch: List[Tuple[User, Dict[str, Any]]]) -> int:
+        preferences = self.preferences.prefetch(user.id for user, _ in batch)
+        messages = []
+        for user, report_data in batch:
+            preference = preferences[user.id]
+            if not (preference.email_notifications and preference.weekly_reports):
+                continue
+            messages.append(self._report_message(user, report_data))
+        return self.send_batch(messages).count(None)
     
     def send_test_notification(self, user: User) -> bool:
         """Send a test notification"""
@@ -258,20 +489,40 @@ class NotificationService:
         )
     
     def get_notification_stats(self, user: User) -> Dict[str, Any]:
-        """Get notification statistics for a user"""
-        
-        notifications = EmailNotification.objects.filter(user=user)
-        recent_notifications = notifications.order_by('-sent_at')[:10]
-        
-        total_sent = notifications.count()
-        successful_sent = notifications.filter(success=True).count()
-        success_rate = (successful_sent / total_sent * 100) if total_sent > 0 else 0
+        """
+        Get notification statistics for a user
+        
+        Counts come from one conditional aggregate, over the daily rollup when
+        ``NOTIFICATION_STATS_FROM_ROLLUP`` is set and over the log otherwise.
+        """
+        email_types = [email_type for email_type, _ in EmailNotification.EMAIL_TYPES]
+        
+        if getattr(settings, 'NOTIFICATION_STATS_FROM_ROLLUP', False):
+            logged = F('sent_count') + F('failed_count')
+            counts = NotificationDailyStat.objects.filter(user=user).aggregate(
+                total=Coalesce(Sum(logged), 0),
+                successful=Coalesce(Sum('sent_count'), 0),
+                **{f"type_{email_type}": Coalesce(Sum(logged, filter=Q(email_type=email_type)), 0)
+                   for email_type in email_types}
+            )
+        else:
+            counts = EmailNotification.objects.filter(user=user).aggregate(
+                total=Count('id'),
+                successful=Count('id', filter=Q(success=True)),
+                **{f"type_{email_type}": Count('id', filter=Q(email_type=email_type)) for email_type in email_types}
+            )
         
-        # Count by type
-        type_counts = notifications.values('email_type').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        total_sent = counts['total']
+        success_rate = (counts['successful'] / total_sent * 100) if total_sent > 0 else 0
+        by_type = {email_type: counts[f"type_{email_type}"] for email_type in email_types}
+        type_counts = sorted(
+            ({'email_type': email_type, 'count': count} for email_type, count in by_type.items() if count),
+            key=lambda row: -row['count'],
+        )
         
+        recent_notifications = (
+            EmailNotification.objects.filter(user=user).select_related('user').order_by('-sent_at')[:10]
+        )
         pending_notifications = NotificationQueue.objects.filter(
             user=user,
             status='pending'
@@ -283,93 +534,325 @@ class NotificationService:
             'recent_notifications': recent_notifications,
             'pending_notifications': pending_notifications,
             'type_counts': type_counts,
-            'budget_alerts_sent': notifications.filter(email_type='budget_alert').count(),
-            'low_balance_alerts_sent': notifications.filter(email_type='low_balance').count(),
-            'weekly_reports_sent': notifications.filter(email_type='weekly_report').count(),
-            'monthly_reports_sent': notifications.filter(email_type='monthly_report').count(),
+            'budget_alerts_sent': by_type['budget_alert'],
+            'low_balance_alerts_sent': by_type['low_balance'],
+            'weekly_reports_sent': by_type['weekly_report'],
+            'monthly_reports_sent': by_type['monthly_report'],
         }
 
 
-class BudgetMonitoringService:
-    """Service for monitoring budgets and triggering alerts"""
+class NotificationQueueWorker:
+    """Drains NotificationQueue: claims due rows, sends them and retries failures with backoff"""
     
-    def __init__(self):
-        self.notification_service = NotificationService()
+    BATCH_SIZE = 100
+    RETRY_BASE_DELAY = timedelta(minutes=1)
+    # Rows left in processing this long belong to a worker that died
+    STALE_AFTER = timedelta(minutes=30)
     
-    def check_budget_alerts(self, user: User) -> List[bool]:
-        """Check all user budgets and send alerts if needed"""
-        from apps.finance.models import SpendingCategory, MonthlySpending
-        
-        alerts_sent = []
-        current_date = timezone.now()
+    def __init__(self, notification_service: Optional[NotificationService] = None):
+        self.notification_service = notification_service or NotificationService()
+    
+    def claim(self, limit: int = BATCH_SIZE) -> List[NotificationQueue]:
+        """Mark up to ``limit`` due rows as processing, highest priority first, and return them"""
+        now = timezone.now()
+        with transaction.atomic():
+            rows = list(
+                NotificationQueue.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('user')
+                .filter(
+                    Q(status='pending', scheduled_for__lte=now) |
+                    Q(status='processing', last_attempt_at__lt=now - self.STALE_AFTER)
+                )
+                .annotate(rank=NotificationQueue.priority_rank())
+                .order_by('rank', 'scheduled_for')[:limit]
+            )
+            if rows:
+                NotificationQueue.objects.filter(id__in=[row.id for row in rows]).update(
+                    status='processing', attempts=F('attempts') + 1, last_attempt_at=now, updated_at=now
+                )
+        for row in rows:
+            row.status = 'processing'
+            row.attempts += 1
+            row.last_attempt_at = now
+        return rows
+    
+    def process_batch(self, limit: int = BATCH_SIZE) -> Dict[str, int]:
+        """Send one claimed batch over a single mail connection; returns counts by outcome"""
+        rows = self.claim(limit)
+        stats = {'claimed': len(rows), 'sent': 0, 'retried': 0, 'failed': 0}
+        if not rows:
+            return stats
+        
+        errors = self.notification_service.send_batch([
+            {
+                'user': row.user,
+                'email_type': row.email_type,
+                'subject': row.subject,
+                'template_name': row.template_name,
+                'context': {**row.context_data, 'user': row.user},
+            }
+            for row in rows
+        ])
+        
+        now = timezone.now()
+        for row, error in zip(rows, errors):
+            row.error_message = error
+            row.updated_at = now
+            if error is None:
+                row.status = 'sent'
+                stats['sent'] += 1
+            elif row.attempts >= row.max_attempts or not row.user.email:
+                row.status = 'failed'
+                stats['failed'] += 1
+                logger.error(f"Giving up on {row.email_type} email for {row.user.username}: {error}")
+            else:
+                row.status = 'pending'
+                row.scheduled_for = now + self.RETRY_BASE_DELAY * 2 ** (row.attempts - 1)
+                stats['retried'] += 1
+        
+        NotificationQueue.objects.bulk_update(rows, ['status', 'error_message', 'scheduled_for', 'updated_at'])
+        return stats
+
+
+class TransactionDigestService:
+    """
+    Collects newly synced transactions into one pending digest email per user.
+    
+    The first page for a user queues a ``new_transaction`` notification due at
+    the end of ``NEW_TRANSACTION_DIGEST_WINDOW`` seconds. Later pages in the
+    window are merged into that row, so each user gets at most one email per
+    window. Only the newest ``MAX_LISTED`` transactions are listed.
+    """
+    
+    MAX_LISTED = 20
+    
+    def __init__(self, preferences: Optional[PreferenceStore] = None):
+        self.preferences = preferences or PreferenceStore()
+    
+    def add_transactions(self, user_id: int, transaction_ids: List) -> bool:
+        """Add transactions to the user's digest; returns False when they do not want these alerts"""
+        from apps.finance.models import Transaction
         
-        # Get user's spending categories with budgets
-        categories = SpendingCategory.objects.filter(
-            user=user,
-            monthly_budget__gt=0
-        )
+        preference = self.preferences.prefetch([user_id])[user_id]
+        if not (preference.email_notifications and preference.new_transaction_alerts):
+            return False
         
-        for category in categories:
-            try:
-                # Get current month spending
-                monthly_spending = MonthlySpending.objects.get(
-                    user=user,
-                    category=category,
-                    year=current_date.year,
-                    month=current_date.month
-                )
-                
-                spent_amount = monthly_spending.amount_spent
-                budget_amount = category.monthly_budget
-                percentage = (spent_amount / budget_amount * 100) if budget_amount > 0 else 0
-                
-                # Send alert if needed
-                alert_sent = self.notification_service.send_budget_alert(
-                    user=user,
-                    category_name=category.name,
-                    spent_amount=spent_amount,
-                    budget_amount=budget_amount,
-                    percentage=percentage
+        rows = Transaction.objects.filter(id__in=transaction_ids).order_by('-date').values(
+            'name', 'merchant_name', 'amount', 'date', 'account__name', 'account__custom_name'
+        )[:self.MAX_LISTED]
+        listed = json.loads(json.dumps([
+            {
+                'name': row['merchant_name'] or row['name'],
+                'amount': row['amount'],
+                'date': row['date'],
+                'account': row['account__custom_name'] or row['account__name'],
+            }
+            for row in rows
+        ], cls=DjangoJSONEncoder))
+        
+        with transaction.atomic():
+            digest = (
+                NotificationQueue.objects.select_for_update()
+                .filter(user_id=user_id, email_type='new_transaction', status='pending')
+                .order_by('scheduled_for')
+                .first()
+            )
+            if digest is None:
+                window = timedelta(seconds=getattr(settings, 'NEW_TRANSACTION_DIGEST_WINDOW', 15 * 60))
+                digest = NotificationQueue(
+                    user_id=user_id,
+                    email_type='new_transaction',
+                    priority='low',
+                    template_name='notifications/new_transactions.html',
+                    context_data={'transaction_count': 0, 'transactions': []},
+                    scheduled_for=timezone.now() + window,
                 )
-                
-                alerts_sent.append(alert_sent)
-                
-            except MonthlySpending.DoesNotExist:
-                # No spending this month for this category
+            
+            count = digest.context_data['transaction_count'] + len(transaction_ids)
+            digest.context_data = {
+                'transaction_count': count,
+                'transactions': sorted(
+                    listed + digest.context_data['transactions'], key=lambda row: row['date'], reverse=True
+                )[:self.MAX_LISTED],
+            }
+            digest.subject = f"{count} new transaction{'s' if count != 1 else ''}"
+            digest.save()
+        return True
+
+
+class BudgetMonitoringService:
+    """
+    Finds budget and low-balance threshold crossings and queues alerts for them.
+    
+    Users are swept in chunks. For each chunk, a few set-based queries load
+    preferences, this month's spending joined to budgets, and asset account
+    balances. Each crossing has an ``alert_key``, stored in the alert context.
+    A crossing is queued only if no recent EmailNotification and no waiting
+    queue row has the same key.
+    """
+    
+    CHUNK_SIZE = 1000
+    # Asset accounts; low balances on these are worth an alert (see Account.is_asset)
+    ASSET_ACCOUNT_TYPES = ('depository', 'investment')
+    # A still-low balance is alerted again after this long
+    LOW_BALANCE_REPEAT_AFTER = timedelta(days=7)
+    # Lowest budget_threshold the preferences allow; rows below it can never alert
+    MIN_BUDGET_THRESHOLD = 50
+    
+    def __init__(self):
+        self.notification_service = NotificationService()
+    
+    def check_budget_alerts(self, user: User) -> int:
+        """Queue new budget alerts for one user; returns how many were queued"""
+        return self.sweep(user_ids=[user.id], balances=False)['budget_alerts']
+    
+    def check_balance_alerts(self, user: User) -> int:
+        """Queue new low balance alerts for one user; returns how many were queued"""
+        return self.sweep(user_ids=[user.id], budgets=False)['low_balance_alerts']
+    
+    def sweep(
+        self,
+        user_ids: Optional[Iterable[int]] = None,
+        budgets: bool = True,
+        balances: bool = True,
+        chunk_size: int = CHUNK_SIZE
+    ) -> Dict[str, int]:
+        """Evaluate alerts for ``user_ids`` (default: every active user with an email); returns counts"""
+        if user_ids is None:
+            users = User.objects.filter(is_active=True).exclude(email='').order_by('id')
+            user_ids = users.values_list('id', flat=True).iterator(chunk_size=chunk_size)
+        
+        stats = {'users': 0, 'budget_alerts': 0, 'low_balance_alerts': 0, 'duplicates': 0}
+        chunk = []
+        for user_id in user_ids:
+            chunk.append(user_id)
+            if len(chunk) >= chunk_size:
+                self._sweep_chunk(chunk, budgets, balances, stats)
+                chunk = []
+        if chunk:
+            self._sweep_chunk(chunk, budgets, balances, stats)
+        return stats
+    
+    def _sweep_chunk(self, user_ids: List[int], budgets: bool, balances: bool, stats: Dict[str, int]):
+        # A store per chunk keeps the memo from growing across the whole fleet
+        preferences = PreferenceStore().prefetch(user_ids)
+        
+        crossings = []
+        if budgets:
+            crossings += self._budget_crossings(user_ids, preferences)
+        if balances:
+            crossings += self._balance_crossings(user_ids, preferences)
+        
+        stats['users'] += len(user_ids)
+        if not crossings:
+            return
+        
+        new = self._exclude_already_alerted(crossings)
+        stats['duplicates'] += len(crossings) - len(new)
+        NotificationQueue.objects.bulk_create(new, batch_size=self.CHUNK_SIZE)
+        for row in new:
+            stats['budget_alerts' if row.email_type == 'budget_alert' else 'low_balance_alerts'] += 1
+    
+    def _budget_crossings(self, user_ids: List[int], preferences: Dict[int, NotificationPreference]) -> List[NotificationQueue]:
+        from apps.finance.models import MonthlySpending
+        
+        today = timezone.now().date()
+        rows = MonthlySpending.objects.filter(
+            user_id__in=user_ids,
+            year=today.year,
+            month=today.month,
+            category__monthly_budget__gt=0,
+            amount_spent__gte=F('category__monthly_budget') * (Decimal(self.MIN_BUDGET_THRESHOLD) / 100),
+        ).values_list('user_id', 'category_id', 'category__name', 'category__monthly_budget', 'amount_spent')
+        
+        alerts = []
+        for user_id, category_id, category_name, budget_amount, spent_amount in rows:
+            preference = preferences[user_id]
+            if not (preference.email_notifications and preference.budget_alerts):
                 continue
-            except Exception as e:
-                logger.error(f"Error checking budget for category {category.name}: {str(e)}")
+            percentage = float(spent_amount / budget_amount * 100)
+            if percentage < preference.budget_threshold:
                 continue
-        
-        return alerts_sent
+            over_budget = percentage > 100
+            # Reaching the threshold and then going over budget are separate crossings
+            level = 'over' if over_budget else 'threshold'
+            alerts.append(NotificationQueue(
+                user_id=user_id,
+                email_type='budget_alert',
+                priority='high' if over_budget else 'normal',
+                subject=f"Budget Alert: {category_name} ({percentage:.1f}%)",
+                template_name='notifications/budget_alert.html',
+                context_data=json_safe_context({
+                    'alert_key': f"budget:{category_id}:{today:%Y-%m}:{level}",
+                    'category_name': category_name,
+                    'spent_amount': spent_amount,
+                    'budget_amount': budget_amount,
+                    'percentage': round(percentage, 1),
+                    'over_budget': over_budget,
+                    'remaining_amount': budget_amount - spent_amount,
+                }),
+            ))
+        return alerts
     
-    def check_balance_alerts(self, user: User) -> List[bool]:
-        """Check all user account balances and send alerts if needed"""
+    def _balance_crossings(self, user_ids: List[int], preferences: Dict[int, NotificationPreference]) -> List[NotificationQueue]:
         from apps.finance.models import Account
         
-        alerts_sent = []
-        preferences = self.notification_service.get_user_preferences(user)
-        
-        # Get user's active accounts
-        accounts = Account.objects.filter(
-            institution__user=user,
+        # The highest threshold in the chunk bounds the query
+        highest = max(preference.low_balance_threshold for preference in preferences.values())
+        rows = Account.objects.filter(
+            Q(institution__user_id__in=user_ids) | Q(user_id__in=user_ids),
             is_active=True,
-            is_asset=True  # Only check asset accounts for low balance
-        )
-        
-        for account in accounts:
-            try:
-                if account.current_balance <= preferences.low_balance_threshold:
-                    alert_sent = self.notification_service.send_low_balance_alert(
-                        user=user,
-                        account_name=account.name,
-                        current_balance=account.current_balance,
-                        threshold=preferences.low_balance_threshold
-                    )
-                    alerts_sent.append(alert_sent)
-                    
-            except Exception as e:
-                logger.error(f"Error checking balance for account {account.name}: {str(e)}")
+            type__in=self.ASSET_ACCOUNT_TYPES,
+            current_balance__lte=highest,
+        ).values_list('id', 'institution__user_id', 'user_id', 'name', 'custom_name', 'current_balance')
+        
+        alerts = []
+        for account_id, institution_user_id, owner_id, name, custom_name, balance in rows:
+            user_id = institution_user_id or owner_id
+            preference = preferences[user_id]
+            if not (preference.email_notifications and preference.low_balance_alerts):
                 continue
-        
-        return alerts_sent 
\ No newline at end of file
+            threshold = preference.low_balance_threshold
+            if balance > threshold:
+                continue
+            account_name = custom_name or name
+            alerts.append(NotificationQueue(
+                user_id=user_id,
+                email_type='low_balance',
+                priority='high',
+                subject=f"Low Balance Alert: {account_name}",
+                template_name='notifications/low_balance_alert.html',
+                context_data=json_safe_context({
+                    'alert_key': f"low_balance:{account_id}",
+                    'account_name': account_name,
+                    'current_balance': balance,
+                    'threshold': threshold,
+                    'difference': threshold - balance,
+                }),
+            ))
+        return alerts
+    
+    def _exclude_already_alerted(self, alerts: List[NotificationQueue]) -> List[NotificationQueue]:
+        """Drop alerts whose key was sent recently or is still waiting in the queue"""
+        now = timezone.now()
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        user_ids = {alert.user_id for alert in alerts}
+        
+        recent = EmailNotification.objects.filter(user_id__in=user_ids, success=True).filter(
+            Q(email_type='budget_alert', sent_at__gte=month_start) |
+            Q(email_type='low_balance', sent_at__gte=now - self.LOW_BALANCE_REPEAT_AFTER)
+        ).values_list('context_data__alert_key', flat=True)
+        waiting = NotificationQueue.objects.filter(
+            user_id__in=user_ids,
+            email_type__in=('budget_alert', 'low_balance'),
+            status__in=('pending', 'processing'),
+        ).values_list('context_data__alert_key', flat=True)
+        seen = set(recent) | set(waiting)
+        
+        new = []
+        for alert in alerts:
+            key = alert.context_data['alert_key']
+            if key not in seen:
+                seen.add(key)
+                new.append(alert)
+        return new
@@ -0,0 +1,16 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username='notifyuser', email='notify@example.com', password='testpassword')
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Preferences are cached across requests; tests must not see each other's rows
+    cache.clear()
+    yield
+    cache.clear()
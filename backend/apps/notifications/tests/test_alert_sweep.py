@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.finance.models import Account, Institution, MonthlySpending, SpendingCategory
+from apps.notifications.models import NotificationPreference, NotificationQueue
+from apps.notifications.services import BudgetMonitoringService, NotificationQueueWorker
+
+
+def _spending(user, name, budget, spent):
+    today = timezone.now().date()
+    category = SpendingCategory.objects.create(user=user, name=name, monthly_budget=Decimal(budget))
+    return MonthlySpending.objects.create(
+        user=user, category=category, year=today.year, month=today.month, amount_spent=Decimal(spent)
+    )
+
+
+@pytest.fixture
+def accounts(user):
+    institution = Institution.objects.create(user=user, name='Test Bank', item_id='item-sweep', access_token='x')
+    return [
+        Account.objects.create(institution=institution, name='Checking', type='depository', subtype='checking',
+                               current_balance=Decimal('40.00')),
+        # Liabilities never raise low balance alerts
+        Account.objects.create(institution=institution, name='Card', type='credit', subtype='credit_card',
+                               current_balance=Decimal('10.00')),
+        Account.objects.create(user=user, is_manual=True, name='Savings', type='depository', subtype='savings',
+                               current_balance=Decimal('500.00')),
+    ]
+
+
+@pytest.mark.django_db
+class TestAlertSweep:
+    def test_queues_only_crossed_thresholds(self, user, accounts):
+        _spending(user, 'Dining', '100.00', '95.00')
+        _spending(user, 'Travel', '200.00', '250.00')
+        _spending(user, 'Groceries', '400.00', '120.00')
+
+        stats = BudgetMonitoringService().sweep()
+
+        assert stats['budget_alerts'] == 2 and stats['low_balance_alerts'] == 1
+        rows = {row.subject: row for row in NotificationQueue.objects.filter(user=user)}
+        assert set(rows) == {'Budget Alert: Dining (95.0%)', 'Budget Alert: Travel (125.0%)',
+                             'Low Balance Alert: Checking'}
+        assert rows['Budget Alert: Travel (125.0%)'].priority == 'high'
+        assert rows['Low Balance Alert: Checking'].context_data['current_balance'] == '40.00'
+
+    def test_repeat_sweeps_skip_queued_and_sent_alerts(self, user, accounts):
+        spending = _spending(user, 'Dining', '100.00', '95.00')
+        service = BudgetMonitoringService()
+        service.sweep()
+
+        assert service.sweep()['duplicates'] == 2
+        NotificationQueueWorker().process_batch()
+        assert len(mail.outbox) == 2
+        # Sent alerts keep deduplicating once they have left the queue
+        assert service.sweep()['duplicates'] == 2
+
+        # Going over budget is a new crossing
+        spending.amount_spent = Decimal('130.00')
+        spending.save()
+        stats = service.sweep()
+        assert stats['budget_alerts'] == 1 and stats['duplicates'] == 1
+
+    def test_respects_preferences(self, user, accounts):
+        _spending(user, 'Dining', '100.00', '95.00')
+        NotificationPreference.objects.create(user=user, budget_threshold=98, low_balance_threshold=Decimal('20'))
+        opted_out = User.objects.create_user(username='quiet', email='quiet@example.com', password='x')
+        _spending(opted_out, 'Dining', '100.00', '150.00')
+        NotificationPreference.objects.create(user=opted_out, budget_alerts=False)
+
+        stats = BudgetMonitoringService().sweep(chunk_size=1)
+
+        assert stats['users'] == 2
+        assert not NotificationQueue.objects.exists()
+
+    def test_manual_check_and_command(self, user, accounts):
+        _spending(user, 'Dining', '100.00', '95.00')
+
+        assert BudgetMonitoringService().check_balance_alerts(user) == 1
+        call_command('sweep_alerts')
+
+        assert NotificationQueue.objects.filter(email_type='budget_alert').count() == 1
+        assert NotificationQueue.objects.filter(email_type='low_balance').count() == 1
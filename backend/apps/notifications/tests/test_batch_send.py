@@ -0,0 +1,60 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+from apps.notifications.models import EmailNotification
+from apps.notifications.services import NotificationService
+
+
+@pytest.fixture
+def users():
+    return [
+        User.objects.create_user(username=f'batch{index}', email=f'batch{index}@example.com', password='x')
+        for index in range(3)
+    ]
+
+
+def _message(user):
+    return {
+        'user': user,
+        'email_type': 'security_alert',
+        'subject': f'Hello {user.username}',
+        'template_name': 'notifications/test_notification.html',
+        'context': {'user': user, 'test_time': timezone.now(), 'preferences_url': 'http://localhost/settings'},
+    }
+
+
+@pytest.mark.django_db
+def test_send_batch_reuses_one_connection_and_compiled_template(users):
+    NotificationService._template_cache.clear()
+    with mock.patch('apps.notifications.services.get_connection', wraps=get_connection) as connections, \
+            mock.patch('apps.notifications.services.get_template', wraps=get_template) as templates:
+        errors = NotificationService().send_batch([_message(user) for user in users])
+
+    assert errors == [None, None, None]
+    assert connections.call_count == 1
+    assert templates.call_count == 1
+    assert sorted(m.to[0] for m in mail.outbox) == sorted(u.email for u in users)
+
+    logs = list(EmailNotification.objects.filter(success=True))
+    assert len(logs) == 3
+    # The User instance is not stored; the timestamp is serialised
+    assert all('user' not in log.context_data and isinstance(log.context_data['test_time'], str) for log in logs)
+
+
+@pytest.mark.django_db
+def test_send_batch_reports_per_message_errors(users):
+    users[1].email = ''
+    messages = [_message(user) for user in users]
+
+    errors = NotificationService().send_batch(messages)
+
+    assert errors[0] is None and errors[2] is None
+    assert 'No email address' in errors[1]
+    assert len(mail.outbox) == 2
+    assert EmailNotification.objects.filter(success=False).count() == 1
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.notifications.models import EmailNotification, FinancialReport, NotificationQueue
+from samaanai.instrumentation import assert_query_budget
+
+
+@pytest.fixture
+def api_client(user):
+    today = timezone.now().date()
+    for index in range(5):
+        EmailNotification.objects.create(user=user, email_type='budget_alert', recipient_email=user.email,
+                                         subject=f'Alert {index}', success=True)
+        NotificationQueue.objects.create(user=user, email_type='budget_alert', subject=f'Alert {index}',
+                                         template_name='notifications/budget_alert.html')
+        FinancialReport.objects.create(user=user, period='weekly', period_start=today - timedelta(days=7 * index),
+                                       period_end=today)
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method,path', [
+    ('get', 'preferences/'), ('get', 'history/'), ('get', 'stats/'), ('get', 'reports/'), ('get', 'queue/'),
+    ('get', 'status/'), ('post', 'budget-check/'), ('post', 'balance-check/'),
+])
+def test_endpoints_stay_within_query_budget(api_client, method, path):
+    response = getattr(api_client, method)(f'/api/notifications/{path}')
+
+    assert response.status_code == 200
+    assert_query_budget(response)
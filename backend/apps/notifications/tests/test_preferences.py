@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from apps.notifications.models import NotificationPreference
+from apps.notifications.services import NotificationService, PreferenceStore
+
+
+@pytest.mark.django_db
+class TestPreferenceStore:
+    def test_budget_alert_reads_preferences_once(self, user, django_assert_num_queries):
+        NotificationPreference.objects.create(user=user)
+        service = NotificationService()
+
+        # One preferences lookup and one queue insert
+        with django_assert_num_queries(2):
+            assert service.send_budget_alert(user, 'Dining', Decimal('95.00'), Decimal('100.00'), 95.0)
+
+        # A new request is served from the cache
+        with django_assert_num_queries(0):
+            assert NotificationService().get_user_preferences(user).budget_threshold == 90
+
+    def test_prefetch_does_not_create_rows(self, user):
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        NotificationPreference.objects.create(user=user, weekly_reports=False)
+
+        preferences = PreferenceStore().prefetch([user.id, other.id])
+
+        assert not preferences[user.id].weekly_reports
+        assert preferences[other.id].weekly_reports and preferences[other.id]._state.adding
+        assert not NotificationPreference.objects.filter(user=other).exists()
+
+    def test_updating_preferences_invalidates_the_cache(self, user, django_capture_on_commit_callbacks):
+        assert NotificationService().get_user_preferences(user).budget_threshold == 90
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post('/api/notifications/preferences/', {'budget_threshold': 75}, format='json')
+
+        assert response.status_code == 200
+        assert NotificationService().get_user_preferences(user).budget_threshold == 75
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.notifications.models import EmailNotification, NotificationQueue
+from apps.notifications.services import NotificationQueueWorker, NotificationService
+
+
+def _queue(user, **overrides):
+    fields = {
+        'user': user,
+        'email_type': 'budget_alert',
+        'subject': 'Budget Alert',
+        'template_name': 'notifications/budget_alert.html',
+        'context_data': {'category_name': 'Dining', 'percentage': 95.0, 'spent_amount': '95.00',
+                         'budget_amount': '100.00', 'remaining_amount': '5.00', 'over_budget': False},
+        **overrides,
+    }
+    return NotificationQueue.objects.create(**fields)
+
+
+@pytest.mark.django_db
+class TestNotificationQueue:
+    def test_budget_alert_is_queued_with_a_json_safe_context(self, user):
+        queued = NotificationService().send_budget_alert(
+            user, 'Dining', Decimal('95.50'), Decimal('100.00'), 95.5
+        )
+
+        assert queued
+        assert mail.outbox == []
+        row = NotificationQueue.objects.get(user=user)
+        assert row.status == 'pending' and row.priority == 'normal'
+        assert 'user' not in row.context_data
+        assert row.context_data['spent_amount'] == '95.50'
+
+    def test_worker_sends_highest_priority_first(self, user):
+        low = _queue(user, priority='low', subject='Low')
+        urgent = _queue(user, priority='urgent', subject='Urgent')
+
+        stats = NotificationQueueWorker().process_batch(limit=1)
+
+        assert stats['sent'] == 1
+        assert [m.subject for m in mail.outbox] == ['Urgent']
+        urgent.refresh_from_db()
+        low.refresh_from_db()
+        assert urgent.status == 'sent' and low.status == 'pending'
+
+    def test_failures_back_off_then_give_up(self, user):
+        row = _queue(user, template_name='notifications/missing.html', max_attempts=2)
+
+        NotificationQueueWorker().process_batch()
+        row.refresh_from_db()
+        assert row.status == 'pending' and row.attempts == 1
+        assert row.scheduled_for > timezone.now()
+
+        # Not due yet, so a second pass leaves it alone
+        assert NotificationQueueWorker().process_batch()['claimed'] == 0
+
+        NotificationQueue.objects.filter(id=row.id).update(scheduled_for=timezone.now() - timedelta(seconds=1))
+        NotificationQueueWorker().process_batch()
+        row.refresh_from_db()
+        assert row.status == 'failed' and row.attempts == 2
+        assert EmailNotification.objects.filter(user=user, success=False).count() == 2
+
+    def test_command_drains_due_rows(self, user):
+        _queue(user)
+        _queue(user, scheduled_for=timezone.now() + timedelta(hours=1))
+
+        call_command('process_notification_queue')
+
+        assert len(mail.outbox) == 1
+        assert EmailNotification.objects.filter(user=user, success=True).count() == 1
+        assert NotificationQueue.objects.filter(status='pending').count() == 1
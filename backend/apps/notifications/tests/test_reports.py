@@ -0,0 +1,79 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from apps.finance.models import Account, Institution, Transaction
+from apps.notifications.models import FinancialReport, NotificationPreference, NotificationQueue
+from apps.notifications.reports import ReportGenerator, report_period
+from apps.notifications.services import NotificationQueueWorker
+
+# Wednesday; the last complete week is 2024-03-04..10 and the last month February
+TODAY = date(2024, 3, 13)
+
+
+def _linked(user):
+    institution = Institution.objects.create(user=user, name='Bank', item_id=f'item-{user.id}', access_token='x')
+    return Account.objects.create(institution=institution, plaid_account_id=f'acct-{user.id}', name='Checking',
+                                  type='depository', subtype='checking', current_balance=Decimal('1500.00'))
+
+
+def _txn(account, txn_id, amount, day, category='FOOD_AND_DRINK'):
+    return Transaction.objects.create(account=account, plaid_transaction_id=txn_id, amount=Decimal(amount),
+                                      name=txn_id, date=day, primary_category=category)
+
+
+def test_report_period_is_the_last_complete_week_or_month():
+    assert report_period('weekly', TODAY) == (date(2024, 3, 4), date(2024, 3, 10))
+    assert report_period('monthly', TODAY) == (date(2024, 2, 1), date(2024, 2, 29))
+
+
+@pytest.mark.django_db
+class TestReportGeneration:
+    def test_builds_totals_categories_and_balances_per_user(self, user, django_assert_num_queries):
+        account = _linked(user)
+        _txn(account, 'lunch', '12.50', date(2024, 3, 5))
+        _txn(account, 'dinner', '40.00', date(2024, 3, 8))
+        _txn(account, 'rent', '900.00', date(2024, 3, 9), category='RENT')
+        _txn(account, 'salary', '-2000.00', date(2024, 3, 6), category='INCOME')
+        _txn(account, 'last-month', '99.00', date(2024, 2, 20))
+
+        generator = ReportGenerator('weekly', *report_period('weekly', TODAY))
+        with django_assert_num_queries(3):
+            report = generator.build([user.id])[user.id]
+
+        assert report['total_spending'] == '952.50'
+        assert report['total_income'] == '2000.00'
+        assert report['net_change'] == '1047.50'
+        assert report['transaction_count'] == 4
+        assert [c['category'] for c in report['top_categories']] == ['RENT', 'FOOD_AND_DRINK']
+        assert report['account_balances'] == [{'name': 'Checking', 'type': 'depository', 'balance': '1500.00'}]
+
+    def test_command_stores_reports_and_queues_each_email_once(self, user):
+        _txn(_linked(user), 'lunch', '12.50', date(2024, 2, 14))
+        quiet = User.objects.create_user(username='quiet', email='quiet@example.com', password='x')
+        _linked(quiet)
+        NotificationPreference.objects.create(user=quiet, monthly_reports=False)
+
+        call_command('generate_reports', '--period', 'both', '--date', TODAY.isoformat(), '--workers', '1')
+        call_command('generate_reports', '--period', 'monthly', '--date', TODAY.isoformat(), '--workers', '1')
+
+        assert FinancialReport.objects.filter(user=user).count() == 2
+        assert set(FinancialReport.objects.filter(user=quiet).values_list('period', flat=True)) == {'weekly'}
+        assert NotificationQueue.objects.filter(user=user).count() == 2
+        monthly = FinancialReport.objects.get(user=user, period='monthly')
+        assert monthly.data['total_spending'] == '12.50'
+
+        NotificationQueueWorker().process_batch()
+        assert len(mail.outbox) == 3
+        assert any('$12.50' in message.alternatives[0][0] for message in mail.outbox)
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get('/api/notifications/reports/', {'period': 'monthly'})
+        assert response.status_code == 200
+        assert [r['period_start'] for r in response.data] == ['2024-02-01']
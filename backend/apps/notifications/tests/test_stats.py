@@ -0,0 +1,88 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.notifications.models import EmailNotification, NotificationDailyStat
+from apps.notifications.services import NotificationService
+
+
+def _message(user, email_type='security_alert', template='notifications/test_notification.html'):
+    return {'user': user, 'email_type': email_type, 'subject': 'Hi', 'template_name': template, 'context': {'user': user}}
+
+
+@pytest.mark.django_db
+class TestNotificationStats:
+    def test_sends_are_rolled_up_per_day_and_type(self, user):
+        service = NotificationService()
+        service.send_batch([_message(user), _message(user), _message(user, template='notifications/missing.html')])
+        service.send_batch([_message(user, 'budget_alert')])
+        service.send_batch([_message(user)])
+
+        buckets = {b.email_type: b for b in NotificationDailyStat.objects.filter(user=user)}
+        assert (buckets['security_alert'].sent_count, buckets['security_alert'].failed_count) == (3, 1)
+        assert (buckets['budget_alert'].sent_count, buckets['budget_alert'].failed_count) == (1, 0)
+
+    def test_stats_are_one_aggregate_and_match_the_rollup(self, user, settings, django_assert_num_queries):
+        service = NotificationService()
+        service.send_batch([_message(user), _message(user, 'budget_alert'),
+                            _message(user, 'budget_alert', 'notifications/missing.html')])
+
+        # Aggregate, pending count and the recent rows with their users
+        with django_assert_num_queries(3):
+            stats = service.get_notification_stats(user)
+            list(stats['recent_notifications'])
+        assert stats['total_sent'] == 3
+        assert stats['budget_alerts_sent'] == 2
+        assert stats['type_counts'][0] == {'email_type': 'budget_alert', 'count': 2}
+
+        settings.NOTIFICATION_STATS_FROM_ROLLUP = True
+        rollup = service.get_notification_stats(user)
+        assert {key: rollup[key] for key in ('total_sent', 'success_rate', 'type_counts')} == \
+            {key: stats[key] for key in ('total_sent', 'success_rate', 'type_counts')}
+
+    def test_rollup_failure_does_not_fail_a_sent_batch(self, user):
+        service = NotificationService()
+        with mock.patch.object(service, 'record_daily_stats', side_effect=RuntimeError('deadlock detected')):
+            errors = service.send_batch([_message(user)])
+
+        assert errors == [None]
+        assert not NotificationDailyStat.objects.exists()
+
+    def test_rebuild_command_backfills_the_rollup(self, user):
+        EmailNotification.objects.create(user=user, email_type='weekly_report', recipient_email=user.email,
+                                         subject='Weekly', success=True)
+        call_command('rebuild_notification_stats')
+
+        bucket = NotificationDailyStat.objects.get(user=user)
+        assert (bucket.email_type, bucket.sent_count, bucket.failed_count) == ('weekly_report', 1, 0)
+
+
+@pytest.mark.django_db
+def test_history_pages_by_cursor(user):
+    now = timezone.now()
+    for index in range(5):
+        notification = EmailNotification.objects.create(
+            user=user, email_type='budget_alert', recipient_email=user.email, subject=f'Alert {index}', success=True
+        )
+        # Two rows share a timestamp so the id tie-breaker is exercised
+        EmailNotification.objects.filter(id=notification.id).update(sent_at=now - timedelta(minutes=min(index, 3)))
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    subjects, cursor = [], None
+    while True:
+        params = {'page_size': 2, **({'cursor': cursor} if cursor else {})}
+        response = client.get('/api/notifications/history/', params)
+        assert response.status_code == 200
+        subjects += [row['subject'] for row in response.data['results']]
+        cursor = response.data['next_cursor']
+        if not response.data['has_next']:
+            break
+
+    assert subjects[:3] == ['Alert 0', 'Alert 1', 'Alert 2']
+    assert sorted(subjects) == [f'Alert {index}' for index in range(5)]
+    assert client.get('/api/notifications/history/', {'cursor': 'nonsense'}).status_code == 400
@@ -0,0 +1,82 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.core import mail
+from django.utils import timezone
+
+from apps.finance.events import transactions_added
+from apps.finance.models import Account, Institution, Transaction
+from apps.finance.services import TransactionSyncService
+from apps.notifications.models import NotificationPreference, NotificationQueue
+from apps.notifications.services import NotificationQueueWorker, PreferenceStore
+
+
+@pytest.fixture
+def institution(user):
+    NotificationPreference.objects.create(user=user, new_transaction_alerts=True)
+    institution = Institution.objects.create(
+        user=user, name='Test Bank', item_id='item-digest', access_token='x', sync_cursor='cursor-1'
+    )
+    Account.objects.create(institution=institution, plaid_account_id='acct-digest', name='Checking',
+                           type='depository', subtype='checking')
+    return institution
+
+
+def _page(*ids):
+    return {
+        'added': [
+            {'transaction_id': txn_id, 'account_id': 'acct-digest', 'amount': 12.5, 'name': f'SHOP {txn_id}',
+             'merchant_name': f'Shop {txn_id}', 'date': timezone.now().date(), 'payment_channel': 'in store'}
+            for txn_id in ids
+        ],
+        'modified': [], 'removed': [], 'next_cursor': f'after-{ids[-1]}', 'has_more': False,
+    }
+
+
+@pytest.mark.django_db
+class TestTransactionDigest:
+    def test_sync_pages_fold_into_one_digest(self, user, institution):
+        with mock.patch('apps.finance.services.PlaidService') as plaid:
+            plaid.return_value.sync_transactions.side_effect = [_page('t1', 't2'), _page('t3')]
+            service = TransactionSyncService()
+            service.sync_institution_transactions(institution)
+            service.sync_institution_transactions(institution)
+
+        digest = NotificationQueue.objects.get(user=user, email_type='new_transaction')
+        assert digest.subject == '3 new transactions'
+        assert digest.scheduled_for > timezone.now()
+        assert {row['name'] for row in digest.context_data['transactions']} == {'Shop t1', 'Shop t2', 'Shop t3'}
+
+        NotificationQueue.objects.filter(id=digest.id).update(scheduled_for=timezone.now() - timedelta(seconds=1))
+        assert NotificationQueueWorker().process_batch()['sent'] == 1
+        assert 'Shop t3' in mail.outbox[0].alternatives[0][0]
+
+    def test_no_digest_without_opt_in_or_on_first_sync(self, user, institution):
+        transaction = Transaction.objects.create(
+            account=institution.accounts.get(), plaid_transaction_id='t9', amount=Decimal('5.00'),
+            name='Cafe', date=timezone.now().date(),
+        )
+        NotificationPreference.objects.filter(user=user).update(new_transaction_alerts=False)
+        transactions_added.send_robust(sender=None, institution=institution, transaction_ids=[transaction.id])
+        assert not NotificationQueue.objects.exists()
+
+        NotificationPreference.objects.filter(user=user).update(new_transaction_alerts=True)
+        PreferenceStore.invalidate(user.id)
+        institution.sync_cursor = None
+        with mock.patch('apps.finance.services.PlaidService') as plaid:
+            plaid.return_value.sync_transactions.return_value = _page('t10')
+            plaid.return_value.get_transactions.return_value = []
+            TransactionSyncService().sync_institution_transactions(institution)
+        assert not NotificationQueue.objects.exists()
+
+    def test_failing_receiver_is_logged_and_does_not_stop_the_sync(self, user, institution, caplog):
+        with mock.patch('apps.finance.services.PlaidService') as plaid, \
+                mock.patch('apps.notifications.receivers.TransactionDigestService.add_transactions',
+                           side_effect=RuntimeError('cache down')):
+            plaid.return_value.sync_transactions.return_value = _page('t11')
+            assert TransactionSyncService().sync_institution_transactions(institution)
+
+        assert Transaction.objects.filter(plaid_transaction_id='t11').exists()
+        assert 'add_to_transaction_digest failed' in caplog.text and 'cache down' in caplog.text
@@ -14,6 +14,9 @@ urlpatterns = [
     path('budget-check/', views.trigger_budget_check, name='trigger_budget_check'),
     path('balance-check/', views.trigger_balance_check, name='trigger_balance_check'),
     
+    # Weekly and monthly reports
+    path('reports/', views.FinancialReportView.as_view(), name='financial_reports'),
+    
     # Queue management
     path('queue/', views.NotificationQueueView.as_view(), name='notification_queue'),
     
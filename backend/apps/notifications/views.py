@@ -1,3 +1,8 @@
+import base64
+import binascii
+import uuid
+from datetime import datetime
+
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -6,15 +11,17 @@ from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from django.db import transaction
+from django.db.models import Q
 
-from .models import NotificationPreference, EmailNotification, NotificationQueue
+from .models import NotificationPreference, EmailNotification, NotificationQueue, FinancialReport
 from .serializers import (
     NotificationPreferenceSerializer,
     EmailNotificationSerializer,
     NotificationQueueSerializer,
-    NotificationStatsSerializer
+    NotificationStatsSerializer,
+    FinancialReportSerializer
 )
-from .services import NotificationService, BudgetMonitoringService
+from .services import NotificationService, BudgetMonitoringService, PreferenceStore
 
 
 class NotificationPreferenceView(APIView):
@@ -49,6 +56,8 @@ class NotificationPreferenceView(APIView):
             if serializer.is_valid():
                 with transaction.atomic():
                     serializer.save()
+                    user_id = request.user.id
+                    transaction.on_commit(lambda: PreferenceStore.invalidate(user_id))
                     
                     # Apply the new settings
                     self._apply_preferences(request.user, serializer.data)
@@ -81,30 +90,43 @@ class EmailNotificationHistoryView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        """Get user's email notification history"""
+        """
+        Get user's email notification history, newest first
+        
+        Pages are keyset-paginated on (sent_at, id): pass the ``next_cursor``
+        of one page as ``cursor`` to get the next. No count query is run.
+        """
         try:
             page_size = min(int(request.GET.get('page_size', 20)), 100)
-            page = int(request.GET.get('page', 1))
             email_type = request.GET.get('type')
             
-            notifications = EmailNotification.objects.filter(user=request.user)
+            notifications = EmailNotification.objects.filter(user=request.user).select_related('user')
             
             if email_type:
                 notifications = notifications.filter(email_type=email_type)
             
-            # Pagination
-            start = (page - 1) * page_size
-            end = start + page_size
-            notifications_page = notifications[start:end]
+            cursor = request.GET.get('cursor')
+            if cursor:
+                try:
+                    sent_at, last_id = _decode_history_cursor(cursor)
+                except ValueError:
+                    return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+                notifications = notifications.filter(
+                    Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, id__lt=last_id)
+                )
+            
+            # One extra row tells whether another page exists
+            rows = list(notifications.order_by('-sent_at', '-id')[:page_size + 1])
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
             
-            serializer = EmailNotificationSerializer(notifications_page, many=True)
+            serializer = EmailNotificationSerializer(rows, many=True)
             
             return Response({
                 'results': serializer.data,
-                'total': notifications.count(),
-                'page': page,
                 'page_size': page_size,
-                'has_next': notifications.count() > end
+                'has_next': has_next,
+                'next_cursor': _encode_history_cursor(rows[-1]) if has_next else None
             })
             
         except Exception as e:
@@ -114,6 +136,20 @@ class EmailNotificationHistoryView(APIView):
             )
 
 
+def _encode_history_cursor(notification) -> str:
+    raw = f"{notification.sent_at.isoformat()}|{notification.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_history_cursor(cursor: str):
+    """(sent_at, id) of the last row of the previous page; raises ValueError when malformed"""
+    try:
+        sent_at, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(sent_at), uuid.UUID(last_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+
 class NotificationStatsView(APIView):
     """API view for notification statistics"""
     permission_classes = [permissions.IsAuthenticated]
@@ -171,12 +207,12 @@ def trigger_budget_check(request):
     """Manually trigger budget alerts check"""
     try:
         monitoring_service = BudgetMonitoringService()
-        alerts_sent = monitoring_service.check_budget_alerts(request.user)
+        alerts_queued = monitoring_service.check_budget_alerts(request.user)
         
         return Response({
             'success': True,
-            'message': f'Budget check completed. {sum(alerts_sent)} alerts sent.',
-            'alerts_sent': len([alert for alert in alerts_sent if alert])
+            'message': f'Budget check completed. {alerts_queued} alerts queued.',
+            'alerts_sent': alerts_queued
         })
         
     except Exception as e:
@@ -192,12 +228,12 @@ def trigger_balance_check(request):
     """Manually trigger balance alerts check"""
     try:
         monitoring_service = BudgetMonitoringService()
-        alerts_sent = monitoring_service.check_balance_alerts(request.user)
+        alerts_queued = monitoring_service.check_balance_alerts(request.user)
         
         return Response({
             'success': True,
-            'message': f'Balance check completed. {sum(alerts_sent)} alerts sent.',
-            'alerts_sent': len([alert for alert in alerts_sent if alert])
+            'message': f'Balance check completed. {alerts_queued} alerts queued.',
+            'alerts_sent': alerts_queued
         })
         
     except Exception as e:
@@ -217,7 +253,7 @@ class NotificationQueueView(APIView):
             queue_items = NotificationQueue.objects.filter(
                 user=request.user,
                 status__in=['pending', 'processing']
-            ).order_by('priority', 'scheduled_for')
+            ).order_by(NotificationQueue.priority_rank(), 'scheduled_for')
             
             serializer = NotificationQueueSerializer(queue_items, many=True)
             return Response(serializer.data)
@@ -229,6 +265,30 @@ class NotificationQueueView(APIView):
             )
 
 
+class FinancialReportView(APIView):
+    """API view for the user's stored weekly and monthly reports"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        """Get the user's most recent reports, optionally of one period"""
+        try:
+            limit = min(int(request.GET.get('limit', 12)), 52)
+            period = request.GET.get('period')
+            
+            reports = FinancialReport.objects.filter(user=request.user)
+            if period:
+                reports = reports.filter(period=period)
+            
+            serializer = FinancialReportSerializer(reports.order_by('-period_start')[:limit], many=True)
+            return Response(serializer.data)
+            
+        except Exception as e:
+            return Response(
+                {'error': f'Failed to get reports: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def notification_settings_status(request):
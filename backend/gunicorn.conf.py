@@ -34,3 +34,23 @@ preload_app = False
 
 # Worker tmp directory - use /tmp for Cloud Run
 worker_tmp_dir = '/tmp'
+
+# Prometheus multiprocess mode: each worker writes its metrics to files here and
+# /metrics merges them. Must be set before the workers import the app. Counter
+# and histogram samples of recycled workers are folded into archive files in
+# child_exit, so the directory does not grow with every worker that ever ran.
+prometheus_multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+
+def on_starting(server):
+    # Samples left by a previous server would be merged into the new one's
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+    for name in os.listdir(prometheus_multiproc_dir):
+        os.remove(os.path.join(prometheus_multiproc_dir, name))
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    from samaanai.metrics_archive import archive_dead_worker
+    multiprocess.mark_process_dead(worker.pid)
+    archive_dead_worker(worker.pid, prometheus_multiproc_dir)
@@ -0,0 +1,163 @@
+"""
+Request Instrumentation
+
+``RequestInstrumentationMiddleware`` measures every request:
+
+- query count and database time, using ``connection.execute_wrapper``
+- DRF serializer time (``.data`` of serializers and list serializers);
+  queries run during serialization also count towards database time
+- total time
+
+The figures go out in three ways. They are sent back as a ``Server-Timing``
+header. They are logged with structured ``json_fields``. They are also added
+to the Prometheus request histograms per URL name (see ``samaanai.metrics``),
+which is where per-view latency percentiles come from.
+
+Requests that run more queries than their budget (the ``QUERY_BUDGETS``
+setting by URL name, otherwise ``QUERY_BUDGET_DEFAULT``) log a warning.
+``assert_query_budget`` enforces the same budgets in tests.
+"""
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import HTTP_REQUEST_QUERIES, HTTP_REQUEST_SECONDS, KNOWN_HTTP_METHODS
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional['RequestMetrics']] = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters for one request"""
+
+    def __init__(self):
+        self.view_name = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.total_time = 0.0
+        self._serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: runs around every query on the connection
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f'ser;dur={self.serializer_time * 1000:.1f}, '
+            f'total;dur={self.total_time * 1000:.1f}'
+        )
+
+    def as_fields(self) -> Dict:
+        return {
+            'view': self.view_name,
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'serializer_ms': round(self.serializer_time * 1000, 1),
+            'total_ms': round(self.total_time * 1000, 1),
+        }
+
+
+def current_metrics() -> Optional[RequestMetrics]:
+    """Metrics of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+def query_budget(view_name: Optional[str]) -> int:
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+def _timed_data(fget):
+    def data(self):
+        metrics = _current.get()
+        if metrics is None or metrics._serializer_depth:
+            return fget(self)
+        metrics._serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return fget(self)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics._serializer_depth -= 1
+    return data
+
+
+def _instrument_serializers():
+    """Time ``.data`` on DRF serializers; patched once, a no-op outside instrumented requests"""
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'instrumented', False):
+            timed = _timed_data(cls.data.fget)
+            timed.instrumented = True
+            cls.data = property(timed)
+
+
+class RequestInstrumentationMiddleware:
+    """Records query count and timings per request; see the module docstring"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _instrument_serializers()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            metrics.total_time = time.perf_counter() - start
+            _current.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        metrics.view_name = (match.view_name or match._func_path) if match else 'unresolved'
+        method = request.method if request.method in KNOWN_HTTP_METHODS else 'other'
+        HTTP_REQUEST_SECONDS.labels(metrics.view_name, method).observe(metrics.total_time)
+        HTTP_REQUEST_QUERIES.labels(metrics.view_name).observe(metrics.queries)
+
+        response['Server-Timing'] = metrics.server_timing()
+        # Kept on the response for assert_query_budget; the test client returns this object
+        response.request_metrics = metrics
+
+        fields = metrics.as_fields()
+        fields.update(method=request.method, path=request.path, status=response.status_code)
+        budget = query_budget(metrics.view_name)
+        if metrics.queries > budget:
+            logger.warning(
+                f"{request.method} {request.path} ran {metrics.queries} queries (budget {budget})",
+                extra={'json_fields': fields},
+            )
+        else:
+            logger.info(
+                f"{request.method} {request.path} {response.status_code} in {fields['total_ms']}ms "
+                f"({metrics.queries} queries, {fields['db_ms']}ms db)",
+                extra={'json_fields': fields},
+            )
+        return response
+
+
+def assert_query_budget(response, budget: Optional[int] = None):
+    """Fail unless the request behind ``response`` stayed within its query budget"""
+    metrics = getattr(response, 'request_metrics', None)
+    assert metrics is not None, 'RequestInstrumentationMiddleware did not run for this response'
+    budget = query_budget(metrics.view_name) if budget is None else budget
+    assert metrics.queries <= budget, (
+        f"{metrics.view_name} ran {metrics.queries} queries, over its budget of {budget}"
+    )
@@ -0,0 +1,181 @@
+"""
+Prometheus Metrics
+
+Counters and histograms for the hot paths live here, so that every part of
+the app reports into the same registry:
+
+- Plaid API calls (latency and errors per operation)
+- institution syncs (duration and outcome, rows ingested)
+- CSV and PDF imports (duration, rows, PDF extraction time and cache hits)
+- outgoing email (per type and outcome, batch duration)
+- Plaid webhooks (received, processed per outcome)
+- HTTP requests (latency and query count per view, from the instrumentation middleware)
+
+Queue depths are not tracked by the process that changes them. They are read
+from the database at scrape time (see ``QueueDepthCollector``).
+
+``metrics_view`` serves everything in the text exposition format at
+``/metrics``. Under gunicorn each worker writes its samples to files in
+``PROMETHEUS_MULTIPROC_DIR`` (set up in ``gunicorn.conf.py``). The view then
+merges the files of all workers, so a scrape sees the whole server and not
+only the worker that answered it.
+
+The endpoint is internal. It needs ``Authorization: Bearer <METRICS_TOKEN>``
+and is disabled when no token is configured, except with ``DEBUG``.
+"""
+import functools
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# Plaid
+PLAID_REQUEST_SECONDS = Histogram(
+    'plaid_request_duration_seconds', 'Latency of Plaid API calls', ['operation'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+PLAID_REQUEST_ERRORS = Counter('plaid_request_errors_total', 'Plaid API calls that raised', ['operation'])
+
+# Syncs
+SYNC_SECONDS = Histogram(
+    'sync_duration_seconds', 'Duration of institution syncs', ['kind'],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+SYNC_RUNS = Counter('sync_runs_total', 'Institution syncs by outcome', ['kind', 'outcome'])
+SYNC_ROWS = Counter('sync_rows_total', 'Rows written by institution syncs', ['kind', 'action'])
+
+# Imports
+IMPORT_SECONDS = Histogram(
+    'import_duration_seconds', 'Duration of file imports', ['source', 'kind'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+IMPORT_ROWS = Counter('import_rows_total', 'Rows handled by file imports', ['source', 'outcome'])
+PDF_EXTRACTION_SECONDS = Histogram(
+    'pdf_extraction_duration_seconds', 'Time to extract transactions from a PDF (cache misses)', ['method'],
+    buckets=(0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+PDF_EXTRACTION_CACHE = Counter('pdf_extraction_cache_total', 'PDF extraction cache lookups', ['result'])
+
+# Email
+EMAILS = Counter('emails_total', 'Emails attempted by type and outcome', ['email_type', 'outcome'])
+EMAIL_BATCH_SECONDS = Histogram(
+    'email_batch_duration_seconds', 'Time to render and send one batch of emails',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# Webhooks
+# Anything else is counted as 'other': the type comes from the request body
+KNOWN_WEBHOOK_TYPES = ('TRANSACTIONS', 'ITEM', 'HOLDINGS', 'INVESTMENTS_TRANSACTIONS', 'AUTH', 'LIABILITIES')
+WEBHOOKS_RECEIVED = Counter('plaid_webhooks_received_total', 'Plaid webhooks accepted', ['webhook_type'])
+WEBHOOK_EVENTS = Counter('plaid_webhook_events_total', 'Claimed Plaid webhook events by outcome', ['outcome'])
+
+# HTTP
+# Anything else is counted as 'other': clients can send any method name
+KNOWN_HTTP_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency per view', ['view', 'method'])
+HTTP_REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request', ['view'],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+)
+
+
+def observe_plaid(operation: str):
+    """Decorate a ``PlaidService`` method to record its latency, and its errors, under ``operation``"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                PLAID_REQUEST_ERRORS.labels(operation).inc()
+                raise
+            finally:
+                PLAID_REQUEST_SECONDS.labels(operation).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def observe_sync(kind: str):
+    """
+    Decorate a sync method to record its duration and outcome.
+
+    Sync methods report failure either by raising or by returning False;
+    both count as ``error``.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = method(*args, **kwargs)
+                if result is not False:
+                    outcome = 'success'
+                return result
+            finally:
+                SYNC_SECONDS.labels(kind).observe(time.perf_counter() - start)
+                SYNC_RUNS.labels(kind, outcome).inc()
+        return wrapper
+    return decorator
+
+
+class QueueDepthCollector:
+    """Reads the notification queue and pending and exhausted webhooks at scrape time"""
+
+    def collect(self):
+        from apps.finance.models import PlaidWebhook
+        from apps.finance.services.webhooks import WebhookProcessor
+        from apps.notifications.models import NotificationQueue
+        from django.db.models import Count
+
+        notifications = GaugeMetricFamily(
+            'notification_queue_depth', 'Queued notification emails by status', labels=['status'],
+        )
+        depths = dict(
+            NotificationQueue.objects.filter(status__in=('pending', 'processing'))
+            .values_list('status').annotate(n=Count('id')).order_by()
+        )
+        for status in ('pending', 'processing'):
+            notifications.add_metric([status], depths.get(status, 0))
+        yield notifications
+
+        # Events out of attempts stay unprocessed for inspection but are never retried
+        unprocessed = PlaidWebhook.objects.filter(processed=False)
+        yield GaugeMetricFamily(
+            'plaid_webhook_queue_depth', 'Plaid webhooks waiting to be processed',
+            value=unprocessed.filter(attempts__lt=WebhookProcessor.MAX_ATTEMPTS).count(),
+        )
+        yield GaugeMetricFamily(
+            'plaid_webhook_exhausted_events', 'Unprocessed Plaid webhooks that used up their attempts',
+            value=unprocessed.filter(attempts__gte=WebhookProcessor.MAX_ATTEMPTS).count(),
+        )
+
+
+def _authorized(request) -> bool:
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return settings.DEBUG
+    header = request.headers.get('Authorization', '')
+    return header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], token)
+
+
+def metrics_view(request):
+    """Text exposition of all metrics; see the module docstring"""
+    if not _authorized(request):
+        return HttpResponse(status=403)
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    queues = CollectorRegistry()
+    queues.register(QueueDepthCollector())
+
+    return HttpResponse(generate_latest(registry) + generate_latest(queues), content_type=CONTENT_TYPE_LATEST)
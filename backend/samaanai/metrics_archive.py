@@ -0,0 +1,46 @@
+"""
+Prometheus Files of Dead Workers
+
+In multiprocess mode each gunicorn worker writes its counters and histograms
+to its own ``<type>_<pid>.db`` file in ``PROMETHEUS_MULTIPROC_DIR``. Those
+files have to outlive the worker, or the totals would go backwards, so with
+workers recycled after ``max_requests`` the directory would gain files for
+every worker that ever ran. ``archive_dead_worker`` instead folds a dead
+worker's samples into a single ``<type>_archive.db`` per type, which
+``MultiProcessCollector`` merges like any other worker file.
+
+This runs in the gunicorn master, so it must not import Django.
+"""
+import os
+
+from prometheus_client.mmap_dict import MmapedDict
+
+# Types whose samples are summed across processes; gauges are kept per process
+SUMMED_TYPES = ('counter', 'histogram', 'summary')
+
+
+def archive_dead_worker(pid: int, path: str) -> None:
+    """Add the samples of worker ``pid`` to the archive files in ``path`` and remove its own files"""
+    for typ in SUMMED_TYPES:
+        dead = os.path.join(path, f'{typ}_{pid}.db')
+        if not os.path.exists(dead):
+            continue
+        archive = os.path.join(path, f'{typ}_archive.db')
+
+        totals = {}
+        for source in (archive, dead):
+            if os.path.exists(source):
+                for key, value, _, _ in MmapedDict.read_all_values_from_file(source):
+                    totals[key] = totals.get(key, 0.0) + value
+
+        # Build the new archive aside (not *.db, so scrapes ignore it) and swap it in whole.
+        # A scrape landing between the swap and the removal below counts the worker twice.
+        pending = os.path.join(path, f'{typ}_archive.tmp')
+        merged = MmapedDict(pending)
+        try:
+            for key, value in totals.items():
+                merged.write_value(key, value, 0.0)
+        finally:
+            merged.close()
+        os.replace(pending, archive)
+        os.remove(dead)
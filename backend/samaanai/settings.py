@@ -193,6 +193,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'samaanai.instrumentation.RequestInstrumentationMiddleware',  # First, so its total time covers the rest
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Add Whitenoise
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -206,6 +207,22 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'samaanai.urls'
 
+# Per-request query budgets by URL name (see samaanai.instrumentation); requests over budget log a warning
+QUERY_BUDGET_DEFAULT = 10
+QUERY_BUDGETS = {
+    # Still N+1 per institution or category: these hold for the three-institution
+    # fixture in the budget tests and should come down as the serializers are fixed
+    'institution-list': 12,
+    'dashboard': 24,
+    'net-worth-trend': 8,
+    'spendingcategory-list': 50,
+    'spendingcategory-tree': 30,
+    'spendingcategory-detail': 12,
+}
+
+# Bearer token for the internal /metrics endpoint (samaanai.metrics); without it the endpoint only works with DEBUG
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -323,6 +340,26 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Cache configuration
+# Use Redis when available so cached data is shared across workers; fall back to a
+# per-process LRU cache for local development and tests.
+REDIS_URL = env('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'samaanai-default',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -521,7 +558,11 @@ PLAID_WEBHOOK_URL = os.environ.get('PLAID_WEBHOOK_URL')
 # --- Gemini API Configuration (for PDF transaction extraction) ---
 GEMINI_API_KEY = env('GEMINI_API_KEY', default='')
 if not GEMINI_API_KEY:
-    logger.warning("GEMINI_API_KEY not set. PDF transaction import will not work.")
+    logger.warning("GEMINI_API_KEY not set. PDF import will only handle statements with parseable tables.")
+
+# Extraction results are cached by file content hash so re-uploads skip pdfplumber and Gemini
+PDF_EXTRACTION_CACHE_ALIAS = env('PDF_EXTRACTION_CACHE_ALIAS', default='default')
+PDF_EXTRACTION_CACHE_TTL = env.int('PDF_EXTRACTION_CACHE_TTL', default=7 * 24 * 60 * 60)  # 7 days
 
 # --- Email Configuration (SendGrid) ---
 SENDGRID_API_KEY = env('SENDGRID_API_KEY', default='')
@@ -545,6 +586,13 @@ EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='apikey')  # For SendGrid, this
 EMAIL_HOST_PASSWORD = SENDGRID_API_KEY  # Use SendGrid API key as password
 
 # --- Notification Settings ---
+# Serve notification stats from the per-user daily rollup instead of counting the email log
+# (run `rebuild_notification_stats` once before enabling on an existing database)
+NOTIFICATION_STATS_FROM_ROLLUP = env.bool('NOTIFICATION_STATS_FROM_ROLLUP', default=False)
+
+# New transactions synced within this many seconds are sent as one digest email
+NEW_TRANSACTION_DIGEST_WINDOW = env.int('NEW_TRANSACTION_DIGEST_WINDOW', default=15 * 60)
+
 # Template directories
 TEMPLATES[0]['DIRS'] = [
     BASE_DIR / 'templates',  # Add templates directory
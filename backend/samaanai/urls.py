@@ -15,6 +15,7 @@ from apps.users.views import social_auth_token
 print("URLS: Imported users views", file=sys.stderr, flush=True)
 
 from .health import health_check, ping
+from .metrics import metrics_view
 print("URLS: Imported health views", file=sys.stderr, flush=True)
 
 from django.conf import settings
@@ -32,6 +33,7 @@ urlpatterns = [
     path('api/auth/social/token/', social_auth_token, name='social_token'),
     path('health/', health_check, name='health_check'),
     path('ping/', ping, name='ping'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
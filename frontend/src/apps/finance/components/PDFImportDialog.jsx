@@ -120,8 +120,11 @@ const PDFImportDialog = ({ open, onClose, onSuccess, accounts = [] }) => {
         try {
             const result = await confirmPDFImport(importId, transactions);
 
+            const skipped = result.duplicates_skipped
+                ? ` (${result.duplicates_skipped} duplicates skipped)`
+                : '';
             enqueueSnackbar(
-                `Successfully imported ${result.transactions_created} transactions!`,
+                `Successfully imported ${result.transactions_created} transactions!${skipped}`,
                 { variant: 'success' }
             );
 